@@ -0,0 +1,51 @@
+"""
+Lean settings for processes that only serve the API:
+
+    DJANGO_SETTINGS_MODULE=Littlelemon.api_settings gunicorn Littlelemon.wsgi
+
+The admin, sessions, messages and static files apps are left out, together
+with their middleware, and the API answers JSON with token authentication
+only. The admin, the browsable API and session logins stay on processes
+running the default settings. Startup loads fewer modules and every request
+runs through fewer middleware; benchmarks/startup.py measures both profiles.
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+    'rest_framework.authtoken',
+    'djoser',
+    'LittlelemonAPI',
+]
+
+MIDDLEWARE = [
+    'Littlelemon.middleware.MemoryHighWaterMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'Littlelemon.api_urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [],
+        },
+    },
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,  # noqa: F405
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.TokenAuthentication',
+    ],
+}
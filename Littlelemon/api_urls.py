@@ -0,0 +1,14 @@
+"""
+URL configuration of Littlelemon.api_settings: the routes of Littlelemon.urls
+without the admin site.
+"""
+from django.urls import path, include
+from LittlelemonAPI import images
+
+urlpatterns = [
+    path('api/', include('djoser.urls')),
+    path('api/', include('djoser.urls.authtoken')),
+    path('api/', include('LittlelemonAPI.urls')),
+    # menu image variants: content-hashed, so cached by clients for good
+    path(f'media/{images.VARIANT_DIR}/<str:name>', images.serve_variant),
+]
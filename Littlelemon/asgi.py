@@ -10,7 +10,13 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Littlelemon.settings')
 
 application = get_asgi_application()
+
+# Load the URLconf, and the views with it, now instead of on the first
+# request. A server that preloads the application shares them between its
+# workers.
+get_resolver().url_patterns
@@ -0,0 +1,76 @@
+"""
+Project middleware.
+
+The session, authentication and message middleware skip requests whose path
+starts with one of settings.SESSIONLESS_PATH_PREFIXES. The API authenticates
+with tokens, so it never needs a session row, a user loaded from one or a
+message store. The admin keeps all three.
+
+CompressionMiddleware gzips only the content types in
+settings.GZIP_CONTENT_TYPES, and only bodies of at least
+settings.GZIP_MIN_LENGTH bytes. Images are already compressed, and a
+short body is not worth compressing.
+
+MemoryHighWaterMiddleware, when settings.REQUEST_MEMORY_METRICS is on, traces
+Python allocations and sends the peak memory a request allocated on top of
+what was in use when it started, in X-Memory-Peak-KB. Tracing slows every
+request down, and in a threaded server the peak includes the requests that
+ran at the same time, so turn it on to find heavy endpoints rather than
+leaving it on.
+"""
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+
+
+def sessionless(request):
+    return request.path_info.startswith(tuple(settings.SESSIONLESS_PATH_PREFIXES))
+
+
+class SessionMiddleware(sessions_middleware.SessionMiddleware):
+    def process_request(self, request):
+        if not sessionless(request):
+            super().process_request(request)
+
+
+class AuthenticationMiddleware(auth_middleware.AuthenticationMiddleware):
+    def process_request(self, request):
+        if hasattr(request, 'session'):
+            super().process_request(request)
+
+
+class MessageMiddleware(messages_middleware.MessageMiddleware):
+    def process_request(self, request):
+        if hasattr(request, 'session'):
+            super().process_request(request)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in settings.GZIP_CONTENT_TYPES:
+            return response
+        if not response.streaming and len(response.content) < settings.GZIP_MIN_LENGTH:
+            return response
+        return super().process_response(request, response)
+
+
+class MemoryHighWaterMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_MEMORY_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        response = self.get_response(request)
+        response['X-Memory-Peak-KB'] = str((tracemalloc.get_traced_memory()[1] - baseline) // 1024)
+        return response
@@ -0,0 +1,106 @@
+"""
+Production settings, configured from the environment:
+
+    DJANGO_SETTINGS_MODULE=Littlelemon.production_settings
+    DJANGO_SECRET_KEY=...                     required
+    DJANGO_ALLOWED_HOSTS=api.example.com,...  comma-separated
+    DJANGO_DB_NAME=/srv/littlelemon/db.sqlite3
+    DJANGO_CONN_MAX_AGE=60                    seconds to keep a database connection open
+    DJANGO_STATIC_ROOT=/srv/littlelemon/static
+    DJANGO_GZIP_MIN_LENGTH=1024               smallest body worth compressing, in bytes
+    DJANGO_REDIS_URL=redis://127.0.0.1:6379/0 shared cache (default: the django_cache table)
+    DJANGO_DEBUG=0
+
+DEBUG is off, so connections do not keep a log of every query. Responses of
+the types in GZIP_CONTENT_TYPES are gzipped when they are large enough, and
+ConditionalGetMiddleware answers a matching If-None-Match with 304. Templates
+of the admin and the browsable API are compiled once per process. Requests
+under SESSIONLESS_PATH_PREFIXES skip the session, authentication and message
+middleware; see Littlelemon/middleware.py. benchmarks/production.py compares
+memory and throughput with the default settings.
+
+The cache is shared by all workers: throttle history, menu facets and group
+member pages must be seen, and invalidated, by every process. It lives in
+Redis when DJANGO_REDIS_URL is set (which needs the redis package), or else
+in a database table created with `python manage.py createcachetable`.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+
+try:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured('Set DJANGO_SECRET_KEY to run with the production settings.')
+
+DEBUG = os.environ.get('DJANGO_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],  # noqa: F405
+        'NAME': os.environ.get('DJANGO_DB_NAME', DATABASES['default']['NAME']),  # noqa: F405
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 60)),
+    }
+}
+
+if os.environ.get('DJANGO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['DJANGO_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
+STATIC_ROOT = os.environ.get('DJANGO_STATIC_ROOT', BASE_DIR / 'static')  # noqa: F405
+
+MIDDLEWARE = [
+    'Littlelemon.middleware.MemoryHighWaterMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    # above ConditionalGetMiddleware, so ETags are computed on the uncompressed body
+    'Littlelemon.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
+    'Littlelemon.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'Littlelemon.middleware.AuthenticationMiddleware',
+    'Littlelemon.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+SESSIONLESS_PATH_PREFIXES = ('/api/', '/media/')
+
+GZIP_CONTENT_TYPES = {
+    'application/json', 'text/html', 'text/plain', 'text/css', 'text/javascript', 'image/svg+xml',
+}
+
+GZIP_MIN_LENGTH = int(os.environ.get('DJANGO_GZIP_MIN_LENGTH', 1024))
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],  # noqa: F405
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **TEMPLATES[0]['OPTIONS'],  # noqa: F405
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+SESSION_COOKIE_SECURE = True
+CSRF_COOKIE_SECURE = True
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Littlelemon.middleware.MemoryHighWaterMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -121,6 +122,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -142,4 +146,45 @@ REST_FRAMEWORK = {
         'anon': '4/minute',
         'user': '10/minute',
     }
-}
\ No newline at end of file
+}
+
+# Seats available in every booking time slot while no BookingSlot rows are configured
+BOOKING_DEFAULT_SLOT_CAPACITY = 40
+
+# Longest time (seconds) a worker may serve a menu snapshot after another worker changed the menu
+CATALOG_MAX_STALENESS = 2
+
+# How long (seconds) menu facet counts are cached for a filter set; a menu change starts a new cache key
+MENU_FACETS_CACHE_SECONDS = 300
+
+# How long (seconds) a page of group members is cached; a membership change starts a new cache key
+GROUP_MEMBERS_CACHE_SECONDS = 300
+
+# Age (seconds) a change log entry must reach before /api/changes returns it, so entries from
+# transactions that commit out of id order are not skipped by a client's cursor. Entries of a transaction
+# that takes longer than this to commit can still be skipped; see LittlelemonAPI/changes.py
+CHANGES_SETTLE_SECONDS = 1
+
+# Resized copies made of each menu image: variant name -> width in pixels
+MENU_IMAGE_VARIANTS = {'thumb': 160, 'medium': 640}
+
+# Background threads per process that generate menu image variants (0 generates them inline on commit)
+MENU_IMAGE_WORKERS = 2
+
+# Admin changelists of tables with more rows than this show an estimated total instead of counting the table
+ADMIN_EXACT_COUNT_LIMIT = 100000
+
+# Most rows a list endpoint without pagination returns
+MAX_LIST_ROWS = 1000
+
+# Rows fetched per query by batch jobs (see LittlelemonAPI/batches.py)
+BATCH_CHUNK_SIZE = 2000
+
+# Send the peak memory of each request in X-Memory-Peak-KB (see Littlelemon/middleware.py)
+REQUEST_MEMORY_METRICS = False
+
+# How long (seconds) the response to a POST with an Idempotency-Key is kept for replay (see LittlelemonAPI/idempotency.py)
+IDEMPOTENCY_KEY_TTL = 86400
+
+# Age (seconds) after which the claim of a request that never finished may be taken over by a retry
+IDEMPOTENCY_LOCK_TIMEOUT = 60
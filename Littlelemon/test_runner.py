@@ -0,0 +1,64 @@
+"""
+Test runner that times each test, for `run_tests.py --bench`:
+
+    python manage.py test --testrunner=Littlelemon.test_runner.BenchTestRunner [--bench-top N]
+
+After the run it prints the slowest tests and the time spent per test
+class. The tests run in one process, since timings that come back from
+parallel workers are not meaningful.
+"""
+import time
+import unittest
+from collections import defaultdict
+
+from django.test.runner import DiscoverRunner
+
+
+class TimedTestResult(unittest.TextTestResult):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timings = []
+        self._started = None
+
+    def startTest(self, test):
+        self._started = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        self.timings.append((time.perf_counter() - self._started, test.id()))
+
+
+class BenchTestRunner(DiscoverRunner):
+    def __init__(self, bench_top=20, **kwargs):
+        kwargs['parallel'] = 1
+        super().__init__(**kwargs)
+        self.bench_top = bench_top
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--bench-top', type=int, default=20,
+                            help='Number of slowest tests to list (default 20).')
+
+    def get_resultclass(self):
+        return super().get_resultclass() or TimedTestResult
+
+    def run_suite(self, suite, **kwargs):
+        result = super().run_suite(suite, **kwargs)
+        self.report(getattr(result, 'timings', []))
+        return result
+
+    def report(self, timings):
+        if not timings:
+            return
+        by_class = defaultdict(float)
+        for seconds, test_id in timings:
+            by_class[test_id.rsplit('.', 1)[0]] += seconds
+        print(f'\nSlowest {min(self.bench_top, len(timings))} tests:')
+        for seconds, test_id in sorted(timings, reverse=True)[:self.bench_top]:
+            print(f'{seconds * 1000:10.1f} ms  {test_id}')
+        print('\nTime per test class:')
+        for test_class, seconds in sorted(by_class.items(), key=lambda item: -item[1]):
+            print(f'{seconds * 1000:10.1f} ms  {test_class}')
+        print(f'\n{sum(seconds for seconds, _ in timings):.2f} s in {len(timings)} tests')
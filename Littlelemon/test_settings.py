@@ -0,0 +1,22 @@
+"""
+Fast settings for the test suite, used by run_tests.py:
+
+    python manage.py test --settings=Littlelemon.test_settings [--parallel]
+
+The database lives in memory and passwords are hashed with MD5 instead of
+PBKDF2, which takes most of the time of creating a test user. Never use
+these settings outside tests.
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# make image variants inline on commit instead of on a thread pool
+MENU_IMAGE_WORKERS = 0
@@ -15,10 +15,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from LittlelemonAPI import images
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('djoser.urls')), 
     path('api/', include('djoser.urls.authtoken')), 
     path('api/', include('LittlelemonAPI.urls')),
+    # menu image variants: content-hashed, so cached by clients for good
+    path(f'media/{images.VARIANT_DIR}/<str:name>', images.serve_variant),
 ]
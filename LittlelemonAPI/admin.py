@@ -1,5 +1,91 @@
-from django.contrib import admin
-from .models import Category, MenuItem, Cart, OrderItem, Order, Booking
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+from . import assignment, groups
+from .models import Category, MenuItem, Cart, OrderItem, Order, Booking, DailySales, MenuItemSales, CrewDeliveryStats, BookingSlot, SlotOccupancy
+
+# row count estimates from the planner statistics, by database vendor, and whether the query takes the
+# quoted table name (regclass folds an unquoted name to lower case) or the bare one
+ESTIMATE_SQL = {
+    'postgresql': ('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', True),
+    'mysql': ('SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+              False),
+}
+
+
+def estimated_count(model, using='default'):
+    """A cheap row count estimate for the model's table: planner statistics, or the highest id."""
+    connection = connections[using]
+    sql, quoted = ESTIMATE_SQL.get(connection.vendor, (None, False))
+    if sql:
+        table = connection.ops.quote_name(model._meta.db_table) if quoted else model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        # PostgreSQL reports -1 for a table that was never analyzed
+        if row and row[0] is not None and row[0] >= 0:
+            return int(row[0])
+    # ids are never reused, so the highest id bounds the row count from above
+    return model._default_manager.using(using).aggregate(top=Max('pk'))['top'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts an unfiltered changelist from estimated_count() once the table has
+    more than settings.ADMIN_EXACT_COUNT_LIMIT rows, instead of scanning it.
+    Filtered and searched changelists are counted exactly.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+def username_filter(field):
+    """
+    A changelist filter on `field`'s username, entered in a text box, for
+    user foreign keys that would list every user as a filter choice.
+    """
+    class UsernameFilter(admin.SimpleListFilter):
+        template = 'admin/LittlelemonAPI/username_filter.html'
+        title = field.replace('_', ' ')
+        parameter_name = f'{field}__username'
+
+        def lookups(self, request, model_admin):
+            return ()
+
+        def has_output(self):
+            return True
+
+        def queryset(self, request, queryset):
+            if self.value():
+                return queryset.filter(**{self.parameter_name: self.value()})
+
+        def choices(self, changelist):
+            yield {
+                'parameter_name': self.parameter_name,
+                'value': self.value() or '',
+                'reset_url': changelist.get_query_string(remove=[self.parameter_name]),
+                'hidden': [(name, value) for name, value in changelist.params.items() if name != self.parameter_name],
+            }
+
+    return UsernameFilter
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow without bound: no full counts and no facet counts."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
 
 # Register your models here.
 
@@ -12,30 +98,95 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(MenuItem)
 class MenuItemAdmin(admin.ModelAdmin):
     list_display = ['name', 'price', 'category', 'featured']
+    list_select_related = ['category']
     list_filter = ['category', 'featured']
     search_fields = ['name', 'description']
     list_editable = ['price', 'featured']
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     list_display = ['user', 'menuitem', 'quantity', 'unit_price', 'price']
-    list_filter = ['user']
+    list_select_related = ['user', 'menuitem']
+    list_filter = [username_filter('user')]
+    autocomplete_fields = ['user', 'menuitem']
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(LargeTableAdmin):
     list_display = ['user', 'menuitem', 'quantity', 'unit_price', 'price']
-    list_filter = ['user']
+    list_select_related = ['user', 'menuitem']
+    list_filter = [username_filter('user')]
+    autocomplete_fields = ['user', 'menuitem']
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ['user', 'status', 'total', 'date', 'delivery_crew']
-    list_filter = ['status', 'date', 'delivery_crew']
+    list_select_related = ['user', 'delivery_crew']
+    list_filter = ['status', 'date', username_filter('delivery_crew')]
     search_fields = ['user__username']
+    autocomplete_fields = ['user', 'delivery_crew']
+    raw_id_fields = ['orderitem']
+    actions = ['mark_delivered', 'mark_out_for_delivery', 'unassign_crew']
+
+    def _update(self, request, queryset, **values):
+        updated, _ = assignment.update_orders(queryset.values_list('pk', flat=True), **values)
+        self.message_user(request, f'{len(updated)} orders updated.', messages.SUCCESS)
+
+    @admin.action(description='Mark selected orders as delivered')
+    def mark_delivered(self, request, queryset):
+        self._update(request, queryset, status=True)
+
+    @admin.action(description='Mark selected orders as out for delivery')
+    def mark_out_for_delivery(self, request, queryset):
+        self._update(request, queryset, status=False)
+
+    @admin.action(description='Unassign the delivery crew of selected orders')
+    def unassign_crew(self, request, queryset):
+        self._update(request, queryset, delivery_crew=None)
+
+    def get_actions(self, request):
+        # one "assign to" action per delivery crew member, so no intermediate page is needed
+        actions = super().get_actions(request)
+        crew = User.objects.filter(groups__name=groups.DELIVERY_CREW).order_by('username')
+        for member in crew:
+            name = f'assign_crew_{member.pk}'
+            action = lambda modeladmin, request, queryset, member=member: modeladmin._update(
+                request, queryset, delivery_crew=member)
+            actions[name] = (action, name, f'Assign selected orders to {member.username}')
+        return actions
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(LargeTableAdmin):
     list_display = ['customer_name', 'email', 'phone', 'date', 'time', 'number_of_guests']
     list_filter = ['date', 'number_of_guests']
     search_fields = ['customer_name', 'email', 'phone']
     date_hierarchy = 'date'
     ordering = ['date', 'time']
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ['date', 'category', 'orders', 'items_sold', 'revenue']
+    list_select_related = ['category']
+    list_filter = ['category']
+    date_hierarchy = 'date'
+
+@admin.register(MenuItemSales)
+class MenuItemSalesAdmin(admin.ModelAdmin):
+    list_display = ['date', 'menuitem', 'quantity', 'revenue']
+    list_select_related = ['menuitem']
+    date_hierarchy = 'date'
+
+@admin.register(CrewDeliveryStats)
+class CrewDeliveryStatsAdmin(admin.ModelAdmin):
+    list_display = ['date', 'delivery_crew', 'assigned', 'delivered']
+    list_select_related = ['delivery_crew']
+    date_hierarchy = 'date'
+
+@admin.register(BookingSlot)
+class BookingSlotAdmin(admin.ModelAdmin):
+    list_display = ['time', 'capacity']
+    list_editable = ['capacity']
+
+@admin.register(SlotOccupancy)
+class SlotOccupancyAdmin(admin.ModelAdmin):
+    list_display = ['date', 'time', 'seats_booked']
+    date_hierarchy = 'date'
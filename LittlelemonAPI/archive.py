@@ -0,0 +1,111 @@
+"""
+Archive tier for orders and bookings.
+
+Completed orders older than a cutoff and past bookings are moved from the
+live tables to ArchivedOrder and ArchivedBooking by the `archive` management
+command. The live tables and their indexes then only hold current work. Each
+batch is copied and deleted in its own short transaction, so archival runs
+next to live traffic without holding long locks. Deleting an order or a
+booking through the API moves it to the archive with deleted=True instead of
+dropping it.
+
+Moving an order also deletes its order item, whose fields the archived row
+carries, so neither live table keeps growing.
+
+The list endpoints read only the live tables unless asked for
+?include_archived=true. They then read a UNION of both tiers that is
+ordered and sliced in SQL. Deleted rows are never listed. Those pages are
+flat rows in one shape for both tiers, not serializer output, so `fields`
+and `expand` do not apply to them.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import BooleanField, F, Value
+
+from . import models
+
+ORDER_FIELDS = ('id', 'user', 'delivery_crew', 'status', 'total', 'date')
+ORDER_ITEM_FIELDS = ('menuitem', 'quantity', 'unit_price', 'price')
+BOOKING_FIELDS = ('id', 'customer_name', 'email', 'phone', 'date', 'time', 'number_of_guests',
+                  'created_at', 'updated_at')
+
+
+def _move_orders(ids, deleted=False):
+    rows = list(models.Order.objects.filter(pk__in=ids).values(
+        'id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date', 'orderitem_id',
+        'orderitem__menuitem_id', 'orderitem__quantity', 'orderitem__unit_price', 'orderitem__price'))
+    models.ArchivedOrder.objects.bulk_create([
+        models.ArchivedOrder(
+            id=row['id'], user_id=row['user_id'], delivery_crew_id=row['delivery_crew_id'],
+            status=row['status'], total=row['total'], date=row['date'],
+            menuitem_id=row['orderitem__menuitem_id'], quantity=row['orderitem__quantity'],
+            unit_price=row['orderitem__unit_price'], price=row['orderitem__price'], deleted=deleted,
+        ) for row in rows
+    ])
+    models.Order.objects.filter(pk__in=ids).delete()
+    # the archived rows carry the order item's fields; drop the items no live order still points to
+    item_ids = {row['orderitem_id'] for row in rows if row['orderitem_id'] is not None}
+    models.OrderItem.objects.filter(pk__in=item_ids, order__isnull=True).delete()
+
+
+def _move_bookings(ids, deleted=False):
+    rows = models.Booking.objects.filter(pk__in=ids).values(*BOOKING_FIELDS)
+    models.ArchivedBooking.objects.bulk_create(
+        [models.ArchivedBooking(**row, deleted=deleted) for row in rows])
+    models.Booking.objects.filter(pk__in=ids).delete()
+
+
+def _in_batches(queryset, move, batch_size, pause):
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return
+            move(ids)
+        yield len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def archive_orders(before, batch_size=500, pause=0.0):
+    """Move completed orders dated before `before`, yielding the size of each batch."""
+    return _in_batches(models.Order.objects.filter(status=True, date__lt=before), _move_orders, batch_size, pause)
+
+
+def archive_bookings(before, batch_size=500, pause=0.0):
+    """Move bookings dated before `before`, yielding the size of each batch."""
+    return _in_batches(models.Booking.objects.filter(date__lt=before), _move_bookings, batch_size, pause)
+
+
+def delete_order(order):
+    """Soft-delete an order: move it to the archive as deleted. Call inside a transaction."""
+    _move_orders([order.pk], deleted=True)
+
+
+def delete_booking(booking):
+    """Soft-delete a booking: move it to the archive as deleted. Call inside a transaction."""
+    _move_bookings([booking.pk], deleted=True)
+
+
+def order_rows(live, archived):
+    """
+    The orders of both tiers as one UNION ALL of dicts with ORDER_FIELDS,
+    the order item fields and `archived`. Filter each side first, then
+    order and slice the result.
+    """
+    live = live.order_by().values(
+        *ORDER_FIELDS, menuitem=F('orderitem__menuitem'), quantity=F('orderitem__quantity'),
+        unit_price=F('orderitem__unit_price'), price=F('orderitem__price'),
+        archived=Value(False, output_field=BooleanField()))
+    archived = archived.filter(deleted=False).order_by().values(
+        *ORDER_FIELDS, *ORDER_ITEM_FIELDS, archived=Value(True, output_field=BooleanField()))
+    return live.union(archived, all=True)
+
+
+def booking_rows(live, archived):
+    """Bookings of both tiers as one UNION ALL of dicts, like order_rows()."""
+    live = live.order_by().values(*BOOKING_FIELDS, archived=Value(False, output_field=BooleanField()))
+    archived = archived.filter(deleted=False).order_by().values(
+        *BOOKING_FIELDS, archived=Value(True, output_field=BooleanField()))
+    return live.union(archived, all=True)
@@ -0,0 +1,50 @@
+"""
+Bulk crew assignment and status changes for orders.
+
+update_orders() applies one delivery crew and/or status to many orders
+with a single UPDATE ... WHERE id IN (...). The crew's group membership is
+checked once for the whole batch. The rollups and the change log are then
+brought up to date in batch, one write per crew and day and one per user
+rather than one per order. Every order's row version is bumped, so ETags
+handed out before the change no longer match. Unlike a save through the
+API, the UPDATE leaves Order.date alone.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from . import changes, groups, models, rollups
+
+
+class InvalidCrew(ValueError):
+    pass
+
+
+def update_orders(order_ids, where=None, **values):
+    """
+    Set `delivery_crew` (a user or None) and/or `status` on the orders in
+    `order_ids` that also match the lookups in `where`. Returns the ids that
+    were updated and the ids that were not. Raises InvalidCrew if the user
+    is not in the delivery crew group.
+    """
+    fields = {}
+    if 'delivery_crew' in values:
+        crew = values['delivery_crew']
+        if crew is not None and not groups.in_group(crew, groups.DELIVERY_CREW):
+            raise InvalidCrew(f'{crew.username} is not a delivery crew member.')
+        fields['delivery_crew_id'] = None if crew is None else crew.pk
+    if 'status' in values:
+        fields['status'] = bool(values['status'])
+    order_ids = set(order_ids)
+    with transaction.atomic():
+        rows = list(models.Order.objects.select_for_update().filter(pk__in=order_ids, **(where or {}))
+                    .values_list('id', 'user_id', 'date', 'total', 'delivery_crew_id', 'status'))
+        updated = sorted(row[0] for row in rows)
+        if updated and fields:
+            models.Order.objects.filter(pk__in=updated).update(**fields, version=F('version') + 1)
+            rollups.record_orders_update([
+                (user_id, (day, total, crew_id, status),
+                 (day, total, fields.get('delivery_crew_id', crew_id), fields.get('status', status)))
+                for _, user_id, day, total, crew_id, status in rows
+            ])
+            changes.record_many(changes.KIND_BY_MODEL[models.Order], updated)
+    return updated, sorted(order_ids.difference(updated))
@@ -0,0 +1,32 @@
+"""
+Memory-bounded iteration for batch jobs.
+
+Commands that walk a whole table read it with iterate(), which fetches
+settings.BATCH_CHUNK_SIZE rows at a time instead of loading the queryset.
+On PostgreSQL the rows come from a server-side cursor; SQLite and MySQL
+fetch them in chunks from one cursor. SQLite does not isolate that cursor
+from writes on the same connection, so a job that changes the rows it reads
+uses pk_batches(), which reads each batch with its own keyset query.
+"""
+from django.conf import settings
+
+
+def iterate(queryset, chunk_size=None):
+    """The rows of `queryset`, fetched `chunk_size` at a time."""
+    return queryset.iterator(chunk_size=chunk_size or settings.BATCH_CHUNK_SIZE)
+
+
+def pk_batches(queryset, chunk_size=None):
+    """
+    Lists of up to `chunk_size` model instances of `queryset` in primary key
+    order, one query per list. The rows may be changed between lists.
+    """
+    chunk_size = chunk_size or settings.BATCH_CHUNK_SIZE
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        rows = list((queryset if last is None else queryset.filter(pk__gt=last))[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1].pk
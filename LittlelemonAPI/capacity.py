@@ -0,0 +1,116 @@
+"""
+Booking slot capacity.
+
+SlotOccupancy holds the number of seats booked per (date, time). Seats are
+taken with a single conditional UPDATE that only matches while the slot still
+has room, so two concurrent bookings can never both get the last seats.
+
+Once any BookingSlot is configured, the configured times are the only ones
+that can be booked. Without any, every time can be booked up to
+settings.BOOKING_DEFAULT_SLOT_CAPACITY seats.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import models
+
+
+class SlotUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Not enough seats left in this time slot.'
+    default_code = 'slot_unavailable'
+
+
+def slot_capacity(time):
+    """The seats of the slot at `time`, or None if it cannot be booked."""
+    capacity = models.BookingSlot.objects.filter(time=time).values_list('capacity', flat=True).first()
+    if capacity is None and not models.BookingSlot.objects.exists():
+        return settings.BOOKING_DEFAULT_SLOT_CAPACITY
+    return capacity
+
+
+def reserve(date, time, guests):
+    """Take `guests` seats in the slot or raise SlotUnavailable."""
+    if guests <= 0:
+        return
+    capacity = slot_capacity(time)
+    if capacity is None:
+        raise SlotUnavailable('No booking slot is configured at this time.')
+    if guests > capacity:
+        raise SlotUnavailable()
+    slot = models.SlotOccupancy.objects.filter(date=date, time=time)
+    if slot.filter(seats_booked__lte=capacity - guests).update(seats_booked=F('seats_booked') + guests):
+        return
+    if not slot.exists():
+        try:
+            with transaction.atomic():
+                models.SlotOccupancy.objects.create(date=date, time=time, seats_booked=guests)
+            return
+        except IntegrityError:
+            # A concurrent booking created the row first; compete for seats on it.
+            if slot.filter(seats_booked__lte=capacity - guests).update(seats_booked=F('seats_booked') + guests):
+                return
+    raise SlotUnavailable()
+
+
+def release(date, time, guests):
+    """Give back `guests` seats in the slot."""
+    if guests > 0:
+        models.SlotOccupancy.objects.filter(date=date, time=time).update(seats_booked=F('seats_booked') - guests)
+
+
+def move(old, new):
+    """
+    Move a booking from `old` to `new`, both (date, time, guests) tuples.
+    Call inside a transaction so a failed reservation also undoes the release.
+    """
+    old_date, old_time, old_guests = old
+    new_date, new_time, new_guests = new
+    if (old_date, old_time) == (new_date, new_time):
+        if new_guests > old_guests:
+            reserve(new_date, new_time, new_guests - old_guests)
+        else:
+            release(new_date, new_time, old_guests - new_guests)
+        return
+    release(old_date, old_time, old_guests)
+    reserve(new_date, new_time, new_guests)
+
+
+def availability(date, guests):
+    """
+    Slots on `date` with room for `guests`, as dicts with the time, capacity
+    and seats left: the configured slots, or without any, the times already
+    booked on `date` (every other time then has all its seats left).
+    """
+    if not models.BookingSlot.objects.exists():
+        default = settings.BOOKING_DEFAULT_SLOT_CAPACITY
+        slots = (models.SlotOccupancy.objects.filter(date=date)
+                 .annotate(capacity=Value(default), seats_left=default - F('seats_booked'))
+                 .filter(seats_left__gte=guests)
+                 .order_by('time'))
+        return list(slots.values('time', 'capacity', 'seats_left'))
+    booked = (models.SlotOccupancy.objects
+              .filter(date=date, time=OuterRef('time'))
+              .values('seats_booked')[:1])
+    slots = (models.BookingSlot.objects
+             .annotate(booked=Coalesce(Subquery(booked, output_field=IntegerField()), Value(0)))
+             .annotate(seats_left=F('capacity') - F('booked'))
+             .filter(seats_left__gte=guests)
+             .order_by('time'))
+    return list(slots.values('time', 'capacity', 'seats_left'))
+
+
+def rebuild():
+    """Recompute the occupancy table from the bookings."""
+    with transaction.atomic():
+        models.SlotOccupancy.objects.all().delete()
+        totals = (models.Booking.objects.order_by()
+                  .values('date', 'time').annotate(seats=Sum('number_of_guests')))
+        models.SlotOccupancy.objects.bulk_create(
+            models.SlotOccupancy(date=row['date'], time=row['time'], seats_booked=row['seats'])
+            for row in totals
+        )
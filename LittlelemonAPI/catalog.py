@@ -0,0 +1,114 @@
+"""
+In-memory menu catalog.
+
+Every worker process keeps an immutable snapshot of the menu items and
+categories, indexed by id, category and featured flag, so hot paths can price
+and validate menu items without a query. Changes to MenuItem or Category
+replace the stamp in CatalogVersion (see signals.py). A process re-reads the
+stamp at most every settings.CATALOG_MAX_STALENESS seconds and right after a
+change it made itself, and swaps in a fresh snapshot when the stamp differs.
+Other processes therefore see a change within that many seconds.
+"""
+import threading
+import time
+import uuid
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+
+from . import models
+
+
+class CategoryEntry(NamedTuple):
+    id: int
+    slug: str
+    title: str
+
+
+class MenuEntry(NamedTuple):
+    id: int
+    name: str
+    price: object  # Decimal
+    description: str
+    category_id: int
+    featured: bool
+
+
+class Catalog:
+    """An immutable snapshot of the menu. Build derived indexes with `derived()`."""
+    __slots__ = ('version', 'items', 'categories', 'by_category', 'featured', '_derived', '_lock')
+
+    def __init__(self, version, items, categories):
+        self.version = version
+        self.items = {item.id: item for item in items}
+        self.categories = {category.id: category for category in categories}
+        by_category = {}
+        for item in self.items.values():
+            by_category.setdefault(item.category_id, []).append(item.id)
+        self.by_category = {category_id: tuple(ids) for category_id, ids in by_category.items()}
+        self.featured = frozenset(item.id for item in self.items.values() if item.featured)
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def get(self, item_id):
+        return self.items.get(item_id)
+
+    def price(self, item_id):
+        """The item's price, or None if there is no such menu item."""
+        item = self.items.get(item_id)
+        return None if item is None else item.price
+
+    def derived(self, key, build):
+        """Return `build(self)`, computed once per snapshot and cached under `key`."""
+        try:
+            return self._derived[key]
+        except KeyError:
+            with self._lock:
+                if key not in self._derived:
+                    self._derived[key] = build(self)
+                return self._derived[key]
+
+
+_snapshot = None
+_next_check = 0.0
+_lock = threading.Lock()
+
+
+def _read_version():
+    stamp, _ = models.CatalogVersion.objects.get_or_create(pk=1, defaults={'version': uuid.uuid4().hex})
+    return stamp.version
+
+
+def _build(version):
+    items = [MenuEntry(*row) for row in models.MenuItem.objects.order_by('id').values_list(
+        'id', 'name', 'price', 'description', 'category_id', 'featured')]
+    categories = [CategoryEntry(*row) for row in models.Category.objects.order_by('id').values_list(
+        'id', 'slug', 'title')]
+    return Catalog(version, items, categories)
+
+
+def get_catalog():
+    """The current snapshot, rebuilt if the version stamp has changed."""
+    global _snapshot, _next_check
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() < _next_check:
+        return snapshot
+    with _lock:
+        version = _read_version()
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _build(version)
+        _next_check = time.monotonic() + settings.CATALOG_MAX_STALENESS
+        return _snapshot
+
+
+def _recheck():
+    global _next_check
+    _next_check = 0.0
+
+
+def invalidate():
+    """Record a menu change: new version stamp, and re-check it on the next read in this process."""
+    models.CatalogVersion.objects.update_or_create(pk=1, defaults={'version': uuid.uuid4().hex})
+    _recheck()
+    transaction.on_commit(_recheck)
@@ -0,0 +1,145 @@
+"""
+Change tracking for delta sync.
+
+Saves and deletes of categories, menu items, orders and bookings are
+recorded in ChangeLog by the signals in signals.py. Bulk writes that skip
+signals call record_many(). Recording a change deletes the row's older
+entries, so the log stays about as large as the data, and a client that
+syncs from cursor 0 gets every row once. /api/changes?since=<cursor>
+returns the rows changed after the cursor in batches. A row that was
+changed again later shows up once, in its current state.
+
+Order and booking entries carry the id of the user who owns the row
+(owner_id) and, for orders, of the assigned crew member (crew_id). since()
+gives a user other than a manager only the entries of public kinds and of
+their own rows, tombstones included. A booking belongs to the user whose
+username is its customer_name. A change that takes a row away from a user
+(an order reassigned to another crew member, a booking renamed to another
+customer) also records a tombstone for that user, so their next sync drops
+the row. The tombstone stays in the log while the row remains hidden from
+them.
+
+Entries younger than settings.CHANGES_SETTLE_SECONDS are held back. A
+transaction that took its entry id earlier but commits later then still
+lands behind the cursor a client has already read, as long as it commits
+within that window. Entry ids follow insert order, not commit order: the
+entries of a transaction that commits later than that are skipped by
+clients that already read past them, so keep transactions that write
+synced rows shorter than CHANGES_SETTLE_SECONDS.
+"""
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import models
+
+KINDS = {
+    'category': models.Category,
+    'menuitem': models.MenuItem,
+    'order': models.Order,
+    'booking': models.Booking,
+}
+KIND_BY_MODEL = {model: kind for kind, model in KINDS.items()}
+# kinds every user may sync; the entries of the others go to their owner, crew member and managers
+PUBLIC_KINDS = ('category', 'menuitem')
+
+
+def audience(instance):
+    """The (owner_id, crew_id) to record with a change of `instance`."""
+    if isinstance(instance, models.Order):
+        return instance.user_id, instance.delivery_crew_id
+    if isinstance(instance, models.Booking):
+        return User.objects.filter(username=instance.customer_name).values_list('pk', flat=True).first(), None
+    return None, None
+
+
+def _audiences(kind, object_ids):
+    if kind == 'order':
+        return {pk: (owner, crew) for pk, owner, crew in models.Order.objects.filter(pk__in=object_ids)
+                .values_list('pk', 'user_id', 'delivery_crew_id')}
+    if kind == 'booking':
+        names = dict(models.Booking.objects.filter(pk__in=object_ids).values_list('pk', 'customer_name'))
+        users = dict(User.objects.filter(username__in=set(names.values())).values_list('username', 'pk'))
+        return {pk: (users.get(name), None) for pk, name in names.items()}
+    return {}
+
+
+def _users(owner_id, crew_id):
+    return {owner_id, crew_id} - {None}
+
+
+def _replace_entries(kind, audiences, deleted):
+    """
+    The entries to record for the rows in `audiences` ({object_id: (owner_id,
+    crew_id)}), after deleting their older ones. Tombstones for the users a
+    row was taken away from come first, so the new entry is the latest.
+    """
+    older = list(models.ChangeLog.objects.filter(kind=kind, object_id__in=list(audiences))
+                 .values_list('id', 'object_id', 'deleted', 'owner_id', 'crew_id'))
+    revoked = {object_id: set() for object_id in audiences}
+    for _, object_id, was_deleted, owner_id, crew_id in older:
+        users = _users(owner_id, crew_id)
+        if was_deleted and users and not users & _users(*audiences[object_id]):
+            revoked[object_id] |= users  # still hidden from them: keep their tombstone as it is
+    stale, entries = [], []
+    for entry_id, object_id, was_deleted, owner_id, crew_id in older:
+        if revoked[object_id] & _users(owner_id, crew_id):
+            continue
+        stale.append(entry_id)
+        current = _users(*audiences[object_id]) | revoked[object_id]
+        lost_owner = owner_id if owner_id not in current else None
+        lost_crew = crew_id if crew_id not in current else None
+        if lost_owner is not None or lost_crew is not None:
+            entries.append(models.ChangeLog(kind=kind, object_id=object_id, deleted=True,
+                                            owner_id=lost_owner, crew_id=lost_crew))
+            revoked[object_id] |= _users(lost_owner, lost_crew)
+    models.ChangeLog.objects.filter(pk__in=stale).delete()
+    for object_id, (owner_id, crew_id) in audiences.items():
+        entries.append(models.ChangeLog(kind=kind, object_id=object_id, deleted=deleted,
+                                        owner_id=owner_id, crew_id=crew_id))
+    return entries
+
+
+def record(kind, object_id, deleted=False, owner_id=None, crew_id=None):
+    with transaction.atomic():
+        models.ChangeLog.objects.bulk_create(
+            _replace_entries(kind, {object_id: (owner_id, crew_id)}, deleted))
+
+
+def record_many(kind, object_ids, deleted=False):
+    """Record changes of existing rows; the owners are read from the rows."""
+    object_ids = list(object_ids)
+    with transaction.atomic():
+        audiences = _audiences(kind, object_ids)
+        audiences = {pk: audiences.get(pk, (None, None)) for pk in object_ids}
+        models.ChangeLog.objects.bulk_create(_replace_entries(kind, audiences, deleted))
+
+
+def since(cursor, limit, user=None):
+    """
+    Up to `limit` log entries after `cursor`, as (changes, next_cursor,
+    has_more), where changes maps each kind to {"upserted": ids, "deleted": ids}.
+    With `user`, only the entries that user may see; without, all of them.
+    """
+    settled = timezone.now() - datetime.timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    entries = models.ChangeLog.objects.filter(id__gt=cursor, created_at__lte=settled)
+    if user is not None:
+        entries = entries.filter(Q(kind__in=PUBLIC_KINDS) | Q(owner_id=user.pk) | Q(crew_id=user.pk))
+    entries = list(entries
+                   .order_by('id')
+                   .values_list('id', 'kind', 'object_id', 'deleted')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    latest = {}
+    for _, kind, object_id, deleted in entries:
+        latest[kind, object_id] = deleted
+    changes = {kind: {"upserted": [], "deleted": []} for kind in KINDS}
+    for (kind, object_id), deleted in latest.items():
+        if kind in changes:
+            changes[kind]["deleted" if deleted else "upserted"].append(object_id)
+    next_cursor = entries[-1][0] if entries else cursor
+    return changes, next_cursor, has_more
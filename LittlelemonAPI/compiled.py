@@ -0,0 +1,89 @@
+"""
+Compiled query templates for hot lookups.
+
+For a point lookup, building the SQL through the ORM (cloning the QuerySet,
+resolving the WHERE tree, compiling) costs more than running the query. A
+Template compiles its queryset once per database alias and then only runs the
+cached SQL with new parameter values, turning rows back into model instances
+with Model.from_db(). Templates are module-level constants at their call
+sites, so each one stands for a single query shape.
+"""
+import threading
+
+from django.db import connections
+from django.http import Http404
+
+# stand-in values a template is compiled with, located again in the compiled params
+_SENTINELS = {
+    int: lambda i: -(2 ** 62) - i,
+    str: lambda i: f'\x00param{i}\x00',
+}
+
+# integer columns are at most 64-bit signed; the drivers raise on anything wider
+_INT_RANGE = range(-(2 ** 63), 2 ** 63)
+
+
+class Template:
+    """
+    `build` takes one argument per entry in `kinds` and returns a queryset
+    filtered by them. Arguments must compare against integer (int) or text
+    (str) columns, and the queryset must not be sliced, e.g.
+
+        ORDER_BY_PK = Template(lambda pk: Order.objects.filter(pk=pk), int)
+        order = ORDER_BY_PK.get_or_404(order_id)
+    """
+
+    def __init__(self, build, *kinds):
+        self.build = build
+        self.kinds = kinds
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def _compile(self, alias):
+        sentinels = [_SENTINELS[kind](i) for i, kind in enumerate(self.kinds)]
+        queryset = self.build(*sentinels)
+        model = queryset.model
+        fields = [field.attname for field in model._meta.concrete_fields]
+        sql, params = queryset.values_list(*fields).query.sql_with_params()
+        slots = {sentinel: i for i, sentinel in enumerate(sentinels)}
+        positions = [(j, slots[param]) for j, param in enumerate(params) if param in slots]
+        if sorted(i for _, i in positions) != list(range(len(sentinels))):
+            raise ValueError(f'Cannot compile {queryset.query}: every argument must appear once as a parameter.')
+        return model, fields, sql, list(params), positions
+
+    def compiled(self, alias='default'):
+        key = (alias, connections[alias].vendor)
+        try:
+            return self._compiled[key]
+        except KeyError:
+            with self._lock:
+                if key not in self._compiled:
+                    self._compiled[key] = self._compile(alias)
+                return self._compiled[key]
+
+    def rows(self, *args, alias='default', limit=None):
+        model, fields, sql, params, positions = self.compiled(alias)
+        params = list(params)
+        for j, i in positions:
+            params[j] = self.kinds[i](args[i])
+            if self.kinds[i] is int and params[j] not in _INT_RANGE:
+                return []  # no row can match, as with the ORM's lookup
+        if limit is not None:
+            sql = f'{sql} LIMIT {int(limit)}'
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [model.from_db(alias, fields, row) for row in rows]
+
+    def first(self, *args, alias='default'):
+        rows = self.rows(*args, alias=alias, limit=1)
+        return rows[0] if rows else None
+
+    def exists(self, *args, alias='default'):
+        return self.first(*args, alias=alias) is not None
+
+    def get_or_404(self, *args, alias='default'):
+        instance = self.first(*args, alias=alias)
+        if instance is None:
+            raise Http404(f'No {self.compiled(alias)[0]._meta.object_name} matches the given query.')
+        return instance
@@ -0,0 +1,162 @@
+"""
+Automatic delivery crew dispatch.
+
+A Dispatcher keeps the open, unassigned orders in a priority queue (oldest
+first) and a load index with the number of open orders each crew member
+holds. Every tick it takes in the orders created since the last tick, hands
+up to `batch_size` queued orders to crew members, and writes the batch in
+one transaction with assignment.update_orders(). That skips any order a
+manager assigned or completed in the meantime. Every `resync_seconds` the
+queue and the loads are reloaded from the database, which picks up
+deliveries, manual assignments and crew changes.
+
+Strategies:
+    least-loaded  the crew member with the fewest open orders (ties go to
+                  whoever was assigned an order longest ago)
+    round-robin   each crew member in turn
+
+After each tick the queue depth and the assignment latency are written to
+DispatcherStatus for /api/dispatcher. The latency is the time from the
+dispatcher first seeing an order to assigning it, as p50/p95 over the last
+LATENCY_WINDOW assignments. Run the worker with `python manage.py dispatch`.
+"""
+import collections
+import heapq
+import itertools
+import time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count
+
+from . import assignment, groups, models
+
+STRATEGIES = ('least-loaded', 'round-robin')
+LATENCY_WINDOW = 1000
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Dispatcher:
+    def __init__(self, strategy='least-loaded', batch_size=50, max_load=None, resync_seconds=60,
+                 clock=time.monotonic):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown strategy {strategy!r}. Choose from: {", ".join(STRATEGIES)}.')
+        self.strategy = strategy
+        self.batch_size = batch_size
+        self.max_load = max_load
+        self.resync_seconds = resync_seconds
+        self.clock = clock
+        self.queue = []    # heap of (date, order id)
+        self.queued = {}   # order id -> clock time first seen
+        self.crew = {}     # crew id -> User
+        self.load = {}     # crew id -> open orders assigned
+        self.last_seen = 0
+        self.next_resync = 0.0
+        self.assigned_total = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._turns = itertools.count()
+        self._last_turn = {}  # crew id -> turn of their latest assignment
+
+    def resync(self):
+        """Reload the crew, their loads and the queue from the database."""
+        self.crew = {user.pk: user for user in
+                     User.objects.filter(groups__name=groups.DELIVERY_CREW, is_active=True)}
+        open_orders = models.Order.objects.filter(status=False)
+        self.load = dict.fromkeys(self.crew, 0)
+        self.load.update(open_orders.filter(delivery_crew__in=list(self.crew))
+                         .values_list('delivery_crew').annotate(n=Count('id')).order_by())
+        now = self.clock()
+        rows = list(open_orders.filter(delivery_crew=None).values_list('date', 'id'))
+        self.queued = {pk: self.queued.get(pk, now) for _, pk in rows}
+        self.queue = rows
+        heapq.heapify(self.queue)
+        self.last_seen = max([self.last_seen, *self.queued])
+        self.next_resync = now + self.resync_seconds
+
+    def intake(self):
+        """Queue the unassigned orders created since the last look."""
+        rows = (models.Order.objects.filter(id__gt=self.last_seen, status=False, delivery_crew=None)
+                .order_by('id').values_list('date', 'id'))
+        now = self.clock()
+        for day, pk in rows:
+            if pk not in self.queued:
+                self.queued[pk] = now
+                heapq.heappush(self.queue, (day, pk))
+            self.last_seen = pk
+
+    def _choose(self):
+        candidates = [crew_id for crew_id in self.crew
+                      if self.max_load is None or self.load[crew_id] < self.max_load]
+        if not candidates:
+            return None
+        if self.strategy == 'round-robin':
+            crew_id = min(candidates, key=lambda c: self._last_turn.get(c, -1))
+        else:
+            crew_id = min(candidates, key=lambda c: (self.load[c], self._last_turn.get(c, -1)))
+        self._last_turn[crew_id] = next(self._turns)
+        self.load[crew_id] += 1
+        return crew_id
+
+    def tick(self):
+        """Take in new orders and assign one batch. Returns the number of orders assigned."""
+        if self.clock() >= self.next_resync:
+            self.resync()
+        else:
+            self.intake()
+        plan = {}
+        for _ in range(self.batch_size):
+            if not self.queue:
+                break
+            crew_id = self._choose()
+            if crew_id is None:
+                break
+            plan.setdefault(crew_id, []).append(heapq.heappop(self.queue))
+        assigned = []
+        with transaction.atomic():
+            for crew_id, entries in plan.items():
+                try:
+                    updated, skipped = assignment.update_orders(
+                        [pk for _, pk in entries], where={'delivery_crew': None, 'status': False},
+                        delivery_crew=self.crew[crew_id])
+                except assignment.InvalidCrew:
+                    # left the crew since the last resync: put the orders back
+                    del self.crew[crew_id], self.load[crew_id]
+                    for entry in entries:
+                        heapq.heappush(self.queue, entry)
+                    continue
+                self.load[crew_id] -= len(skipped)
+                assigned.extend(updated)
+                for pk in skipped:
+                    self.queued.pop(pk, None)
+        now = self.clock()
+        for pk in assigned:
+            self.latencies.append(now - self.queued.pop(pk))
+        self.assigned_total += len(assigned)
+        self.publish()
+        return len(assigned)
+
+    def metrics(self):
+        return {
+            'strategy': self.strategy,
+            'queue_depth': len(self.queue),
+            'crew_count': len(self.crew),
+            'assigned_total': self.assigned_total,
+            'latency_p50': _percentile(self.latencies, 0.5),
+            'latency_p95': _percentile(self.latencies, 0.95),
+        }
+
+    def publish(self):
+        models.DispatcherStatus.objects.update_or_create(pk=1, defaults=self.metrics())
+
+    def run(self, tick_seconds, ticks=None):
+        """Tick every `tick_seconds` seconds, forever or `ticks` times."""
+        for _ in itertools.count() if ticks is None else range(ticks):
+            started = self.clock()
+            self.tick()
+            time.sleep(max(tick_seconds - (self.clock() - started), 0))
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User, Group
 from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 from decimal import Decimal
 from datetime import date, time
 from .models import Category, MenuItem, Cart, Order, OrderItem, Booking
@@ -225,8 +226,12 @@ class TestFixtures:
 
 
 class APITestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        # built once per test class; each test gets its own copy of the instances
+        cls.fixtures = TestFixtures.create_all_fixtures()
+
     def setUp(self):
-        self.fixtures = TestFixtures.create_all_fixtures()
         self.client = APIClient()
     
     def authenticate_user(self, role='customer'):
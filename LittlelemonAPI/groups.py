@@ -0,0 +1,110 @@
+"""
+Role groups ("Manager", "Delivery crew").
+
+The Group rows are cached per process by name, since nearly every request
+looks one up and they practically never change. Saving or deleting a Group
+clears the cache (signals.py). Membership checks run a compiled query
+against the user/group link table, without joining auth_group.
+
+add_members() and remove_members() change the membership of many users with
+one INSERT or DELETE on the link table. Member listings are cached under
+the current members_version(). Every membership change moves the version
+on once its transaction commits, so a listing read in the meantime is not
+cached under the new version: these functions do it directly, and
+signals.py does it for changes made through the ORM's m2m managers and for
+deleted users and groups. The default settings use a per-process cache,
+where other workers see a change only when their cached pages expire; the
+production settings configure a cache shared by all workers.
+"""
+import time
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import transaction
+
+from .compiled import Template
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery crew'
+
+MEMBERS_VERSION_KEY = 'group-members-version'
+
+_groups = {}
+
+GROUP_BY_NAME = Template(lambda name: Group.objects.filter(name=name), str)
+MEMBERSHIP = Template(
+    lambda user_id, group_id: User.groups.through.objects.filter(user_id=user_id, group_id=group_id), int, int)
+
+
+def get_group(name):
+    """The Group called `name`; raises Group.DoesNotExist like Group.objects.get."""
+    group = _groups.get(name)
+    if group is None:
+        group = GROUP_BY_NAME.first(name)
+        if group is None:
+            raise Group.DoesNotExist(f'Group matching name={name!r} does not exist.')
+        _groups[name] = group
+    return group
+
+
+def clear():
+    _groups.clear()
+
+
+def in_group(user, name):
+    if not user.is_authenticated:
+        return False
+    try:
+        group = get_group(name)
+    except Group.DoesNotExist:
+        return False
+    return MEMBERSHIP.exists(user.pk, group.pk)
+
+
+def members_version():
+    """Changes whenever any group membership changes; part of the member listing cache keys."""
+    return cache.get_or_set(MEMBERS_VERSION_KEY, time.time_ns, None)
+
+
+def membership_changed():
+    # a fresh timestamp rather than a counter, so a version evicted from the cache is never reused
+    cache.set(MEMBERS_VERSION_KEY, time.time_ns(), None)
+
+
+def resolve_users(refs):
+    """
+    Map the user ids (ints) and usernames (strings) in `refs` to user ids,
+    in at most two queries. Refs that match no user are left out.
+    """
+    ids = {ref for ref in refs if isinstance(ref, int)}
+    names = {ref for ref in refs if isinstance(ref, str)}
+    resolved = {pk: pk for pk in User.objects.filter(pk__in=ids).values_list('pk', flat=True)} if ids else {}
+    if names:
+        resolved.update(User.objects.filter(username__in=names).values_list('username', 'pk'))
+    return resolved
+
+
+def add_members(name, user_ids):
+    """Add the users to group `name` in one INSERT. Returns the ids of the users who were not members yet."""
+    group = get_group(name)
+    link = User.groups.through
+    with transaction.atomic():
+        members = set(link.objects.filter(group_id=group.pk, user_id__in=user_ids).values_list('user_id', flat=True))
+        added = sorted(set(user_ids) - members)
+        link.objects.bulk_create([link(user_id=pk, group_id=group.pk) for pk in added], ignore_conflicts=True)
+    if added:
+        transaction.on_commit(membership_changed)
+    return added
+
+
+def remove_members(name, user_ids):
+    """Remove the users from group `name` in one DELETE. Returns the ids of the users who were members."""
+    group = get_group(name)
+    link = User.groups.through
+    with transaction.atomic():
+        links = link.objects.filter(group_id=group.pk, user_id__in=user_ids)
+        removed = sorted(links.values_list('user_id', flat=True))
+        links.delete()
+    if removed:
+        transaction.on_commit(membership_changed)
+    return removed
@@ -0,0 +1,122 @@
+"""
+Idempotency keys for POST /api/orders and POST /api/bookings.
+
+A client that may retry a create sends the same Idempotency-Key header with
+every attempt. run() claims the key for the user with one INSERT on a
+unique (user, key) constraint, so of two attempts racing with the same key
+only one runs the view. The others get 409 with Retry-After while it is in
+flight, and once it has finished they get its stored response back, marked
+with Idempotent-Replayed, without running the view again. A key reused with
+a different request body gets 422.
+
+The view runs in one transaction with the UPDATE that stores its response,
+and that transaction holds the claim's row lock from the start. The rows
+the view creates therefore commit together with the stored response or
+not at all. A claim left without a response after
+settings.IDEMPOTENCY_LOCK_TIMEOUT seconds belongs to a request whose work
+never committed (a killed worker), and the next attempt takes it over. A
+takeover of a claim whose view is still running waits for the row lock,
+and then finds the response stored. Keys expire
+settings.IDEMPOTENCY_KEY_TTL seconds after they were claimed. Responses with
+a 5xx status and views that raise are not stored, so a retry runs the view
+again. `python manage.py purge_idempotency_keys` deletes the
+expired keys.
+"""
+import datetime
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import models
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(request):
+    """md5 of the method, path and parsed body; retries that differ only in formatting match."""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def run(request, handler):
+    """The response of handler(), or the stored response of an earlier request with the same key."""
+    key = request.headers.get(HEADER)
+    if key is None or not request.user.is_authenticated:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return Response({"message": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters."},
+                        status.HTTP_400_BAD_REQUEST)
+    claimed_at = timezone.now()
+    earlier = _claim(request.user, key, fingerprint(request), claimed_at)
+    if earlier is not None:
+        return earlier
+    # the claim time identifies this attempt, in case a stale claim was taken over from it
+    claim = models.IdempotencyKey.objects.filter(user=request.user, key=key, locked_at=claimed_at)
+    try:
+        with transaction.atomic():
+            if not claim.select_for_update().exists():
+                return _in_progress()
+            response = handler()
+            if response.status_code < 500:
+                claim.update(status_code=response.status_code, response=response.data)
+                return response
+    except BaseException:
+        claim.delete()
+        raise
+    claim.delete()
+    return response
+
+
+def _in_progress():
+    return Response({"message": "A request with this Idempotency-Key is in progress."},
+                    status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+
+
+def _claim(user, key, digest, now):
+    fields = {
+        'fingerprint': digest, 'status_code': None, 'response': None, 'locked_at': now,
+        'expires_at': now + datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+    }
+    try:
+        with transaction.atomic():
+            models.IdempotencyKey.objects.create(user=user, key=key, **fields)
+        return None
+    except IntegrityError:
+        pass
+    keys = models.IdempotencyKey.objects.filter(user=user, key=key)
+    stale = Q(expires_at__lte=now) | Q(
+        status_code=None, locked_at__lte=now - datetime.timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT))
+    if keys.filter(stale).update(**fields):
+        return None
+    earlier = keys.first()
+    if earlier is None or earlier.status_code is None:
+        # in flight, or purged in the meantime: either way the client should try again shortly
+        return _in_progress()
+    if earlier.fingerprint != digest:
+        return Response({"message": "This Idempotency-Key was used with a different request."},
+                        status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(earlier.response, earlier.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def purge_expired(batch_size=1000, pause=0.0):
+    """Delete the expired keys, yielding the size of each batch."""
+    while True:
+        ids = list(models.IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        models.IdempotencyKey.objects.filter(pk__in=ids).delete()
+        yield len(ids)
+        if pause:
+            time.sleep(pause)
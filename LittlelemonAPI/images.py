@@ -0,0 +1,209 @@
+"""
+Menu image variants.
+
+An uploaded MenuItem.image is resized into the sizes in
+settings.MENU_IMAGE_VARIANTS, each saved as WebP and JPEG under a name made
+from the hash of its bytes. The variants are stored in
+MenuItem.image_variants as {"source": <image name>, <variant>: {"width",
+"height", "webp", "jpeg"}} and returned by the serializer as URLs, so list
+views can load small thumbnails instead of the full photo.
+
+Saving a menu item with a new image schedules processing once the
+transaction commits. The request does not wait for it: the work runs on a
+thread pool with settings.MENU_IMAGE_WORKERS threads (0 processes inline, for
+tests and scripts). Until it finishes, image_variants does not match the
+image and the serializer returns no variants. A worker that fails logs the
+exception, and `process_menu_images` redoes any item a worker did not finish.
+
+A variant's bytes never change under its name, so serve_variant() answers
+with a year-long immutable Cache-Control, the hash as ETag, and supports
+If-None-Match and single byte ranges.
+"""
+import hashlib
+import io
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.views.decorators.http import require_safe
+
+from . import changes, models
+
+VARIANT_DIR = 'menu_images/v'
+# serializer key: (Pillow format, file extension)
+FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+VARIANT_NAME = re.compile(r'^([0-9a-f]{32})\.(webp|jpg)$')
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.MENU_IMAGE_WORKERS,
+                                           thread_name_prefix='menu-images')
+        return _executor
+
+
+def needs_processing(item):
+    """Whether the item's stored variants were not made from its current image."""
+    if not item.image:
+        return bool(item.image_variants)
+    return item.image_variants.get('source') != item.image.name
+
+
+def schedule(item):
+    """Process the item's image after the current transaction commits, off the request thread."""
+    pk, name = item.pk, item.image.name or ''
+    if settings.MENU_IMAGE_WORKERS:
+        transaction.on_commit(lambda: _submit(pk, name))
+    else:
+        transaction.on_commit(lambda: process(pk, name))
+
+
+def _submit(pk, name):
+    future = _get_executor().submit(_run, pk, name)
+    # the executor keeps a worker's exception on the future, which nobody reads
+    future.add_done_callback(lambda done: _log_failure(done, pk))
+    return future
+
+
+def _log_failure(future, pk):
+    exception = future.exception()
+    if exception is not None:
+        logger.error('Processing the image of menu item %s failed.', pk, exc_info=exception)
+
+
+def _run(pk, name):
+    try:
+        process(pk, name)
+    finally:
+        connection.close()
+
+
+def _store(data, extension):
+    name = f'{VARIANT_DIR}/{hashlib.sha256(data).hexdigest()[:32]}.{extension}'
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def render_variants(source):
+    """Resize the image file `source` into every configured variant and store them."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        variants = {}
+        for variant, width in settings.MENU_IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            entry = {'width': resized.width, 'height': resized.height}
+            for key, (fmt, extension) in FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, fmt, quality=80, optimize=fmt == 'JPEG')
+                entry[key] = _store(buffer.getvalue(), extension)
+            variants[variant] = entry
+    return variants
+
+
+def process(pk, name):
+    """
+    Build the variants of menu item `pk` from image `name`. Does nothing if
+    the item has since been deleted or given another image.
+    """
+    item = models.MenuItem.objects.filter(pk=pk)
+    item = item.filter(image=name) if name else item.filter(Q(image='') | Q(image__isnull=True))
+    if not item.exists():
+        return False
+    variants = {}
+    if name:
+        with default_storage.open(name) as source:
+            variants = render_variants(source)
+        variants['source'] = name
+    # the image may have changed while the variants were made
+    if item.update(image_variants=variants):
+        changes.record(changes.KIND_BY_MODEL[models.MenuItem], pk)
+        return True
+    return False
+
+
+def variant_urls(variants, request=None):
+    """The serializer view of image_variants: URLs per variant and format."""
+    urls = {}
+    for variant, entry in variants.items():
+        if variant == 'source':
+            continue
+        urls[variant] = {'width': entry['width'], 'height': entry['height']}
+        for key in FORMATS:
+            url = default_storage.url(entry[key])
+            urls[variant][key] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+def _byte_range(header, size):
+    """
+    (start, end) inclusive for a single-range header, None to send everything,
+    or False if unsatisfiable. A header that is not a valid single range is
+    ignored (RFC 9110, 14.2).
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        return None
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_variant(request, name):
+    match = VARIANT_NAME.match(name)
+    path = f'{VARIANT_DIR}/{name}'
+    if not match or not default_storage.exists(path):
+        raise Http404('No such image.')
+    etag = f'"{match.group(1)}"'
+    content_type = CONTENT_TYPES[match.group(2)]
+    headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL, 'Accept-Ranges': 'bytes'}
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        size = default_storage.size(path)
+        byte_range = _byte_range(request.headers['Range'], size) if 'Range' in request.headers else None
+        # a Range with a stale If-Range validator gets the whole file
+        if byte_range and request.headers.get('If-Range', etag) != etag:
+            byte_range = None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range:
+            start, end = byte_range
+            with default_storage.open(path) as f:
+                f.seek(start)
+                response = HttpResponse(f.read(end - start + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(default_storage.open(path), content_type=content_type)
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,27 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from LittlelemonAPI import archive
+
+
+class Command(BaseCommand):
+    help = ('Move completed orders older than --order-days and bookings older than --booking-days '
+            'to the archive tables, in short batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order-days', type=int, default=90,
+                            help='Archive completed orders dated more than this many days ago (default 90).')
+        parser.add_argument('--booking-days', type=int, default=0,
+                            help='Archive bookings dated more than this many days ago (default 0: all past bookings).')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows moved per transaction (default 500).')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches, to leave room for live traffic (default 0.05).')
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        batch = {'batch_size': options['batch_size'], 'pause': options['pause']}
+        orders = sum(archive.archive_orders(today - datetime.timedelta(days=options['order_days']), **batch))
+        bookings = sum(archive.archive_bookings(today - datetime.timedelta(days=options['booking_days']), **batch))
+        self.stdout.write(self.style.SUCCESS(f'Archived {orders} orders and {bookings} bookings.'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from LittlelemonAPI import dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Run the delivery crew dispatcher: assign open orders to the delivery crew every tick.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=2.0,
+                            help='Seconds between dispatch rounds (default 2).')
+        parser.add_argument('--strategy', choices=dispatcher.STRATEGIES, default='least-loaded',
+                            help='How a crew member is picked for an order (default least-loaded).')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Most orders assigned per round, in one transaction (default 50).')
+        parser.add_argument('--max-load', type=int, default=None,
+                            help='Most open orders per crew member; further orders wait (default: no limit).')
+        parser.add_argument('--resync', type=float, default=60.0,
+                            help='Seconds between full reloads of the queue and crew loads (default 60).')
+        parser.add_argument('--ticks', type=int, default=None,
+                            help='Stop after this many rounds (default: run until interrupted).')
+
+    def handle(self, *args, **options):
+        worker = dispatcher.Dispatcher(strategy=options['strategy'], batch_size=options['batch_size'],
+                                       max_load=options['max_load'], resync_seconds=options['resync'])
+        try:
+            worker.run(options['tick'], ticks=options['ticks'])
+        except KeyboardInterrupt:
+            pass
+        metrics = worker.metrics()
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {metrics['assigned_total']} orders, {metrics['queue_depth']} waiting."))
@@ -0,0 +1,32 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from LittlelemonAPI import batches, models
+
+FIELDS = ('id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date', 'orderitem__menuitem_id',
+          'orderitem__quantity')
+
+
+class Command(BaseCommand):
+    help = 'Write the live orders as CSV. Rows are streamed in chunks, so memory stays flat on any table size.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='File to write (default: standard output).')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows fetched per query (default: settings.BATCH_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        rows = models.Order.objects.order_by('id').values_list(*FIELDS)
+        out = self.stdout if options['output'] == '-' else open(options['output'], 'w', newline='')
+        try:
+            writer = csv.writer(out)
+            writer.writerow(field.replace('orderitem__', '') for field in FIELDS)
+            exported = 0
+            for row in batches.iterate(rows, options['chunk_size']):
+                writer.writerow(row)
+                exported += 1
+        finally:
+            if out is not self.stdout:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(f'Exported {exported} orders.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from LittlelemonAPI import batches, images
+from LittlelemonAPI.models import MenuItem
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized variants of menu images that have none or outdated ones.'
+
+    def handle(self, *args, **options):
+        processed = 0
+        # processing writes the rows being read, so each batch is read by its own query
+        for items in batches.pk_batches(MenuItem.objects.only('id', 'image', 'image_variants')):
+            for item in items:
+                if images.needs_processing(item):
+                    processed += images.process(item.pk, item.image.name or '')
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} menu images.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from LittlelemonAPI import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete the idempotency keys whose stored responses have expired, in short batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Keys deleted per query (default 1000).')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches, to leave room for live traffic (default 0.05).')
+
+    def handle(self, *args, **options):
+        purged = sum(idempotency.purge_expired(batch_size=options['batch_size'], pause=options['pause']))
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired idempotency keys.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from LittlelemonAPI import capacity
+
+
+class Command(BaseCommand):
+    help = 'Recompute the booking slot occupancy table from the bookings.'
+
+    def handle(self, *args, **options):
+        capacity.rebuild()
+        self.stdout.write(self.style.SUCCESS('Rebuilt booking slot occupancy.'))
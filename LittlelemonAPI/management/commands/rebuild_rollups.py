@@ -0,0 +1,30 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from LittlelemonAPI import batches, models, rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the sales and delivery rollup tables from the order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1,
+                            help='Number of days back from --to to rebuild (default: 1, i.e. today only).')
+        parser.add_argument('--to', type=datetime.date.fromisoformat, default=None,
+                            help='Last day to rebuild, YYYY-MM-DD (default: today).')
+        parser.add_argument('--user-summaries', action='store_true',
+                            help='Also recompute the per-user order summaries of every user with orders.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1.')
+        end = options['to'] or datetime.date.today()
+        start = end - datetime.timedelta(days=options['days'] - 1)
+        rollups.rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups from {start} to {end}.'))
+        if options['user_summaries']:
+            user_ids = models.Order.objects.values_list('user_id', flat=True).distinct()
+            for user_id in batches.iterate(user_ids):
+                rollups.refresh_user_summary(user_id)
+            self.stdout.write(self.style.SUCCESS('Rebuilt user order summaries.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from LittlelemonAPI import search
+
+
+class Command(BaseCommand):
+    help = 'Repopulate the menu search index from the menu items.'
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        backend = 'FTS5' if search.fts_available() else 'trigram'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt menu search index ({backend}).'))
@@ -0,0 +1,267 @@
+"""
+Filter and sort indexes for the menu list.
+
+Built once per catalog snapshot (catalog.py). Each menu item gets a bit
+position, and category, featured and price filters are bitsets (Python ints),
+so a combination of filters is a bitwise AND and the count is a popcount.
+Every supported ordering is a presorted tuple of positions. A page is taken by
+walking that tuple until the page is full, and its rows are then fetched by
+primary key. Price ranges are bisected out of the price-sorted order, which
+also makes histogram bucket counts cheap.
+"""
+import bisect
+from decimal import ROUND_CEILING, Decimal, InvalidOperation
+
+from . import catalog
+
+# ?ordering= values served from the index, mapped to the sort key of a MenuEntry
+ORDERINGS = {
+    'name': lambda item: (item.name, item.id),
+    'price': lambda item: (item.price, item.id),
+    'category': lambda item: (item.category_id, item.id),
+}
+FILTERS = ('category', 'featured', 'price')
+PRICE_RANGE_PARAMS = ('from_price', 'to_price')
+# number of equal-width price bands between the cheapest and dearest item in the facets
+FACET_PRICE_BANDS = 5
+BOOLEAN_VALUES = {'true': True, 'True': True, '1': True, 'false': False, 'False': False, '0': False}
+
+
+def _bitset(positions, size):
+    # set bits in a byte array and convert once; OR-ing bits into a growing int is quadratic
+    buffer = bytearray((size + 7) // 8)
+    for p in positions:
+        buffer[p >> 3] |= 1 << (p & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class MenuIndex:
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        self.category_titles = {category.id: category.title for category in snapshot.categories.values()}
+        self.ids = tuple(sorted(snapshot.items))
+        size = len(self.ids)
+        self.all = (1 << size) - 1
+        self.category_ids = frozenset(snapshot.categories)
+        by_category, by_price, featured = {}, {}, []
+        for position, item_id in enumerate(self.ids):
+            item = snapshot.items[item_id]
+            by_category.setdefault(item.category_id, []).append(position)
+            by_price.setdefault(item.price, []).append(position)
+            if item.featured:
+                featured.append(position)
+        self.category = {key: _bitset(positions, size) for key, positions in by_category.items()}
+        self.price = {key: _bitset(positions, size) for key, positions in by_price.items()}
+        self.featured = _bitset(featured, size)
+        self.orderings = {}
+        for name, key in ORDERINGS.items():
+            ascending = sorted(range(size), key=lambda position: key(snapshot.items[self.ids[position]]))
+            self.orderings[name] = tuple(ascending)
+            self.orderings['-' + name] = tuple(reversed(ascending))
+        # prices in the same order as orderings['price'], for bisecting ranges
+        self.prices = tuple(snapshot.items[self.ids[p]].price for p in self.orderings['price'])
+
+    def price_slice(self, low=None, high=None):
+        """Bounds of the run of orderings['price'] with low <= price <= high."""
+        start = 0 if low is None else bisect.bisect_left(self.prices, low)
+        stop = len(self.prices) if high is None else bisect.bisect_right(self.prices, high)
+        return start, max(start, stop)
+
+    def mask(self, category=None, featured=None, price=None, from_price=None, to_price=None, ids=None):
+        mask = self.all
+        if ids is not None:
+            mask &= _bitset(self.positions(ids), len(self.ids))
+        if category is not None:
+            mask &= self.category.get(category, 0)
+        if featured is not None:
+            mask &= self.featured if featured else self.all & ~self.featured
+        if price is not None:
+            mask &= self.price.get(price, 0)
+        if from_price is not None or to_price is not None:
+            start, stop = self.price_slice(from_price, to_price)
+            if (start, stop) != (0, len(self.ids)):
+                mask &= _bitset(self.orderings['price'][start:stop], len(self.ids))
+        return mask
+
+    def positions(self, ids):
+        """Bit positions of the given menu item ids, skipping unknown ids."""
+        found = []
+        for item_id in ids:
+            p = bisect.bisect_left(self.ids, item_id)
+            if p < len(self.ids) and self.ids[p] == item_id:
+                found.append(p)
+        return found
+
+    def query(self, ordering='name', **filters):
+        """The matching menu item ids in `ordering` order, as a lazy IndexResult."""
+        return IndexResult(self, self.orderings[ordering], self.mask(**filters))
+
+    def price_histogram(self, edges, **filters):
+        """
+        Number of matching items per bucket, where bucket i holds prices in
+        [edges[i], edges[i + 1]) and the last bucket also includes its upper edge.
+        """
+        return self._bucket_counts(edges, self.mask(**filters))
+
+    def _bucket_counts(self, edges, mask):
+        order = self.orderings['price']
+        bits = None if mask == self.all else self.bytes(mask)
+        counts = []
+        for i, (low, high) in enumerate(zip(edges, edges[1:])):
+            start = bisect.bisect_left(self.prices, low)
+            if i == len(edges) - 2:
+                stop = bisect.bisect_right(self.prices, high)
+            else:
+                stop = bisect.bisect_left(self.prices, high)
+            if bits is None:
+                counts.append(max(stop - start, 0))
+            else:
+                counts.append(sum(bits[p >> 3] >> (p & 7) & 1 for p in order[start:stop]))
+        return counts
+
+    def facets(self, **filters):
+        """
+        Counts per category, featured flag and price band. Each facet applies
+        every filter except its own, so a count is the number of items the
+        client would get by choosing that value.
+        """
+        def without(*names):
+            return self.mask(**{key: value for key, value in filters.items() if key not in names})
+
+        mask = without('category')
+        categories = [
+            {"id": category_id, "title": self.category_titles.get(category_id, ''), "count": count}
+            for category_id, count in sorted(
+                (category_id, (mask & bitset).bit_count()) for category_id, bitset in self.category.items())
+            if count
+        ]
+        mask = without('featured')
+        featured = (mask & self.featured).bit_count()
+        bands = []
+        if self.prices:
+            edges = histogram_edges(self.prices[0], self.prices[-1], FACET_PRICE_BANDS)
+            counts = self._bucket_counts(edges, without('from_price', 'to_price'))
+            bands = [{"from": edges[i], "to": edges[i + 1], "count": count} for i, count in enumerate(counts)]
+        return {
+            "category": categories,
+            "featured": {"true": featured, "false": mask.bit_count() - featured},
+            "price": bands,
+        }
+
+    def price_bounds(self, **filters):
+        """(lowest, highest) price among the matching items, or None if nothing matches."""
+        mask = self.mask(**filters)
+        if not mask:
+            return None
+        bits = self.bytes(mask)
+        order = self.orderings['price']
+        matches = (i for i, p in enumerate(order) if bits[p >> 3] >> (p & 7) & 1)
+        first = next(matches)
+        last = next(i for i in range(len(order) - 1, first - 1, -1) if bits[order[i] >> 3] >> (order[i] & 7) & 1)
+        return self.prices[first], self.prices[last]
+
+    def bytes(self, mask):
+        # testing a bit of a large int is O(size); index a byte string instead
+        return mask.to_bytes((len(self.ids) + 7) // 8, 'little')
+
+
+class IndexResult:
+    """
+    Sliceable result of MenuIndex.query. len() is a popcount, and a slice only
+    walks the presorted positions until it is filled, so a page near the start
+    of a large menu costs far less than materializing every match.
+    """
+
+    def __init__(self, index, order, mask):
+        self.index = index
+        self.order = order
+        self.mask = mask
+        self.count = mask.bit_count()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop, step = key.indices(self.count)
+        if step != 1:
+            return self[start:stop][::step]
+        ids = self.index.ids
+        if self.mask == self.index.all:
+            return [ids[p] for p in self.order[start:stop]]
+        bits = self.index.bytes(self.mask)
+        found = []
+        seen = 0
+        for p in self.order:
+            if bits[p >> 3] >> (p & 7) & 1:
+                if seen >= start:
+                    found.append(ids[p])
+                    if len(found) == stop - start:
+                        break
+                seen += 1
+        return found
+
+
+def get_index():
+    return catalog.get_catalog().derived('menu_index', MenuIndex)
+
+
+def parse_price(value, name):
+    """A price query param as a Decimal, or ValueError with a client-facing message."""
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'{name} must be a number.')
+    if not price.is_finite() or price < 0:
+        raise ValueError(f'{name} must be a non-negative number.')
+    return price
+
+
+def parse_price_range(params):
+    """(from_price, to_price) from query params, either one None when absent."""
+    low, high = (parse_price(params[name], name) if params.get(name) else None for name in PRICE_RANGE_PARAMS)
+    if low is not None and high is not None and low > high:
+        raise ValueError('from_price must not be greater than to_price.')
+    return low, high
+
+
+def histogram_edges(low, high, buckets):
+    """`buckets` + 1 equal-width edges from low to high, in whole cents."""
+    width = ((high - low) / buckets).quantize(Decimal('0.01'), rounding=ROUND_CEILING) or Decimal('0.01')
+    return [low + width * i for i in range(buckets + 1)]
+
+
+def parse_filters(params, index):
+    """Filter keyword arguments for MenuIndex from query params, or None as for parse_params."""
+    filters = {}
+    try:
+        if params.get('category'):
+            filters['category'] = int(params['category'])
+        if params.get('featured'):
+            filters['featured'] = BOOLEAN_VALUES[params['featured']]
+        if params.get('price'):
+            filters['price'] = Decimal(params['price'])
+        filters['from_price'], filters['to_price'] = parse_price_range(params)
+    except (ValueError, KeyError, InvalidOperation):
+        return None
+    if 'category' in filters and filters['category'] not in index.category_ids:
+        return None
+    if 'price' in filters and not filters['price'].is_finite():
+        return None
+    return filters
+
+
+def parse_params(params, index, default_ordering='name'):
+    """
+    Turn list query params into (ordering, filters) for MenuIndex.query, or
+    None when a param or value needs the SQL path (which also reports errors).
+    """
+    ordering = params.get('ordering', default_ordering)
+    if ordering not in index.orderings:
+        return None
+    filters = parse_filters(params, index)
+    return None if filters is None else (ordering, filters)
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:21
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def seed_occupancy(apps, schema_editor):
+    Booking = apps.get_model('LittlelemonAPI', 'Booking')
+    SlotOccupancy = apps.get_model('LittlelemonAPI', 'SlotOccupancy')
+    totals = Booking.objects.order_by().values('date', 'time').annotate(seats=Sum('number_of_guests'))
+    SlotOccupancy.objects.bulk_create(
+        SlotOccupancy(date=row['date'], time=row['time'], seats_booked=row['seats'])
+        for row in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittlelemonAPI', '0006_user_order_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time', models.TimeField(unique=True)),
+                ('capacity', models.PositiveIntegerField()),
+            ],
+            options={
+                'ordering': ['time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SlotOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('seats_booked', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('date', 'time')},
+            },
+        ),
+        # Seed occupancy from existing bookings
+        migrations.RunPython(seed_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+FTS_TABLE = 'LittlelemonAPI_menusearch'
+
+
+def create_fts_table(apps, schema_editor):
+    # FTS5 is SQLite only; other databases use the in-process trigram index in search.py
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5('
+            "name, description, category, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        MenuItem = apps.get_model('LittlelemonAPI', 'MenuItem')
+        rows = MenuItem.objects.values_list('id', 'name', 'description', 'category__title')
+        cursor.executemany(
+            f'INSERT INTO "{FTS_TABLE}" (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+            [(pk, name, description, category or '') for pk, name, description, category in rows],
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittlelemonAPI', '0007_booking_slots'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:57
+
+from django.db import migrations, models
+
+
+def seed_change_log(apps, schema_editor):
+    # one entry per existing row, so a sync from cursor 0 returns the whole dataset
+    ChangeLog = apps.get_model('LittlelemonAPI', 'ChangeLog')
+    for kind, model_name in [('category', 'Category'), ('menuitem', 'MenuItem'),
+                             ('order', 'Order'), ('booking', 'Booking')]:
+        ids = apps.get_model('LittlelemonAPI', model_name).objects.order_by('id').values_list('id', flat=True)
+        ChangeLog.objects.bulk_create((ChangeLog(kind=kind, object_id=pk) for pk in ids), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittlelemonAPI', '0011_row_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='changelog_object_idx')],
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
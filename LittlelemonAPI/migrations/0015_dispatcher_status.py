@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittlelemonAPI', '0014_menuitem_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DispatcherStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strategy', models.CharField(max_length=20)),
+                ('queue_depth', models.PositiveIntegerField(default=0)),
+                ('crew_count', models.PositiveIntegerField(default=0)),
+                ('assigned_total', models.PositiveIntegerField(default=0)),
+                ('latency_p50', models.FloatField(null=True)),
+                ('latency_p95', models.FloatField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
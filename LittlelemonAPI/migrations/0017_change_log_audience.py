@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:09
+
+from django.db import migrations, models
+
+
+def fill_audience(apps, schema_editor):
+    # entries of live orders and bookings; older tombstones stay visible to managers only
+    ChangeLog = apps.get_model('LittlelemonAPI', 'ChangeLog')
+    Order = apps.get_model('LittlelemonAPI', 'Order')
+    Booking = apps.get_model('LittlelemonAPI', 'Booking')
+    User = apps.get_model('auth', 'User')
+    for pk, owner_id, crew_id in Order.objects.values_list('pk', 'user_id', 'delivery_crew_id').iterator():
+        ChangeLog.objects.filter(kind='order', object_id=pk).update(owner_id=owner_id, crew_id=crew_id)
+    users = dict(User.objects.values_list('username', 'pk'))
+    for pk, name in Booking.objects.values_list('pk', 'customer_name').iterator():
+        if name in users:
+            ChangeLog.objects.filter(kind='booking', object_id=pk).update(owner_id=users[name])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittlelemonAPI', '0016_idempotency_keys'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changelog',
+            name='crew_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='owner_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['owner_id', 'id'], name='changelog_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['crew_id', 'id'], name='changelog_crew_idx'),
+        ),
+        migrations.RunPython(fill_audience, migrations.RunPython.noop),
+    ]
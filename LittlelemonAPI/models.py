@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import User
 
 # Create your models here.
@@ -16,8 +17,14 @@ class MenuItem(models.Model):
     description = models.TextField(default='No description available')
     category = models.ForeignKey(Category, on_delete=models.PROTECT, default=1)
     image = models.ImageField(upload_to='menu_images/', blank=True, null=True)
+    # resized copies of `image`, filled in by images.process()
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     featured = models.BooleanField(db_index=True, default=False)
 
+    class Meta:
+        # price ranges within a category (price alone is covered by the column index)
+        indexes = [models.Index(fields=['category', 'price'], name='menuitem_category_price_idx')]
+
     def __str__(self):
         return self.name
 
@@ -51,6 +58,26 @@ class Order(models.Model):
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True, auto_now=True)
     orderitem = models.ForeignKey(OrderItem, on_delete=models.CASCADE, null=True)
+    # bumped on every API write; the ETag of /api/orders/{id} (see versioning.py)
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'], name='order_user_recent_idx'),
+            # manager order list filtered by ?from_price=/?to_price=
+            models.Index(fields=['total', 'id'], name='order_total_idx'),
+            # delivery crew order list, open orders first
+            models.Index(fields=['delivery_crew', 'status', '-id'], name='order_crew_open_idx'),
+        ]
+
+
+# Denormalized per-user order header, kept in step with the Order table by rollups.py.
+class UserOrderSummary(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='order_summary')
+    order_count = models.IntegerField(default=0)
+    lifetime_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_order_date = models.DateField(null=True)
+    open_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, related_name='+')
 
 
 class Booking(models.Model):
@@ -62,9 +89,169 @@ class Booking(models.Model):
     number_of_guests = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # bumped on every API write; the ETag of /api/bookings/{id}/ (see versioning.py)
+    version = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return f"{self.customer_name} - {self.date} {self.time}"
 
     class Meta:
-        ordering = ['date', 'time']
\ No newline at end of file
+        ordering = ['date', 'time']
+        indexes = [
+            models.Index(fields=['date', 'time'], name='booking_date_time_idx'),
+            # a customer's own bookings, in date order
+            models.Index(fields=['customer_name', 'date', 'time'], name='booking_customer_date_idx'),
+        ]
+
+# Rollup tables for the manager dashboards. They are maintained incrementally
+# by rollups.py on checkout and order updates, and can be rebuilt with the
+# `rebuild_rollups` management command.
+class DailySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    orders = models.IntegerField(default=0)
+    items_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'category')
+
+
+class MenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+
+class CrewDeliveryStats(models.Model):
+    date = models.DateField()
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE)
+    assigned = models.IntegerField(default=0)
+    delivered = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'delivery_crew')
+
+
+
+# Seating capacity per booking time slot. Once any row exists, times without
+# a row cannot be booked; with none, every time gets
+# settings.BOOKING_DEFAULT_SLOT_CAPACITY.
+class BookingSlot(models.Model):
+    time = models.TimeField(unique=True)
+    capacity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.time} ({self.capacity} seats)"
+
+    class Meta:
+        ordering = ['time']
+
+
+# Seats already booked per date and time, maintained by capacity.py.
+class SlotOccupancy(models.Model):
+    date = models.DateField()
+    time = models.TimeField()
+    seats_booked = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'time')
+
+
+
+# Single-row stamp that changes whenever the menu or categories change; worker
+# processes compare it with their in-memory catalog snapshot (catalog.py).
+class CatalogVersion(models.Model):
+    version = models.CharField(max_length=32)
+
+
+# Latest metrics of the dispatch worker (see dispatcher.py), a single row
+class DispatcherStatus(models.Model):
+    strategy = models.CharField(max_length=20)
+    queue_depth = models.PositiveIntegerField(default=0)
+    crew_count = models.PositiveIntegerField(default=0)
+    assigned_total = models.PositiveIntegerField(default=0)
+    latency_p50 = models.FloatField(null=True)
+    latency_p95 = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# Change log behind /api/changes (see changes.py). Every create, update or
+# delete of a synced row appends an entry and drops the row's older entries,
+# so the log holds one entry per live row plus tombstones, and the entry id
+# is the sync cursor. Order and booking entries name the users who may sync
+# them besides managers: the owner and, for orders, the assigned crew member.
+class ChangeLog(models.Model):
+    kind = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    owner_id = models.IntegerField(null=True)
+    crew_id = models.IntegerField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'object_id'], name='changelog_object_idx'),
+            models.Index(fields=['owner_id', 'id'], name='changelog_owner_idx'),
+            models.Index(fields=['crew_id', 'id'], name='changelog_crew_idx'),
+        ]
+
+
+# Cold tier for orders and bookings (see archive.py). Rows keep their original
+# id. Completed orders and past bookings are moved here by the
+# `archive` command. Deleted ones are moved here with deleted=True instead of
+# being dropped. An archived order carries its order item's fields.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True)
+    status = models.BooleanField(default=False)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.SET_NULL, related_name='+', null=True)
+    quantity = models.SmallIntegerField(null=True)
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2, null=True)
+    price = models.DecimalField(max_digits=6, decimal_places=2, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-id'], name='archivedorder_user_idx')]
+
+
+class ArchivedBooking(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    customer_name = models.CharField(max_length=255)
+    email = models.EmailField()
+    phone = models.CharField(max_length=20)
+    date = models.DateField()
+    time = models.TimeField()
+    number_of_guests = models.IntegerField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['customer_name', 'date'], name='archivedbooking_customer_idx')]
+
+
+# Responses to POSTs sent with an Idempotency-Key header (see idempotency.py).
+# A row without a status_code is a request still in flight. The fingerprint
+# is an md5 of the method, path and body, so the row stays small whatever
+# the request was.
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=32)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'key'], name='idempotencykey_user_key_uniq')]
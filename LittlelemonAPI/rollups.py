@@ -0,0 +1,257 @@
+"""
+Incremental sales rollups for the manager dashboards.
+
+The analytics endpoints only read the rollup tables (DailySales,
+MenuItemSales, CrewDeliveryStats), so a dashboard query costs one row per
+day and category/item/crew instead of one row per order. The per-user
+UserOrderSummary gives the customer order list its header without counting
+the user's orders. The tables are kept up to date from the order views;
+`rebuild_rollups` recomputes them from the order history when they need to
+be repaired.
+"""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Sum
+
+from . import models
+
+
+def _bump(model, keys, **deltas):
+    """Add `deltas` to the rollup row identified by `keys`, creating it if needed."""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**keys).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Another request created the row between our UPDATE and INSERT.
+        model.objects.filter(**keys).update(**updates)
+
+
+def _record_sale(order, sign, day, total):
+    orderitem = order.orderitem
+    if orderitem is None:
+        return
+    menuitem = orderitem.menuitem
+    _bump(models.DailySales, {'date': day, 'category_id': menuitem.category_id},
+          orders=sign, items_sold=sign * orderitem.quantity, revenue=sign * total)
+    _bump(models.MenuItemSales, {'date': day, 'menuitem_id': menuitem.id},
+          quantity=sign * orderitem.quantity, revenue=sign * orderitem.price)
+
+
+def _record_crew(crew_id, day, assigned=0, delivered=0):
+    if crew_id is None:
+        return
+    _bump(models.CrewDeliveryStats, {'date': day, 'delivery_crew_id': crew_id},
+          assigned=assigned, delivered=delivered)
+
+
+def _open_order_id(user_id):
+    orders = models.Order.objects.filter(user_id=user_id, status=False)
+    return orders.order_by('-id').values_list('id', flat=True).first()
+
+
+def _last_order_date(user_id):
+    dates = [orders.aggregate(last=Max('date'))['last']
+             for orders in (models.Order.objects.filter(user_id=user_id),
+                            models.ArchivedOrder.objects.filter(user_id=user_id, deleted=False))]
+    return max((day for day in dates if day), default=None)
+
+
+def refresh_user_summary(user_id):
+    """Recompute a user's order summary from the live and archived orders."""
+    count, spend, last_date = 0, 0, None
+    for orders in (models.Order.objects.filter(user_id=user_id),
+                   models.ArchivedOrder.objects.filter(user_id=user_id, deleted=False)):
+        totals = orders.aggregate(count=Count('id'), spend=Sum('total'), last_date=Max('date'))
+        count += totals['count']
+        spend += totals['spend'] or 0
+        if totals['last_date'] and (last_date is None or totals['last_date'] > last_date):
+            last_date = totals['last_date']
+    summary, _ = models.UserOrderSummary.objects.update_or_create(user_id=user_id, defaults={
+        'order_count': count,
+        'lifetime_spend': spend,
+        'last_order_date': last_date,
+        'open_order_id': _open_order_id(user_id),
+    })
+    return summary
+
+
+def get_user_summary(user_id):
+    """The user's order summary, computed on first access for users with no row yet."""
+    summary = models.UserOrderSummary.objects.filter(user_id=user_id).first()
+    return summary or refresh_user_summary(user_id)
+
+
+def _update_summary(user_id, count=0, spend=0, **values):
+    updates = dict(values)
+    if count:
+        updates['order_count'] = F('order_count') + count
+    if spend:
+        updates['lifetime_spend'] = F('lifetime_spend') + spend
+    if updates and not models.UserOrderSummary.objects.filter(user_id=user_id).update(**updates):
+        # No row yet (e.g. orders placed before summaries existed): build it from scratch.
+        refresh_user_summary(user_id)
+
+
+def snapshot(order):
+    """The order fields the rollups depend on; take one before saving an update."""
+    return order.date, order.total, order.delivery_crew_id, order.status
+
+
+def record_checkout(order):
+    """Account for a newly created order."""
+    _record_sale(order, 1, order.date, order.total)
+    _record_crew(order.delivery_crew_id, order.date, assigned=1, delivered=int(order.status))
+    opened = {} if order.status else {'open_order_id': order.id}
+    _update_summary(order.user_id, count=1, spend=order.total, last_order_date=order.date, **opened)
+
+
+def record_order_update(order, old):
+    """
+    Move `order`'s contribution from its `old` snapshot to its current state.
+    Order.date is auto_now, so an update can also move the order to another day.
+    """
+    old_date, old_total, old_crew_id, old_status = old
+    new_date, new_total, new_crew_id, new_status = snapshot(order)
+    if (old_date, old_total) != (new_date, new_total):
+        _record_sale(order, -1, old_date, old_total)
+        _record_sale(order, 1, new_date, new_total)
+    if (old_date, old_crew_id) == (new_date, new_crew_id):
+        _record_crew(new_crew_id, new_date, delivered=int(new_status) - int(old_status))
+    else:
+        _record_crew(old_crew_id, old_date, assigned=-1, delivered=-int(old_status))
+        _record_crew(new_crew_id, new_date, assigned=1, delivered=int(new_status))
+    values = {'open_order_id': _open_order_id(order.user_id)} if old_status != new_status else {}
+    if old_date != new_date:
+        values['last_order_date'] = _last_order_date(order.user_id)
+    _update_summary(order.user_id, spend=new_total - old_total, **values)
+
+
+def record_orders_update(updates):
+    """
+    record_order_update() for a bulk UPDATE of crew and status, which keeps
+    each order's date and total. `updates` holds (user_id, old, new)
+    snapshots. Crew counters are adjusted once per crew and day, open orders
+    once per user.
+    """
+    crews, users = {}, set()
+    for user_id, (day, _, old_crew_id, old_status), (_, _, new_crew_id, new_status) in updates:
+        if old_crew_id == new_crew_id:
+            counts = crews.setdefault((new_crew_id, day), [0, 0])
+            counts[1] += int(new_status) - int(old_status)
+        else:
+            counts = crews.setdefault((old_crew_id, day), [0, 0])
+            counts[0] -= 1
+            counts[1] -= int(old_status)
+            counts = crews.setdefault((new_crew_id, day), [0, 0])
+            counts[0] += 1
+            counts[1] += int(new_status)
+        if old_status != new_status:
+            users.add(user_id)
+    for (crew_id, day), (assigned, delivered) in crews.items():
+        _record_crew(crew_id, day, assigned=assigned, delivered=delivered)
+    for user_id in users:
+        _update_summary(user_id, open_order_id=_open_order_id(user_id))
+
+
+def record_order_delete(order):
+    """Remove an order's contribution to the rollups; call after deleting it."""
+    _record_sale(order, -1, order.date, order.total)
+    _record_crew(order.delivery_crew_id, order.date, assigned=-1, delivered=-int(order.status))
+    values = {}
+    last_date = models.UserOrderSummary.objects.filter(user_id=order.user_id).values_list(
+        'last_order_date', flat=True).first()
+    if last_date == order.date:
+        # it may have been the only order of that day
+        values['last_order_date'] = _last_order_date(order.user_id)
+    _update_summary(order.user_id, count=-1, spend=-order.total,
+                    open_order_id=_open_order_id(order.user_id), **values)
+
+
+def _merged(*sources, keys, sums):
+    """Add up aggregate rows from several tables that share `keys`."""
+    merged = {}
+    for rows in sources:
+        for row in rows:
+            key = tuple(row[k] for k in keys)
+            if key in merged:
+                for field in sums:
+                    merged[key][field] += row[field] or 0
+            else:
+                merged[key] = dict(row)
+    return merged.values()
+
+
+def rebuild(start, end):
+    """Recompute every rollup row dated within [start, end] from the live and archived orders."""
+    orders = models.Order.objects.filter(date__range=(start, end))
+    archived = models.ArchivedOrder.objects.filter(date__range=(start, end), deleted=False)
+    with transaction.atomic():
+        models.DailySales.objects.filter(date__range=(start, end)).delete()
+        models.MenuItemSales.objects.filter(date__range=(start, end)).delete()
+        models.CrewDeliveryStats.objects.filter(date__range=(start, end)).delete()
+
+        sales = _merged(
+            (orders.filter(orderitem__isnull=False)
+             .values('date', category_id=F('orderitem__menuitem__category_id'))
+             .annotate(n_orders=Count('id'), n_items=Sum('orderitem__quantity'), total=Sum('total'))),
+            (archived.filter(menuitem__isnull=False)
+             .values('date', category_id=F('menuitem__category_id'))
+             .annotate(n_orders=Count('id'), n_items=Sum('quantity'), total=Sum('total'))),
+            keys=('date', 'category_id'), sums=('n_orders', 'n_items', 'total'))
+        models.DailySales.objects.bulk_create(
+            models.DailySales(date=row['date'], category_id=row['category_id'], orders=row['n_orders'],
+                              items_sold=row['n_items'], revenue=row['total'])
+            for row in sales
+        )
+
+        items = _merged(
+            (orders.filter(orderitem__isnull=False)
+             .values('date', menu_id=F('orderitem__menuitem_id'))
+             .annotate(n_items=Sum('orderitem__quantity'), total=Sum('orderitem__price'))),
+            (archived.filter(menuitem__isnull=False)
+             .values('date', menu_id=F('menuitem_id'))
+             .annotate(n_items=Sum('quantity'), total=Sum('price'))),
+            keys=('date', 'menu_id'), sums=('n_items', 'total'))
+        models.MenuItemSales.objects.bulk_create(
+            models.MenuItemSales(date=row['date'], menuitem_id=row['menu_id'],
+                                 quantity=row['n_items'], revenue=row['total'])
+            for row in items
+        )
+
+        crews = _merged(*(
+            (source.filter(delivery_crew__isnull=False)
+             .values('date', 'delivery_crew_id')
+             .annotate(n_assigned=Count('id'), n_delivered=Count('id', filter=Q(status=True))))
+            for source in (orders, archived)),
+            keys=('date', 'delivery_crew_id'), sums=('n_assigned', 'n_delivered'))
+        models.CrewDeliveryStats.objects.bulk_create(
+            models.CrewDeliveryStats(date=row['date'], delivery_crew_id=row['delivery_crew_id'],
+                                     assigned=row['n_assigned'], delivered=row['n_delivered'])
+            for row in crews
+        )
+
+
+def parse_date_range(params, default_days=30, max_days=366):
+    """
+    Read `from`/`to` (YYYY-MM-DD) from query params.
+    Returns (start, end) or raises ValueError with a client-facing message.
+    """
+    today = datetime.date.today()
+    try:
+        end = datetime.date.fromisoformat(params.get('to')) if params.get('to') else today
+        start = (datetime.date.fromisoformat(params.get('from')) if params.get('from')
+                 else end - datetime.timedelta(days=default_days - 1))
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format.')
+    if start > end:
+        raise ValueError('"from" must not be after "to".')
+    if (end - start).days >= max_days:
+        raise ValueError(f'Date range is limited to {max_days} days.')
+    return start, end
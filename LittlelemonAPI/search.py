@@ -0,0 +1,186 @@
+"""
+Menu search.
+
+Ranked full-text matching over menu item name, description and category title
+uses an SQLite FTS5 table when the database has one (see migration
+0008_menu_search). An in-process trigram index gives typo-tolerant matching
+when FTS5 is unavailable or finds nothing, and serves the suggest endpoint
+without touching the database. The trigram index is derived from the catalog
+snapshot (catalog.py) and the FTS table is kept current by the MenuItem and
+Category signals in signals.py.
+"""
+import bisect
+import re
+from collections import defaultdict
+
+from django.db import connection
+
+from . import batches, catalog, models
+
+FTS_TABLE = 'LittlelemonAPI_menusearch'
+
+# bm25 weights for the name, description and category columns
+FTS_WEIGHTS = (10.0, 1.0, 5.0)
+# trigram weights for the same fields, and the share of query trigrams a field must contain to match
+TRIGRAM_WEIGHTS = (3.0, 1.0, 2.0)
+TRIGRAM_MIN_SIMILARITY = 0.5
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def trigrams(text):
+    grams = set()
+    for token in tokenize(text):
+        padded = f'  {token} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Immutable trigram and prefix index over (id, name, description, category) rows."""
+
+    def __init__(self, rows):
+        self.names = {}
+        self.fields = {}
+        self.postings = defaultdict(set)
+        prefixes = []
+        for item_id, name, description, category in rows:
+            self.names[item_id] = name
+            grams = tuple(trigrams(text or '') for text in (name, description, category))
+            self.fields[item_id] = grams
+            for gram in set().union(*grams):
+                self.postings[gram].add(item_id)
+            lowered = name.lower()
+            prefixes.append((lowered, item_id))
+            prefixes.extend((token, item_id) for token in tokenize(name) if token != lowered)
+        self.prefixes = sorted(prefixes)
+
+    def search(self, query, limit):
+        wanted = trigrams(query)
+        if not wanted:
+            return []
+        candidates = set()
+        for gram in wanted:
+            candidates |= self.postings.get(gram, set())
+        scored = []
+        for item_id in candidates:
+            similarities = [len(wanted & grams) / len(wanted) for grams in self.fields[item_id]]
+            if max(similarities) >= TRIGRAM_MIN_SIMILARITY:
+                score = sum(w * sim for w, sim in zip(TRIGRAM_WEIGHTS, similarities))
+                scored.append((-score, self.names[item_id], item_id))
+        return [item_id for _, _, item_id in sorted(scored)[:limit]]
+
+    def suggest(self, prefix, limit):
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        found = {}
+        start = bisect.bisect_left(self.prefixes, (prefix,))
+        for token, item_id in self.prefixes[start:]:
+            if not token.startswith(prefix):
+                break
+            found.setdefault(item_id, self.names[item_id])
+        # names that start with the prefix come before names where only a later word does
+        ranked = sorted(found.items(), key=lambda item: (not item[1].lower().startswith(prefix), item[1]))
+        return ranked[:limit]
+
+
+def _build_index(snapshot):
+    return TrigramIndex(
+        (item.id, item.name, item.description,
+         snapshot.categories[item.category_id].title if item.category_id in snapshot.categories else '')
+        for item in snapshot.items.values()
+    )
+
+
+def get_index():
+    return catalog.get_catalog().derived('search', _build_index)
+
+
+_fts_tables = {}
+
+
+def fts_available():
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[name]
+
+
+def _fts_query(query):
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    # every token must match, the last one as a prefix for search-as-you-type
+    return ' '.join(f'"{token}"' for token in tokens[:-1]) + f' "{tokens[-1]}"*'
+
+
+def search_ids(query, limit=None):
+    """Menu item ids matching `query`, best match first; all of them unless `limit` is given."""
+    if fts_available():
+        match = _fts_query(query)
+        if match is None:
+            return []
+        with connection.cursor() as cursor:
+            # SQLite reads a negative LIMIT as no limit
+            cursor.execute(
+                f'SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s '
+                f'ORDER BY bm25("{FTS_TABLE}", %s, %s, %s) LIMIT %s',
+                [match, *FTS_WEIGHTS, -1 if limit is None else limit],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        if ids:
+            return ids
+    return get_index().search(query, limit)
+
+
+def suggest(prefix, limit=10):
+    """(id, name) pairs of menu items with a word starting with `prefix`."""
+    return get_index().suggest(prefix, limit)
+
+
+def index_menuitem(item):
+    if fts_available():
+        category = models.Category.objects.filter(pk=item.category_id).values_list('title', flat=True).first()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s', [item.pk])
+            cursor.execute(
+                f'INSERT INTO "{FTS_TABLE}" (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                [item.pk, item.name, item.description, category or ''],
+            )
+
+
+def remove_menuitem(item_id):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s', [item_id])
+
+
+def index_category(category):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE "{FTS_TABLE}" SET category = %s WHERE rowid IN '
+                f'(SELECT id FROM "{models.MenuItem._meta.db_table}" WHERE category_id = %s)',
+                [category.title, category.pk],
+            )
+
+
+def rebuild():
+    """Repopulate the FTS table from the menu and drop the in-process indexes."""
+    if fts_available():
+        rows = models.MenuItem.objects.values_list('id', 'name', 'description', 'category__title')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{FTS_TABLE}"')
+            cursor.executemany(
+                f'INSERT INTO "{FTS_TABLE}" (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+                ((pk, name, description, category or '')
+                 for pk, name, description, category in batches.iterate(rows)),
+            )
+    catalog.invalidate()
@@ -1,14 +1,116 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.password_validation import validate_password
-from . import models
+from django.core.exceptions import FieldDoesNotExist
+from . import images, models
 
-class GroupSerializer(serializers.ModelSerializer):    
+
+def _param_set(value):
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def _nested(names, prefix):
+    return {name[len(prefix) + 1:] for name in names if name.startswith(prefix + '.')}
+
+
+class DynamicFieldsMixin:
+    """
+    Lets clients shape the payload with ?fields= and ?expand=.
+
+    fields: comma-separated field names to return. `menuitem.name` returns only
+            `name` inside the nested `menuitem`.
+    expand: nested objects to embed.
+
+    Once either parameter is given, nested objects that are not expanded are
+    returned as their primary key. Without them the full payload is returned.
+    The query parameters only shape the output of safe (read) requests: a
+    serializer that validates and saves input keeps all of its fields, so
+    ?fields= on a POST or PATCH cannot drop the values being written.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if fields is None and expand is None and request is not None and request.method in SAFE_METHODS:
+            fields = _param_set(request.query_params.get('fields'))
+            expand = _param_set(request.query_params.get('expand'))
+        if fields is not None or expand is not None:
+            self.apply_shape(fields, expand or set())
+
+    def apply_shape(self, fields, expand):
+        top = None if fields is None else {name.split('.', 1)[0] for name in fields}
+        for name, field in list(self.fields.items()):
+            if field.write_only:
+                continue
+            if top is not None and name not in top:
+                self.fields.pop(name)
+                continue
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if not isinstance(nested, DynamicFieldsMixin):
+                continue
+            sub_fields = _nested(fields or (), name)
+            if name in expand or sub_fields:
+                nested.apply_shape(sub_fields or None, _nested(expand, name))
+            else:
+                source = {} if field.source == name else {'source': field.source}
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, many=many, **source)
+
+
+def _query_plan(serializer, model, prefix=''):
+    """Columns, joins and prefetches needed to render `serializer` for `model`, or None for all columns."""
+    only, related, prefetch = [prefix + model._meta.pk.name], [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        path = prefix + field.source
+        if model_field.many_to_many or model_field.one_to_many:
+            prefetch.append(path)
+        elif isinstance(field, DynamicFieldsMixin):
+            only.append(path)
+            related.append(path)
+            plan = _query_plan(field, model_field.related_model, path + '__')
+            if plan is None:
+                return None
+            only.extend(plan[0])
+            related.extend(plan[1])
+            prefetch.extend(plan[2])
+        else:
+            only.append(path)
+    return only, related, prefetch
+
+
+def shape_queryset(queryset, serializer_class, request):
+    """
+    Prune `queryset` to what `serializer_class` will render for this request:
+    only the selected columns, a join per embedded object and a prefetch per
+    embedded list. Use it for reads only, since deferred columns are not saved.
+    """
+    serializer = serializer_class(context={'request': request})
+    plan = _query_plan(serializer, queryset.model)
+    if plan is None:
+        return queryset
+    only, related, prefetch = plan
+    if related:
+        queryset = queryset.select_related(*related)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*only)
+
+class GroupSerializer(DynamicFieldsMixin, serializers.ModelSerializer):    
     class Meta:
         model = Group
         fields = ['name',]
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     groups = GroupSerializer(read_only=True, many=True)
     class Meta:
         model = User
@@ -17,20 +119,28 @@ class UserSerializer(serializers.ModelSerializer):
         # depth = 1
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Category
         fields = ['id', 'slug', 'title']
         
-class MenuItemSerializer(serializers.ModelSerializer):
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of the resized copies of the image, empty until they have been generated."""
+    def to_representation(self, value):
+        return images.variant_urls(value, self.context.get('request'))
+
+
+class MenuItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True)
+    image_variants = ImageVariantsField()
     class Meta:
         model = models.MenuItem
-        fields = ['id', 'name', 'price', 'description', 'featured', 'category', 'category_id', 'image']
+        fields = ['id', 'name', 'price', 'description', 'featured', 'category', 'category_id', 'image',
+                  'image_variants']
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # price = serializers.SerializerMethodField(method_name = 'calculate_price')
     # unit_price = serializers.SerializerMethodField(method_name = 'menuitem_price')
     menuitem = MenuItemSerializer(read_only=True)
@@ -42,7 +152,45 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['user', 'user_id', 'menuitem', 'menuitem_id', 'quantity', 'unit_price', 'price']
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class CartBatchItemSerializer(serializers.Serializer):
+    menuitem = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, max_value=32767)
+
+
+class OrderBulkUpdateSerializer(serializers.Serializer):
+    orders = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    delivery_crew = serializers.IntegerField(allow_null=True, required=False)
+    status = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if 'delivery_crew' not in attrs and 'status' not in attrs:
+            raise serializers.ValidationError("Set delivery_crew, status or both.")
+        return attrs
+
+
+class UserRefField(serializers.Field):
+    """A user id (integer) or a username (string)."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (int, str)) or data == '':
+            raise serializers.ValidationError("Give a user id or a username.")
+        return data
+
+    def to_representation(self, value):
+        return value
+
+
+class GroupMembersBulkSerializer(serializers.Serializer):
+    add = serializers.ListField(child=UserRefField(), required=False, max_length=1000)
+    remove = serializers.ListField(child=UserRefField(), required=False, max_length=1000)
+
+    def validate(self, attrs):
+        if not attrs.get('add') and not attrs.get('remove'):
+            raise serializers.ValidationError("Set add, remove or both.")
+        return attrs
+
+
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # order = UserSerializer(read_only=True)
     user_id = serializers.IntegerField()
     menuitem = MenuItemSerializer(read_only=True)
@@ -51,7 +199,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = models.OrderItem
         fields = ['user_id', 'menuitem', 'menuitem_id', 'quantity', 'unit_price', 'price']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # user = UserSerializer(read_only=True)
     user_id = serializers.IntegerField(write_only=True)
     orderitem = OrderItemSerializer(read_only=True)
@@ -62,6 +210,19 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'user_id', 'delivery_crew','status', 'total', 'date', 'orderitem', 'orderitem_id',]
 
 
+class UserOrderSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = models.UserOrderSummary
+        fields = ['order_count', 'lifetime_spend', 'last_order_date', 'open_order']
+
+
+class DispatcherStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.DispatcherStatus
+        fields = ['strategy', 'queue_depth', 'crew_count', 'assigned_total', 'latency_p50', 'latency_p95',
+                  'updated_at']
+
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, validators=[validate_password])
     password_confirm = serializers.CharField(write_only=True)
@@ -90,8 +251,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'username', 'groups', 'date_joined', 'is_active']
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Booking
         fields = ['id', 'customer_name', 'email', 'phone', 'date', 'time', 'number_of_guests', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['created_at', 'updated_at']
+
+    def validate_number_of_guests(self, value):
+        if value < 1:
+            raise serializers.ValidationError("A booking needs at least one guest.")
+        return value
\ No newline at end of file
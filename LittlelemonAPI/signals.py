@@ -0,0 +1,59 @@
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog, changes, groups, images, models, search
+
+
+@receiver(post_save, sender=models.MenuItem)
+def menuitem_saved(sender, instance, **kwargs):
+    search.index_menuitem(instance)
+    catalog.invalidate()
+    if images.needs_processing(instance):
+        images.schedule(instance)
+
+
+@receiver(post_delete, sender=models.MenuItem)
+def menuitem_deleted(sender, instance, **kwargs):
+    search.remove_menuitem(instance.pk)
+    catalog.invalidate()
+
+
+@receiver(post_save, sender=models.Category)
+def category_saved(sender, instance, **kwargs):
+    search.index_category(instance)
+    catalog.invalidate()
+
+
+@receiver(post_delete, sender=models.Category)
+def category_deleted(sender, instance, **kwargs):
+    catalog.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    groups.clear()
+    transaction.on_commit(groups.membership_changed)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(post_delete, sender=User)
+def membership_changed(sender, action=None, **kwargs):
+    # m2m_changed is sent before and after each change; post_delete has no action
+    if action is None or action.startswith('post_'):
+        transaction.on_commit(groups.membership_changed)
+
+
+def record_saved(sender, instance, **kwargs):
+    changes.record(changes.KIND_BY_MODEL[sender], instance.pk, False, *changes.audience(instance))
+
+
+def record_deleted(sender, instance, **kwargs):
+    changes.record(changes.KIND_BY_MODEL[sender], instance.pk, True, *changes.audience(instance))
+
+
+for model in changes.KINDS.values():
+    post_save.connect(record_saved, sender=model, dispatch_uid=f'changes-save-{model.__name__}')
+    post_delete.connect(record_deleted, sender=model, dispatch_uid=f'changes-delete-{model.__name__}')
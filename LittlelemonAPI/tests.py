@@ -1,14 +1,39 @@
 from django.test import TestCase, Client
 from django.urls import reverse
-from django.contrib.auth.models import User, Group
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.contrib.auth.models import AnonymousUser, User, Group
+from django.http import Http404
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.authtoken.models import Token
 from rest_framework import status
 from decimal import Decimal
-from datetime import date, time, datetime
+from datetime import date, time, datetime, timedelta
+import gzip
+import importlib
 import json
-
-from .models import Category, MenuItem, Cart, Order, OrderItem, Booking
+import os
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from io import BytesIO, StringIO
+from PIL import Image as PILImage
+
+from .models import (
+    Category, MenuItem, Cart, Order, OrderItem, Booking,
+    DailySales, MenuItemSales, CrewDeliveryStats, UserOrderSummary,
+    BookingSlot, SlotOccupancy, CatalogVersion, ChangeLog, ArchivedOrder, ArchivedBooking,
+    DispatcherStatus, IdempotencyKey
+)
+from . import admin, capacity, catalog, compiled, dispatcher, groups, images, menu_index, rollups, search, shaping, views
 from .serializers import (
     CategorySerializer, MenuItemSerializer, CartSerializer,
     OrderSerializer, OrderItemSerializer, BookingSerializer,
@@ -17,21 +42,22 @@ from .serializers import (
 
 
 class ModelTestCase(TestCase):
-    def setUp(self):
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123'
         )
-        self.category = Category.objects.create(
+        cls.category = Category.objects.create(
             slug='appetizers',
             title='Appetizers'
         )
-        self.menuitem = MenuItem.objects.create(
+        cls.menuitem = MenuItem.objects.create(
             name='Greek Salad',
             price=Decimal('12.50'),
             description='Fresh vegetables with feta cheese',
-            category=self.category,
+            category=cls.category,
             featured=True
         )
 
@@ -107,21 +133,22 @@ class ModelTestCase(TestCase):
 
 
 class SerializerTestCase(TestCase):
-    def setUp(self):
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123'
         )
-        self.category = Category.objects.create(
+        cls.category = Category.objects.create(
             slug='appetizers',
             title='Appetizers'
         )
-        self.menuitem = MenuItem.objects.create(
+        cls.menuitem = MenuItem.objects.create(
             name='Greek Salad',
             price=Decimal('12.50'),
             description='Fresh vegetables with feta cheese',
-            category=self.category
+            category=cls.category
         )
 
     def test_category_serializer(self):
@@ -234,32 +261,34 @@ class CustomAuthenticationTestCase(APITestCase):
 
 
 class MenuAPITestCase(APITestCase):
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             password='testpass123',
             email='test@example.com'
         )
-        self.manager = User.objects.create_user(
+        cls.manager = User.objects.create_user(
             username='manager',
             password='managerpass123',
             email='manager@example.com'
         )
-        self.manager_group = Group.objects.create(name='Manager')
-        self.manager.groups.add(self.manager_group)
-        
-        self.category = Category.objects.create(
+        cls.manager_group = Group.objects.create(name='Manager')
+        cls.manager.groups.add(cls.manager_group)
+        cls.category = Category.objects.create(
             slug='appetizers',
             title='Appetizers'
         )
-        self.menuitem = MenuItem.objects.create(
+        cls.menuitem = MenuItem.objects.create(
             name='Greek Salad',
             price=Decimal('12.50'),
             description='Fresh vegetables with feta cheese',
-            category=self.category
+            category=cls.category
         )
 
+    def setUp(self):
+        self.client = APIClient()
+
     def test_menu_list_authenticated(self):
         token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
@@ -328,22 +357,21 @@ class MenuAPITestCase(APITestCase):
 
 
 class BookingAPITestCase(APITestCase):
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             password='testpass123',
             email='test@example.com'
         )
-        self.manager = User.objects.create_user(
+        cls.manager = User.objects.create_user(
             username='manager',
             password='managerpass123',
             email='manager@example.com'
         )
-        self.manager_group = Group.objects.create(name='Manager')
-        self.manager.groups.add(self.manager_group)
-        
-        self.booking = Booking.objects.create(
+        cls.manager_group = Group.objects.create(name='Manager')
+        cls.manager.groups.add(cls.manager_group)
+        cls.booking = Booking.objects.create(
             customer_name='testuser',
             email='test@example.com',
             phone='1234567890',
@@ -352,6 +380,9 @@ class BookingAPITestCase(APITestCase):
             number_of_guests=4
         )
 
+    def setUp(self):
+        self.client = APIClient()
+
     def test_booking_list_authenticated(self):
         token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
@@ -398,24 +429,27 @@ class BookingAPITestCase(APITestCase):
 
 
 class CartAPITestCase(APITestCase):
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             password='testpass123',
             email='test@example.com'
         )
-        self.category = Category.objects.create(
+        cls.category = Category.objects.create(
             slug='appetizers',
             title='Appetizers'
         )
-        self.menuitem = MenuItem.objects.create(
+        cls.menuitem = MenuItem.objects.create(
             name='Greek Salad',
             price=Decimal('12.50'),
             description='Fresh vegetables with feta cheese',
-            category=self.category
+            category=cls.category
         )
 
+    def setUp(self):
+        self.client = APIClient()
+
     def test_cart_create_authenticated(self):
         token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
@@ -462,29 +496,30 @@ class CartAPITestCase(APITestCase):
 
 
 class PermissionTestCase(APITestCase):
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='customer',
             password='pass123',
             email='customer@example.com'
         )
-        self.manager = User.objects.create_user(
+        cls.manager = User.objects.create_user(
             username='manager',
             password='pass123',
             email='manager@example.com'
         )
-        self.delivery_crew = User.objects.create_user(
+        cls.delivery_crew = User.objects.create_user(
             username='delivery',
             password='pass123',
             email='delivery@example.com'
         )
-        
-        self.manager_group = Group.objects.create(name='Manager')
-        self.delivery_group = Group.objects.create(name='Delivery crew')
-        
-        self.manager.groups.add(self.manager_group)
-        self.delivery_crew.groups.add(self.delivery_group)
+        cls.manager_group = Group.objects.create(name='Manager')
+        cls.delivery_group = Group.objects.create(name='Delivery crew')
+        cls.manager.groups.add(cls.manager_group)
+        cls.delivery_crew.groups.add(cls.delivery_group)
+
+    def setUp(self):
+        self.client = APIClient()
 
     def test_manager_permissions(self):
         token = Token.objects.create(user=self.manager)
@@ -510,26 +545,28 @@ class PermissionTestCase(APITestCase):
 
 
 class CategoryAPITestCase(APITestCase):
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             password='testpass123',
             email='test@example.com'
         )
-        self.manager = User.objects.create_user(
+        cls.manager = User.objects.create_user(
             username='manager',
             password='managerpass123',
             email='manager@example.com'
         )
-        self.manager_group = Group.objects.create(name='Manager')
-        self.manager.groups.add(self.manager_group)
-        
-        self.category = Category.objects.create(
+        cls.manager_group = Group.objects.create(name='Manager')
+        cls.manager.groups.add(cls.manager_group)
+        cls.category = Category.objects.create(
             slug='appetizers',
             title='Appetizers'
         )
 
+    def setUp(self):
+        self.client = APIClient()
+
     def test_category_list_authenticated(self):
         token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
@@ -561,14 +598,17 @@ class CategoryAPITestCase(APITestCase):
 
 
 class DataValidationTestCase(APITestCase):
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             password='testpass123',
             email='test@example.com'
         )
 
+    def setUp(self):
+        self.client = APIClient()
+
     def test_booking_invalid_email(self):
         token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
@@ -619,40 +659,41 @@ class DataValidationTestCase(APITestCase):
 
 
 class OrderAPITestCase(APITestCase):
-    def setUp(self):
-        self.client = APIClient()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             password='testpass123',
             email='test@example.com'
         )
-        self.manager = User.objects.create_user(
+        cls.manager = User.objects.create_user(
             username='manager',
             password='managerpass123',
             email='manager@example.com'
         )
-        self.delivery_crew = User.objects.create_user(
+        cls.delivery_crew = User.objects.create_user(
             username='delivery',
             password='deliverypass123',
             email='delivery@example.com'
         )
-        
-        self.manager_group = Group.objects.create(name='Manager')
-        self.delivery_group = Group.objects.create(name='Delivery crew')
-        self.manager.groups.add(self.manager_group)
-        self.delivery_crew.groups.add(self.delivery_group)
-        
-        self.category = Category.objects.create(
+        cls.manager_group = Group.objects.create(name='Manager')
+        cls.delivery_group = Group.objects.create(name='Delivery crew')
+        cls.manager.groups.add(cls.manager_group)
+        cls.delivery_crew.groups.add(cls.delivery_group)
+        cls.category = Category.objects.create(
             slug='appetizers',
             title='Appetizers'
         )
-        self.menuitem = MenuItem.objects.create(
+        cls.menuitem = MenuItem.objects.create(
             name='Greek Salad',
             price=Decimal('12.50'),
             description='Fresh vegetables with feta cheese',
-            category=self.category
+            category=cls.category
         )
 
+    def setUp(self):
+        self.client = APIClient()
+
     def test_order_create_from_cart(self):
         token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
@@ -688,4 +729,1517 @@ class OrderAPITestCase(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
         
         response = self.client.get('/api/orders')
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class SalesRollupTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.manager = User.objects.create_user(username='manager', password='managerpass123')
+        cls.delivery_crew = User.objects.create_user(username='delivery', password='deliverypass123')
+        Group.objects.create(name='Manager').user_set.add(cls.manager)
+        Group.objects.create(name='Delivery crew').user_set.add(cls.delivery_crew)
+        cls.category = Category.objects.create(slug='appetizers', title='Appetizers')
+        cls.menuitem = MenuItem.objects.create(
+            name='Greek Salad', price=Decimal('12.50'), category=cls.category
+        )
+        Cart.objects.create(
+            user=cls.user, menuitem=cls.menuitem, quantity=2,
+            unit_price=cls.menuitem.price, price=cls.menuitem.price * 2
+        )
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+
+    def checkout(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/orders')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Order.objects.get(user=self.user)
+
+    def test_checkout_updates_sales_rollups(self):
+        order = self.checkout()
+        sales = DailySales.objects.get(date=order.date, category=self.category)
+        self.assertEqual((sales.orders, sales.items_sold, sales.revenue), (1, 2, Decimal('25.00')))
+        item_sales = MenuItemSales.objects.get(date=order.date, menuitem=self.menuitem)
+        self.assertEqual(item_sales.quantity, 2)
+
+    def test_status_update_counts_delivery(self):
+        order = self.checkout()
+        self.client.force_authenticate(self.manager)
+        self.client.patch(f'/api/orders/{order.id}', {'delivery_crew': self.delivery_crew.id})
+        self.client.force_authenticate(self.delivery_crew)
+        self.client.patch(f'/api/orders/{order.id}', {'status': True})
+        stats = CrewDeliveryStats.objects.get(delivery_crew=self.delivery_crew)
+        self.assertEqual((stats.assigned, stats.delivered), (1, 1))
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/api/analytics/crew')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['delivered'], 1)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        order = self.checkout()
+        before = list(DailySales.objects.values('date', 'category_id', 'orders', 'items_sold', 'revenue'))
+        rollups.rebuild(order.date, order.date)
+        after = list(DailySales.objects.values('date', 'category_id', 'orders', 'items_sold', 'revenue'))
+        self.assertEqual(before, after)
+
+    def test_analytics_endpoints(self):
+        self.checkout()
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/api/analytics/sales')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['revenue'], Decimal('25.00'))
+        response = self.client.get('/api/analytics/best-sellers')
+        self.assertEqual(response.data['results'][0]['menuitem_id'], self.menuitem.id)
+        response = self.client.get('/api/analytics/sales', {'from': 'not-a-date'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_customer_order_list_with_summary(self):
+        order = self.checkout()
+        response = self.client.get('/api/orders')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary']['order_count'], 1)
+        self.assertEqual(response.data['summary']['lifetime_spend'], '25.00')
+        self.assertEqual(response.data['summary']['open_order'], order.id)
+        self.assertEqual([o['id'] for o in response.data['results']], [order.id])
+
+    def test_summary_follows_status_and_delete(self):
+        order = self.checkout()
+        self.client.force_authenticate(self.manager)
+        self.client.patch(f'/api/orders/{order.id}', {'status': True})
+        summary = UserOrderSummary.objects.get(user=self.user)
+        self.assertIsNone(summary.open_order_id)
+        self.client.delete(f'/api/orders/{order.id}')
+        summary.refresh_from_db()
+        self.assertEqual((summary.order_count, summary.lifetime_spend), (0, Decimal('0.00')))
+        self.assertIsNone(summary.last_order_date)
+
+    def test_last_order_date_follows_order_moves(self):
+        order = self.checkout()
+        Order.objects.filter(pk=order.pk).update(date=date(2020, 1, 1))
+        rollups.refresh_user_summary(self.user.id)
+        self.client.force_authenticate(self.manager)
+        # Order.date is auto_now, so the update moves the order to today
+        self.client.patch(f'/api/orders/{order.id}', {'status': True})
+        summary = UserOrderSummary.objects.get(user=self.user)
+        self.assertEqual(summary.last_order_date, Order.objects.get(pk=order.pk).date)
+        self.assertNotEqual(summary.last_order_date, date(2020, 1, 1))
+
+    def test_summary_built_on_first_access(self):
+        self.checkout()
+        UserOrderSummary.objects.all().delete()
+        response = self.client.get('/api/orders')
+        self.assertEqual(response.data['summary']['order_count'], 1)
+
+    def test_analytics_forbidden_for_customer(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/analytics/sales')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookingCapacityTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        BookingSlot.objects.create(time=time(19, 0), capacity=10)
+        BookingSlot.objects.create(time=time(20, 0), capacity=4)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def book(self, guests, at='19:00:00', day='2025-12-24'):
+        return self.client.post('/api/bookings/', {
+            'customer_name': 'testuser', 'email': 'test@example.com', 'phone': '1234567890',
+            'date': day, 'time': at, 'number_of_guests': guests,
+        })
+
+    def seats_booked(self, at=time(19, 0)):
+        return SlotOccupancy.objects.get(date=date(2025, 12, 24), time=at).seats_booked
+
+    def test_capacity_is_enforced(self):
+        self.assertEqual(self.book(6).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.book(4).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.book(1).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.seats_booked(), 10)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_update_and_delete_move_seats(self):
+        booking_id = self.book(6).data['id']
+        response = self.client.patch(f'/api/bookings/{booking_id}/', {'time': '20:00:00'})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.seats_booked(), 6)
+        response = self.client.patch(f'/api/bookings/{booking_id}/', {'number_of_guests': 8})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.seats_booked(), 8)
+        self.client.delete(f'/api/bookings/{booking_id}/')
+        self.assertEqual(self.seats_booked(), 0)
+
+    def test_availability(self):
+        self.book(2, at='20:00:00')
+        response = self.client.get('/api/bookings/availability/', {'date': '2025-12-24', 'guests': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([slot['seats_left'] for slot in response.data['slots']], [10])
+        response = self.client.get('/api/bookings/availability/', {'date': 'tomorrow'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unconfigured_times_are_not_bookable(self):
+        response = self.book(2, at='18:00:00')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Booking.objects.exists())
+
+    @override_settings(BOOKING_DEFAULT_SLOT_CAPACITY=5)
+    def test_default_capacity_without_configured_slots(self):
+        BookingSlot.objects.all().delete()
+        self.assertEqual(self.book(2, at='18:00:00').status_code, status.HTTP_201_CREATED)
+        response = self.client.get('/api/bookings/availability/', {'date': '2025-12-24', 'guests': 3})
+        self.assertEqual(response.data['slots'], [{'time': time(18, 0), 'capacity': 5, 'seats_left': 3}])
+        self.assertEqual(self.book(4, at='18:00:00').status_code, status.HTTP_409_CONFLICT)
+
+    def test_rebuild_matches_incremental(self):
+        self.book(6)
+        self.book(3, at='20:00:00')
+        before = set(SlotOccupancy.objects.values_list('date', 'time', 'seats_booked'))
+        capacity.rebuild()
+        self.assertEqual(set(SlotOccupancy.objects.values_list('date', 'time', 'seats_booked')), before)
+
+
+class BatchAPITestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.category = Category.objects.create(slug='appetizers', title='Appetizers')
+        cls.salad = MenuItem.objects.create(name='Greek Salad', price=Decimal('12.50'), category=cls.category)
+        cls.bruschetta = MenuItem.objects.create(name='Bruschetta', price=Decimal('8.95'), category=cls.category)
+        BookingSlot.objects.create(time=time(19, 0), capacity=10)
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def booking(self, guests, name='Guest'):
+        return {'customer_name': name, 'email': 'guest@example.com', 'phone': '1234567890',
+                'date': '2025-12-24', 'time': '19:00:00', 'number_of_guests': guests}
+
+    def test_atomic_booking_batch(self):
+        response = self.client.post('/api/bookings/batch/', {
+            'bookings': [self.booking(4), self.booking(4)]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.filter(customer_name='testuser').count(), 2)
+
+        response = self.client.post('/api/bookings/batch/', {
+            'bookings': [self.booking(1), self.booking(2)]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(SlotOccupancy.objects.get().seats_booked, 8)
+
+    def test_partial_booking_batch(self):
+        response = self.client.post('/api/bookings/batch/', {
+            'mode': 'partial',
+            'bookings': [self.booking(6), self.booking(0), self.booking(6), self.booking(4)]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 400, 409, 201])
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_cart_batch(self):
+        response = self.client.post('/api/cart/menu-items/batch', {'items': [
+            {'menuitem': self.salad.id, 'quantity': 2},
+            {'menuitem': self.bruschetta.id, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Cart.objects.get(menuitem=self.salad).price, Decimal('25.00'))
+
+        response = self.client.post('/api/cart/menu-items/batch', {'items': [
+            {'menuitem': self.salad.id, 'quantity': 3},
+            {'menuitem': self.bruschetta.id, 'quantity': 0},
+        ]}, format='json')
+        self.assertEqual([r['result'] for r in response.data['results']], ['updated', 'removed'])
+        self.assertEqual(list(Cart.objects.values_list('menuitem_id', 'quantity')), [(self.salad.id, 3)])
+
+        response = self.client.get('/api/cart/menu-items')
+        self.assertEqual(len(response.data), 1)
+
+    def test_batches_reject_bodies_that_are_not_objects(self):
+        response = self.client.post('/api/cart/menu-items/batch',
+                                    [{'menuitem': self.salad.id, 'quantity': 2}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('message', response.data)
+        response = self.client.post('/api/bookings/batch/', [self.booking(4)], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('message', response.data)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(Booking.objects.exists())
+
+    def test_cart_batch_is_all_or_nothing(self):
+        response = self.client.post('/api/cart/menu-items/batch', {'items': [
+            {'menuitem': self.salad.id, 'quantity': 2},
+            {'menuitem': 9999, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_cart_batch_rejects_lines_priced_beyond_the_column(self):
+        # 799 * 12.50 = 9987.50 fits in max_digits=6; 800 * 12.50 = 10000.00 does not
+        response = self.client.post('/api/cart/menu-items/batch', {'items': [
+            {'menuitem': self.salad.id, 'quantity': 800},
+            {'menuitem': self.bruschetta.id, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('quantity', response.data[0])
+        self.assertEqual(response.data[1], {})
+        self.assertFalse(Cart.objects.exists())
+        response = self.client.post('/api/cart/menu-items/batch', {'items': [
+            {'menuitem': self.salad.id, 'quantity': 799},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_checkout_creates_order_per_cart_line(self):
+        self.client.post('/api/cart/menu-items/batch', {'items': [
+            {'menuitem': self.salad.id, 'quantity': 2},
+            {'menuitem': self.bruschetta.id, 'quantity': 1},
+        ]}, format='json')
+        response = self.client.post('/api/orders')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(Cart.objects.exists())
+
+
+class SparseFieldsTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.category = Category.objects.create(slug='appetizers', title='Appetizers')
+        cls.menuitem = MenuItem.objects.create(
+            name='Greek Salad', price=Decimal('12.50'), description='Fresh vegetables', category=cls.category
+        )
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fields_prunes_payload_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/menu/', {'fields': 'id,name'})
+        self.assertEqual(response.data['results'], [{'id': self.menuitem.id, 'name': 'Greek Salad'}])
+        menu_sql = [q['sql'] for q in queries if 'LittlelemonAPI_menuitem' in q['sql']][-1]
+        self.assertNotIn('description', menu_sql)
+
+    def test_unexpanded_relation_is_primary_key(self):
+        catalog.get_catalog()  # the menu list index is built from the catalog, which reads categories
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/menu/', {'fields': 'id,category'})
+        self.assertEqual(response.data['results'][0]['category'], self.category.id)
+        self.assertFalse(any('LittlelemonAPI_category' in q['sql'] for q in queries))
+
+    def test_expand_and_nested_fields(self):
+        response = self.client.get(f'/api/menu/{self.menuitem.id}/', {'fields': 'name,category.title'})
+        self.assertEqual(response.data, {'name': 'Greek Salad', 'category': {'title': 'Appetizers'}})
+        response = self.client.get('/api/menu/', {'expand': 'category'})
+        self.assertEqual(response.data['results'][0]['category']['slug'], 'appetizers')
+        self.assertIn('description', response.data['results'][0])
+
+    def test_order_list_nested_fields(self):
+        orderitem = OrderItem.objects.create(
+            user=self.user, menuitem=self.menuitem, quantity=1, unit_price=Decimal('12.50'), price=Decimal('12.50')
+        )
+        order = Order.objects.create(user=self.user, total=Decimal('12.50'), orderitem=orderitem)
+        response = self.client.get('/api/orders', {'fields': 'id,orderitem.menuitem.name'})
+        self.assertEqual(response.data['results'], [{'id': order.id, 'orderitem': {'menuitem': {'name': 'Greek Salad'}}}])
+
+    def test_fields_do_not_drop_written_values(self):
+        manager = User.objects.create_user(username='manager', password='testpass123')
+        manager.groups.add(Group.objects.create(name='Manager'))
+        self.client.force_authenticate(manager)
+        response = self.client.patch(f'/api/menu/{self.menuitem.id}/?fields=id', {'name': 'Horiatiki'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.menuitem.refresh_from_db()
+        self.assertEqual(self.menuitem.name, 'Horiatiki')
+        response = self.client.post('/api/menu/?fields=id', {
+            'name': 'Bruschetta', 'price': '8.95', 'description': 'Toasted bread', 'category_id': self.category.id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(MenuItem.objects.get(name='Bruschetta').price, Decimal('8.95'))
+
+    def test_full_payload_without_parameters(self):
+        response = self.client.get('/api/menu/')
+        self.assertEqual(response.data['results'][0]['category']['title'], 'Appetizers')
+        self.assertIn('description', response.data['results'][0])
+
+
+class MenuSearchTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.salads = Category.objects.create(slug='salads', title='Salads')
+        cls.desserts = Category.objects.create(slug='desserts', title='Desserts')
+        cls.greek = MenuItem.objects.create(
+            name='Greek Salad', price=Decimal('12.50'), description='Feta and olives', category=cls.salads
+        )
+        cls.lemon = MenuItem.objects.create(
+            name='Lemon Dessert', price=Decimal('6.99'), description='Cake with a greek yogurt cream',
+            category=cls.desserts
+        )
+
+    def setUp(self):
+        catalog.invalidate()  # drop a snapshot of menu changes an earlier test rolled back
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get('/api/menu/', {'search': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in response.data['results']]
+
+    def test_ranked_search(self):
+        # a name match ranks above a description match
+        self.assertEqual(self.search('greek'), ['Greek Salad', 'Lemon Dessert'])
+        self.assertEqual(self.search('desserts'), ['Lemon Dessert'])
+
+    def test_search_pages_through_every_match(self):
+        MenuItem.objects.bulk_create(
+            MenuItem(name=f'Salad {i}', price=Decimal('5.00'), category=self.salads) for i in range(120))
+        for item in MenuItem.objects.filter(name__startswith='Salad '):
+            search.index_menuitem(item)  # bulk_create skips the signals
+        catalog.invalidate()
+        response = self.client.get('/api/menu/', {'search': 'salad', 'page': 13})
+        self.assertEqual(response.data['count'], 121)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_prefix_and_typo_tolerance(self):
+        self.assertEqual(self.search('lem'), ['Lemon Dessert'])
+        self.assertEqual(self.search('grek salad'), ['Greek Salad'])
+        self.assertEqual(self.search('pizza'), [])
+
+    def test_index_follows_changes(self):
+        self.greek.name = 'Village Salad'
+        self.greek.save()
+        self.assertEqual(self.search('village'), ['Village Salad'])
+        self.desserts.title = 'Sweets'
+        self.desserts.save()
+        self.assertEqual(self.search('sweets'), ['Lemon Dessert'])
+        self.lemon.delete()
+        self.assertEqual(self.search('sweets'), [])
+
+    def test_trigram_index(self):
+        index = search.TrigramIndex([
+            (1, 'Greek Salad', 'Feta and olives', 'Salads'),
+            (2, 'Lemon Dessert', 'Cake', 'Desserts'),
+        ])
+        self.assertEqual(index.search('desert', 10), [2])
+        self.assertEqual(index.search('grek', 10), [1])
+        self.assertEqual(index.suggest('sal', 10), [(1, 'Greek Salad')])
+
+    def test_suggest(self):
+        response = self.client.get('/api/menu/suggest/', {'q': 'le'})
+        self.assertEqual(response.data, [{'id': self.lemon.id, 'name': 'Lemon Dessert'}])
+
+    def test_legacy_menuitems_search(self):
+        response = self.client.get('/api/menu-items', {'search': 'greek', 'perpage': 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({item['name'] for item in response.data}, {'Greek Salad', 'Lemon Dessert'})
+
+
+class CatalogTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.category = Category.objects.create(slug='salads', title='Salads')
+        cls.menuitem = MenuItem.objects.create(
+            name='Greek Salad', price=Decimal('12.50'), category=cls.category, featured=True
+        )
+
+    def setUp(self):
+        catalog.invalidate()  # drop a snapshot of menu changes an earlier test rolled back
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+
+    def test_snapshot_indexes(self):
+        menu = catalog.get_catalog()
+        self.assertEqual(menu.price(self.menuitem.id), Decimal('12.50'))
+        self.assertEqual(menu.by_category[self.category.id], (self.menuitem.id,))
+        self.assertIn(self.menuitem.id, menu.featured)
+        self.assertIsNone(menu.price(9999))
+
+    def test_snapshot_is_reused_until_a_change(self):
+        menu = catalog.get_catalog()
+        with self.assertNumQueries(0):
+            self.assertIs(catalog.get_catalog(), menu)
+        self.menuitem.price = Decimal('13.00')
+        self.menuitem.save()
+        self.assertEqual(catalog.get_catalog().price(self.menuitem.id), Decimal('13.00'))
+
+    def test_change_from_another_process_is_picked_up(self):
+        menu = catalog.get_catalog()
+        # another worker changed the menu: it wrote the row and replaced the stamp
+        MenuItem.objects.filter(pk=self.menuitem.pk).update(price=Decimal('14.00'))
+        CatalogVersion.objects.filter(pk=1).update(version='changed-elsewhere')
+        self.assertIs(catalog.get_catalog(), menu)
+        with self.settings(CATALOG_MAX_STALENESS=0):
+            catalog._recheck()
+            self.assertEqual(catalog.get_catalog().price(self.menuitem.id), Decimal('14.00'))
+
+    def test_cart_is_priced_from_catalog(self):
+        catalog.get_catalog()
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/cart/menu-items', {'menuitem': self.menuitem.id, 'quantity': 2})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(any('FROM "LittlelemonAPI_menuitem"' in q['sql'] for q in queries))
+        self.assertEqual(Cart.objects.get().price, Decimal('25.00'))
+        response = self.client.post('/api/cart/menu-items', {'menuitem': 9999, 'quantity': 1})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MenuIndexTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.salads = Category.objects.create(slug='salads', title='Salads')
+        cls.desserts = Category.objects.create(slug='desserts', title='Desserts')
+        for name, price, category, featured in [
+            ('Greek Salad', '12.50', cls.salads, True),
+            ('Caesar Salad', '11.00', cls.salads, False),
+            ('Lemon Dessert', '6.99', cls.desserts, True),
+            ('Baklava', '6.99', cls.desserts, False),
+        ]:
+            MenuItem.objects.create(name=name, price=Decimal(price), category=category, featured=featured)
+
+    def setUp(self):
+        catalog.invalidate()  # drop a snapshot of menu changes an earlier test rolled back
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, params, expect_sql_ordering=False):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/menu/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ordered_in_sql = any('ORDER BY' in q['sql'] and 'LittlelemonAPI_menuitem' in q['sql'] for q in queries)
+        self.assertEqual(ordered_in_sql, expect_sql_ordering)
+        return [item['name'] for item in response.data['results']], response.data['count']
+
+    def test_filters_and_orderings_from_index(self):
+        catalog.get_catalog()
+        self.assertEqual(self.names({}), (['Baklava', 'Caesar Salad', 'Greek Salad', 'Lemon Dessert'], 4))
+        self.assertEqual(self.names({'category': self.salads.id, 'ordering': '-price'}),
+                         (['Greek Salad', 'Caesar Salad'], 2))
+        self.assertEqual(self.names({'featured': 'true', 'ordering': 'price'}), (['Lemon Dessert', 'Greek Salad'], 2))
+        self.assertEqual(self.names({'price': '6.99', 'featured': 'false'}), (['Baklava'], 1))
+        self.assertEqual(self.names({'page_size': 1, 'page': 2}), (['Caesar Salad'], 4))
+
+    def test_unsupported_combinations_use_sql(self):
+        catalog.get_catalog()
+        self.assertEqual(self.names({'ordering': 'name,price'}, expect_sql_ordering=True)[1], 4)
+        response = self.client.get('/api/menu/', {'category': 9999})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_matches_sql(self):
+        index = menu_index.get_index()
+        for ordering in ['name', '-name', 'price', '-price']:
+            tie_break = '-id' if ordering.startswith('-') else 'id'
+            expected = list(MenuItem.objects.filter(category=self.desserts)
+                            .order_by(ordering, tie_break).values_list('id', flat=True))
+            self.assertEqual(list(index.query(ordering, category=self.desserts.id)), expected)
+        result = index.query('-name', featured=False)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[1:5], [MenuItem.objects.get(name='Baklava').id])
+
+
+class PriceRangeTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='testpass123')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        for name, price in [('Bruschetta', '5.00'), ('Greek Salad', '12.50'), ('Pasta', '15.00'), ('Lobster', '40.00')]:
+            MenuItem.objects.create(name=name, price=Decimal(price), category=cls.category)
+
+    def setUp(self):
+        catalog.invalidate()  # drop a snapshot of menu changes an earlier test rolled back
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_menu_price_range_from_index_and_sql(self):
+        catalog.get_catalog()
+        params = {'from_price': '10', 'to_price': '15'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/menu/', params)
+        self.assertEqual([item['name'] for item in response.data['results']], ['Greek Salad', 'Pasta'])
+        self.assertFalse(any('ORDER BY' in q['sql'] and 'menuitem' in q['sql'] for q in queries))
+        response = self.client.get('/api/menu/', {**params, 'search': 'pasta'})
+        self.assertEqual([item['name'] for item in response.data['results']], ['Pasta'])
+
+    def test_invalid_ranges_are_rejected(self):
+        for params in [{'to_price': 'cheap'}, {'from_price': '-1'}, {'from_price': 'nan'},
+                       {'from_price': '20', 'to_price': '10'}]:
+            self.assertEqual(self.client.get('/api/menu/', params).status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(self.client.get('/api/menu-items', params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_menu_items_and_orders_ranges(self):
+        response = self.client.get('/api/menu-items', {'from_price': '12.50', 'to_price': '40', 'perpage': 10})
+        self.assertEqual([item['name'] for item in response.data], ['Greek Salad', 'Pasta', 'Lobster'])
+        for total in ['8.00', '20.00', '30.00']:
+            Order.objects.create(user=self.manager, total=Decimal(total))
+        response = self.client.get('/api/orders', {'from_price': '10', 'perpage': 10})
+        self.assertEqual(sorted(order['total'] for order in response.data), ['20.00', '30.00'])
+
+    def test_price_histogram(self):
+        response = self.client.get('/api/menu/price-histogram/', {'buckets': 2, 'from_price': '0', 'to_price': '20'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([(b['from'], b['to'], b['count']) for b in response.data['buckets']],
+                         [(Decimal('0'), Decimal('10.00'), 1), (Decimal('10.00'), Decimal('20.00'), 2)])
+        response = self.client.get('/api/menu/price-histogram/', {'buckets': 7})
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(response.data['buckets'][-1]['count'], 1)
+        self.assertEqual(self.client.get('/api/menu/price-histogram/', {'search': 'x'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+
+class MenuFacetsTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.salads = Category.objects.create(slug='salads', title='Salads')
+        cls.desserts = Category.objects.create(slug='desserts', title='Desserts')
+        for name, price, category, featured in [
+            ('Greek Salad', '10.00', cls.salads, True),
+            ('Caesar Salad', '12.00', cls.salads, False),
+            ('Lemon Dessert', '5.00', cls.desserts, True),
+            ('Baklava', '15.00', cls.desserts, False),
+        ]:
+            MenuItem.objects.create(name=name, price=Decimal(price), category=category, featured=featured)
+
+    def setUp(self):
+        catalog.invalidate()  # drop a snapshot of menu changes an earlier test rolled back
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_facets_exclude_their_own_filter(self):
+        catalog.get_catalog()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/menu/', {'facets': 'true', 'category': self.salads.id})
+        self.assertEqual(response.data['count'], 2)
+        facets = response.data['facets']
+        self.assertEqual([(c['title'], c['count']) for c in facets['category']], [('Salads', 2), ('Desserts', 2)])
+        self.assertEqual(facets['featured'], {'true': 1, 'false': 1})
+        self.assertEqual([band['count'] for band in facets['price']], [0, 0, 1, 1, 0])
+        self.assertEqual((facets['price'][0]['from'], facets['price'][-1]['to']), (Decimal('5.00'), Decimal('15.00')))
+
+    def test_facets_follow_search_and_menu_changes(self):
+        response = self.client.get('/api/menu/', {'facets': 'true', 'search': 'salad'})
+        self.assertEqual([(c['title'], c['count']) for c in response.data['facets']['category']], [('Salads', 2)])
+        MenuItem.objects.create(name='Fruit Salad', price=Decimal('7.00'), category=self.desserts)
+        response = self.client.get('/api/menu/', {'facets': 'true', 'search': 'salad'})
+        self.assertEqual([(c['title'], c['count']) for c in response.data['facets']['category']],
+                         [('Salads', 2), ('Desserts', 1)])
+        self.assertNotIn('facets', self.client.get('/api/menu/').data)
+
+
+class QueryShapeTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='testpass123')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        category = Category.objects.create(slug='mains', title='Mains')
+        for name, price in [('Pasta', '15.00'), ('Bruschetta', '5.00'), ('Greek Salad', '12.50')]:
+            MenuItem.objects.create(name=name, price=Decimal(price), category=category)
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_whitelisted_ordering_and_page_cap(self):
+        response = self.client.get('/api/menu-items', {'ordering': '-price', 'perpage': 500})
+        self.assertEqual([item['name'] for item in response.data], ['Pasta', 'Greek Salad', 'Bruschetta'])
+        response = self.client.get('/api/menu-items', {'ordering': 'name', 'perpage': 1, 'page': 2})
+        self.assertEqual([item['name'] for item in response.data], ['Greek Salad'])
+        self.assertEqual(self.client.get('/api/menu-items', {'page': 9}).data, [])
+
+    def test_rejected_parameters(self):
+        for url, params in [('/api/menu-items', {'ordering': 'description'}), ('/api/menu-items', {'perpage': 'all'}),
+                            ('/api/orders', {'ordering': 'user__email'}), ('/api/menu/', {'ordering': 'description'})]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_plan_applies_ordering_filters_and_page(self):
+        shape = shaping.QueryShape(MenuItem, orderings=['name'], filters={'to_price': ('price__lte', Decimal)})
+        first = shape.plan({'ordering': '-name', 'to_price': '13'})
+        second = shape.plan({'ordering': '-name', 'to_price': '20', 'page': '2'})
+        self.assertEqual(list(first.queryset.values_list('name', flat=True)), ['Greek Salad', 'Bruschetta'])
+        self.assertEqual((second.page, second.perpage), (2, 10))
+
+    def test_booking_ordering_is_whitelisted(self):
+        for day in (2, 1):
+            Booking.objects.create(customer_name='manager', email='m@example.com', phone='1234567890',
+                                   date=date(2030, 1, day), time=time(19), number_of_guests=2)
+        response = self.client.get('/api/bookings/', {'ordering': '-date'})
+        self.assertEqual([row['date'] for row in response.data['results']], ['2030-01-02', '2030-01-01'])
+        for ordering in ('customer_name', 'number_of_guests'):
+            response = self.client.get('/api/bookings/', {'ordering': ordering})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, ordering)
+
+
+class CompiledLookupTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='manager', password='testpass123')
+        cls.user.groups.add(Group.objects.create(name='Manager'))
+        cls.order = Order.objects.create(user=cls.user, total=Decimal('10.00'))
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        groups.clear()
+
+    def test_template_matches_orm(self):
+        template = compiled.Template(
+            lambda user_id, username: Order.objects.filter(user_id=user_id, user__username=username), int, str)
+        found = template.first(self.user.id, 'manager')
+        self.assertEqual((found.pk, found.total, found.user_id), (self.order.pk, Decimal('10.00'), self.user.id))
+        self.assertIsNone(template.first(self.user.id, 'someone'))
+        with self.assertRaises(Http404):
+            views.ORDER_BY_PK.get_or_404(self.order.pk + 1)
+
+    def test_out_of_range_pk_is_not_found(self):
+        huge = 99999999999999999999
+        self.assertIsNone(views.ORDER_BY_PK.first(huge))
+        self.assertIsNone(views.ORDER_BY_PK.first(-huge))
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(f'/api/orders/{huge}').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/api/menu-items/{huge}').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete(f'/api/groups/manager/users/{huge}').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_group_rows_are_cached_until_groups_change(self):
+        self.assertTrue(groups.in_group(self.user, groups.MANAGER))
+        with self.assertNumQueries(0):
+            self.assertEqual(groups.get_group(groups.MANAGER).name, 'Manager')
+        with self.assertNumQueries(1):
+            self.assertFalse(groups.in_group(self.user, groups.DELIVERY_CREW))
+        crew = Group.objects.create(name='Delivery crew')
+        self.user.groups.add(crew)
+        self.assertTrue(groups.in_group(self.user, groups.DELIVERY_CREW))
+        self.assertFalse(groups.in_group(AnonymousUser(), groups.MANAGER))
+
+
+class ConditionalRequestTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='testpass123')
+        cls.manager = User.objects.create_user(username='manager', password='testpass123')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.order = Order.objects.create(user=cls.customer, total=Decimal('10.00'))
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+
+    def test_order_etag_and_not_modified(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.get(f'/api/orders/{self.order.id}')
+        self.assertEqual(response['ETag'], f'"{self.order.id}-1"')
+        response = self.client.get(f'/api/orders/{self.order.id}', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(response.content)
+
+    def test_order_stale_write_is_rejected(self):
+        self.client.force_authenticate(self.manager)
+        etag = f'"{self.order.id}-1"'
+        response = self.client.patch(f'/api/orders/{self.order.id}', {'status': True}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{self.order.id}-2"')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/api/orders/{self.order.id}', {'status': False}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "LittlelemonAPI_order"') for q in queries), 1)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), (True, 2))
+        response = self.client.delete(f'/api/orders/{self.order.id}', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertTrue(Order.objects.filter(pk=self.order.id).exists())
+
+    def test_booking_conditional_requests(self):
+        self.client.force_authenticate(self.customer)
+        booking_id = self.client.post('/api/bookings/', {
+            'customer_name': 'customer', 'email': 'c@example.com', 'phone': '1234567890',
+            'date': '2025-12-24', 'time': '19:00:00', 'number_of_guests': 2,
+        }).data['id']
+        etag = self.client.get(f'/api/bookings/{booking_id}/')['ETag']
+        self.assertEqual(self.client.get(f'/api/bookings/{booking_id}/', HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        response = self.client.patch(f'/api/bookings/{booking_id}/', {'number_of_guests': 3}, HTTP_IF_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (status.HTTP_200_OK, f'"{booking_id}-2"'))
+        response = self.client.patch(f'/api/bookings/{booking_id}/', {'number_of_guests': 4}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(SlotOccupancy.objects.get().seats_booked, 3)
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class DeltaSyncTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='testpass123')
+        cls.other = User.objects.create_user(username='other', password='testpass123')
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        cls.item = MenuItem.objects.create(name='Pasta', price=Decimal('15.00'), category=cls.category)
+        cls.order = Order.objects.create(user=cls.customer, total=Decimal('15.00'))
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def sync(self, since, **params):
+        response = self.client.get('/api/changes', {'since': since, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_full_then_incremental_sync(self):
+        first = self.sync(0)
+        self.assertEqual([row['name'] for row in first['changes']['menuitem']['upserted']], ['Pasta'])
+        self.assertEqual([row['id'] for row in first['changes']['order']['upserted']], [self.order.id])
+        self.assertFalse(first['has_more'])
+
+        self.item.price = Decimal('16.00')
+        self.item.save()
+        self.item.save()
+        pizza = MenuItem.objects.create(name='Pizza', price=Decimal('12.00'), category=self.category)
+        pizza_id = pizza.id
+        pizza.delete()
+        Order.objects.create(user=self.other, total=Decimal('5.00'))
+        second = self.sync(first['cursor'])
+        self.assertEqual([row['price'] for row in second['changes']['menuitem']['upserted']], ['16.00'])
+        self.assertEqual(second['changes']['menuitem']['deleted'], [pizza_id])
+        # another customer's order is not even listed as deleted
+        self.assertEqual(second['changes']['order'], {'upserted': [], 'deleted': []})
+        self.assertEqual(self.sync(second['cursor'])['changes']['menuitem'], {'upserted': [], 'deleted': []})
+
+    def test_tombstones_go_to_the_owner_and_managers(self):
+        other_order = Order.objects.create(user=self.other, total=Decimal('5.00'))
+        cursor = self.sync(0)['cursor']
+        ids = [self.order.id, other_order.id]
+        self.order.delete()
+        other_order.delete()
+        self.assertEqual(self.sync(cursor)['changes']['order']['deleted'], ids[:1])
+
+        manager = User.objects.create_user(username='manager', password='testpass123')
+        manager.groups.add(Group.objects.create(name='Manager'))
+        self.client.force_authenticate(manager)
+        self.assertEqual(sorted(self.sync(cursor)['changes']['order']['deleted']), ids)
+
+    def test_reassigned_order_is_deleted_for_the_previous_crew_member(self):
+        crew = Group.objects.create(name='Delivery crew')
+        first = User.objects.create_user(username='crew1', password='testpass123')
+        second = User.objects.create_user(username='crew2', password='testpass123')
+        crew.user_set.add(first, second)
+        self.order.delivery_crew = first
+        self.order.save()
+        self.client.force_authenticate(first)
+        cursor = self.sync(0)['cursor']
+
+        self.order.delivery_crew = second
+        self.order.save()
+        self.order.status = True
+        self.order.save()  # a later change keeps the tombstone
+        self.assertEqual(self.sync(cursor)['changes']['order'], {'upserted': [], 'deleted': [self.order.id]})
+        self.assertEqual(self.sync(0)['changes']['order'], {'upserted': [], 'deleted': [self.order.id]})
+        self.client.force_authenticate(second)
+        self.assertEqual([row['id'] for row in self.sync(0)['changes']['order']['upserted']], [self.order.id])
+        self.client.force_authenticate(self.customer)
+        self.assertEqual([row['id'] for row in self.sync(0)['changes']['order']['upserted']], [self.order.id])
+
+        self.order.delivery_crew = first
+        self.order.save()
+        self.client.force_authenticate(first)
+        self.assertEqual([row['id'] for row in self.sync(0)['changes']['order']['upserted']], [self.order.id])
+        self.assertEqual(ChangeLog.objects.filter(kind='order', object_id=self.order.id).count(), 2)
+
+    def test_batches_are_bounded(self):
+        first = self.sync(0, limit=2)
+        self.assertTrue(first['has_more'])
+        rest = self.sync(first['cursor'], limit=2)
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(ChangeLog.objects.filter(kind='menuitem', object_id=self.item.id).count(), 1)
+        self.assertEqual(self.client.get('/api/changes', {'since': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ArchiveTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='testpass123')
+        cls.manager = User.objects.create_user(username='manager', password='testpass123')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        category = Category.objects.create(slug='mains', title='Mains')
+        menuitem = MenuItem.objects.create(name='Pasta', price=Decimal('10.00'), category=category)
+        cls.old = date(2020, 1, 1)
+        cls.orders = []
+        for total, done in [('10.00', True), ('20.00', True), ('30.00', False)]:
+            item = OrderItem.objects.create(user=cls.customer, menuitem=MenuItem.objects.create(
+                name=f'Dish {total}', price=Decimal(total), category=category),
+                quantity=1, unit_price=Decimal(total), price=Decimal(total))
+            order = Order.objects.create(user=cls.customer, total=Decimal(total), status=done, orderitem=item)
+            cls.orders.append(order)
+        # Order.date is auto_now, so age the first and third orders with a queryset update
+        Order.objects.filter(pk__in=[cls.orders[0].pk, cls.orders[2].pk]).update(date=cls.old)
+        for day in ['2020-06-01', '2999-06-01']:
+            Booking.objects.create(customer_name='customer', email='c@example.com', phone='1',
+                                   date=day, time='19:00', number_of_guests=2)
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+
+    def test_command_moves_old_completed_orders_and_past_bookings(self):
+        call_command('archive', order_days=30, batch_size=1, pause=0, stdout=StringIO())
+        self.assertEqual(list(Order.objects.values_list('total', flat=True).order_by('total')),
+                         [Decimal('20.00'), Decimal('30.00')])
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.id, archived.total, archived.quantity, archived.date),
+                         (self.orders[0].id, Decimal('10.00'), 1, self.old))
+        self.assertFalse(OrderItem.objects.filter(pk=self.orders[0].orderitem_id).exists())
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(list(Booking.objects.values_list('date', flat=True)), [date(2999, 6, 1)])
+        self.assertEqual(ArchivedBooking.objects.get().date, date(2020, 6, 1))
+        rollups.rebuild(self.old, self.old)
+        self.assertEqual(DailySales.objects.get(date=self.old).orders, 2)
+
+    def test_include_archived_lists_both_tiers(self):
+        call_command('archive', order_days=30, pause=0, stdout=StringIO())
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(len(self.client.get('/api/orders', {'perpage': 10}).data), 2)
+        rows = self.client.get('/api/orders', {'include_archived': 'true', 'ordering': '-total', 'perpage': 10}).data
+        self.assertEqual([(row['total'], row['archived']) for row in rows],
+                         [(Decimal('30.00'), False), (Decimal('20.00'), False), (Decimal('10.00'), True)])
+        response = self.client.get('/api/bookings/', {'include_archived': 'true'})
+        self.assertEqual([(row['date'], row['archived']) for row in response.data['results']],
+                         [(date(2020, 6, 1), True), (date(2999, 6, 1), False)])
+        self.client.force_authenticate(self.customer)
+        results = self.client.get('/api/orders', {'include_archived': 'true'}).data['results']
+        self.assertEqual([row['id'] for row in results], [order.id for order in reversed(self.orders)])
+
+    def test_delete_moves_row_to_archive(self):
+        self.client.force_authenticate(self.manager)
+        order = self.orders[1]
+        self.assertEqual(self.client.delete(f'/api/orders/{order.id}').status_code, status.HTTP_200_OK)
+        self.assertFalse(Order.objects.filter(pk=order.id).exists())
+        self.assertTrue(ArchivedOrder.objects.get(pk=order.id).deleted)
+        rows = self.client.get('/api/orders', {'include_archived': 'true', 'perpage': 10}).data
+        self.assertNotIn(order.id, [row['id'] for row in rows])
+        booking = Booking.objects.get(date='2999-06-01')
+        self.assertEqual(self.client.delete(f'/api/bookings/{booking.id}/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(ArchivedBooking.objects.get(pk=booking.id).deleted)
+
+
+class MenuImageTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name, MENU_IMAGE_WORKERS=0,
+                                           MENU_IMAGE_VARIANTS={'thumb': 40})
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.client = APIClient()
+        self.manager = User.objects.create_user(username='manager', password='testpass123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.client.force_authenticate(self.manager)
+        self.category = Category.objects.create(slug='mains', title='Mains')
+
+    def upload(self, color='red'):
+        buffer = BytesIO()
+        PILImage.new('RGB', (200, 100), color).save(buffer, 'PNG')
+        return SimpleUploadedFile('dish.png', buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_generated_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/menu/', {'name': 'Pasta', 'price': '10.00', 'category_id': self.category.id,
+                                                       'image': self.upload()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['image_variants'], {})
+        for callback in callbacks:
+            callback()
+        item = MenuItem.objects.get(pk=response.data['id'])
+        self.assertEqual(item.image_variants['source'], item.image.name)
+        thumb = self.client.get(f'/api/menu/{item.id}/').data['image_variants']['thumb']
+        self.assertEqual((thumb['width'], thumb['height']), (40, 20))
+        self.assertRegex(thumb['webp'], r'^http://testserver/media/menu_images/v/[0-9a-f]{32}\.webp$')
+        self.assertTrue(thumb['jpeg'].endswith('.jpg'))
+
+        # a new image replaces the variants, clearing it drops them
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/menu/{item.id}/', {'image': self.upload('blue')}, format='multipart')
+        item.refresh_from_db()
+        self.assertNotEqual(item.image_variants['thumb']['webp'], thumb['webp'].split('/media/')[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.filter(pk=item.pk).update(image='')
+            item.refresh_from_db()
+            item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.image_variants, {})
+
+    def test_stale_job_is_ignored_and_command_catches_up(self):
+        with self.captureOnCommitCallbacks():
+            item = MenuItem.objects.create(name='Pasta', price=Decimal('10.00'), category=self.category,
+                                           image=self.upload())
+        self.assertFalse(images.process(item.pk, 'menu_images/other.png'))
+        call_command('process_menu_images', stdout=StringIO())
+        item.refresh_from_db()
+        self.assertFalse(images.needs_processing(item))
+
+    def test_worker_failures_are_logged(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        with mock.patch.object(images, '_executor', executor), \
+                mock.patch.object(images, 'process', side_effect=OSError('disk full')), \
+                self.assertLogs('LittlelemonAPI.images', 'ERROR') as logs:
+            images._submit(42, 'menu_images/photo.jpg')
+            executor.shutdown(wait=True)  # also waits for the done-callbacks
+        self.assertIn('menu item 42', logs.output[0])
+        self.assertIn('OSError: disk full', logs.output[0])
+
+    def test_variant_responses_are_cacheable_and_support_ranges(self):
+        data = self.upload().read()
+        name = images._store(data, 'jpg')
+        url = settings.MEDIA_URL + name
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), data)
+        self.assertEqual(response['Cache-Control'], images.CACHE_CONTROL)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual((response.content, response['Content-Range']), (data[:10], f'bytes 0-9/{len(data)}'))
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=-5').content, data[-5:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(data)}-').status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=-0').status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        # a malformed Range header is ignored
+        for header in ['bytes=9-0', 'bytes=0-9,20-29', 'items=0-9']:
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(b''.join(response.streaming_content), data)
+        self.assertEqual(self.client.get('/media/menu_images/v/nothere.jpg').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AdminChangelistTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        cls.crew = User.objects.create_user(username='crew', password='testpass123')
+        cls.add_orders(0, 5)
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client.force_login(self.admin)
+
+    @classmethod
+    def add_orders(cls, start, count):
+        category = Category.objects.create(slug=f'mains{start}', title='Mains')
+        menuitem = MenuItem.objects.create(name='Pasta', price=Decimal('10.00'), category=category)
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f'customer{i}', password='testpass123')
+            item = OrderItem.objects.create(user=user, menuitem=menuitem, quantity=1,
+                                            unit_price=Decimal('10.00'), price=Decimal('10.00'))
+            Order.objects.create(user=user, total=Decimal('10.00'), orderitem=item,
+                                 delivery_crew=cls.crew if i % 2 else None)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/LittlelemonAPI/order/')
+        self.assertEqual(response.status_code, 200)
+        self.add_orders(5, 5)
+        # no per-row user lookups and no sidebar listing every user
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get('/admin/LittlelemonAPI/order/')
+        self.assertContains(response, 'customer9')
+        self.assertNotContains(response, '?delivery_crew__id__exact=')
+        response = self.client.get('/admin/LittlelemonAPI/orderitem/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_username_filter(self):
+        response = self.client.get('/admin/LittlelemonAPI/order/', {'delivery_crew__username': 'crew'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertContains(response, 'name="delivery_crew__username" value="crew"')
+
+    def test_large_tables_show_estimated_count(self):
+        with override_settings(ADMIN_EXACT_COUNT_LIMIT=3):
+            Order.objects.filter(pk=Order.objects.order_by('pk').first().pk).delete()
+            response = self.client.get('/admin/LittlelemonAPI/order/')
+            # the highest id stands in for the count on SQLite
+            self.assertEqual(response.context['cl'].result_count, Order.objects.order_by('pk').last().pk)
+            response = self.client.get('/admin/LittlelemonAPI/order/', {'status__exact': '0'})
+            self.assertEqual(response.context['cl'].result_count, 4)
+        self.assertEqual(self.client.get('/admin/LittlelemonAPI/order/').context['cl'].result_count, 4)
+
+    def test_postgresql_estimate_uses_the_quoted_table_name(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = (12345,)
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor', return_value=cursor):
+            self.assertEqual(admin.estimated_count(Order), 12345)
+        sql, params = cursor.__enter__.return_value.execute.call_args.args
+        self.assertIn('pg_class', sql)
+        # unquoted, PostgreSQL would look for littlelemonapi_order
+        self.assertEqual(params, ['"LittlelemonAPI_order"'])
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class BulkOrderUpdateTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='testpass123')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.crew = User.objects.create_user(username='crew', password='testpass123')
+        cls.crew.groups.add(Group.objects.create(name='Delivery crew'))
+        cls.customer = User.objects.create_user(username='customer', password='testpass123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.orders = []
+        for i in range(3):
+            menuitem = MenuItem.objects.create(name=f'Dish {i}', price=Decimal('10.00'), category=category)
+            item = OrderItem.objects.create(user=cls.customer, menuitem=menuitem, quantity=1,
+                                            unit_price=Decimal('10.00'), price=Decimal('10.00'))
+            order = Order.objects.create(user=cls.customer, total=Decimal('10.00'), orderitem=item)
+            rollups.record_checkout(order)
+            cls.orders.append(order)
+        cls.ids = [order.id for order in cls.orders]
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_assign_and_deliver_in_one_statement(self):
+        cursor = ChangeLog.objects.order_by('-id').values_list('id', flat=True).first()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/orders/bulk', {'orders': self.ids + [999], 'delivery_crew': self.crew.id},
+                                        format='json')
+        self.assertEqual(response.data, {'updated': 3, 'not_found': [999]})
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "LittlelemonAPI_order"') for query in queries), 1)
+        self.assertEqual(Order.objects.filter(delivery_crew=self.crew).count(), 3)
+        self.assertEqual(set(Order.objects.values_list('version', flat=True)), {2})
+        self.assertEqual(sorted(ChangeLog.objects.filter(id__gt=cursor).values_list('object_id', flat=True)), self.ids)
+
+        self.client.post('/api/orders/bulk', {'orders': self.ids[:2], 'status': 1}, format='json')
+        stats = CrewDeliveryStats.objects.get(delivery_crew=self.crew)
+        self.assertEqual((stats.assigned, stats.delivered), (3, 2))
+        self.assertEqual(rollups.get_user_summary(self.customer.id).open_order_id, self.ids[2])
+
+        self.client.post('/api/orders/bulk', {'orders': self.ids, 'delivery_crew': None, 'status': 0}, format='json')
+        self.assertFalse(CrewDeliveryStats.objects.filter(delivery_crew=self.crew).exclude(assigned=0).exists())
+
+    def test_rejects_non_crew_and_non_managers(self):
+        response = self.client.post('/api/orders/bulk', {'orders': self.ids, 'delivery_crew': self.customer.id},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post('/api/orders/bulk', {'orders': self.ids}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exclude(delivery_crew=None).exists())
+        self.client.force_authenticate(self.crew)
+        response = self.client.post('/api/orders/bulk', {'orders': self.ids, 'status': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_admin_actions(self):
+        admin_user = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_login(admin_user)
+        response = self.client.post('/admin/LittlelemonAPI/order/', {
+            'action': f'assign_crew_{self.crew.id}', '_selected_action': self.ids[:2]}, follow=True)
+        self.assertContains(response, '2 orders updated.')
+        self.assertEqual(Order.objects.filter(delivery_crew=self.crew).count(), 2)
+        self.client.post('/admin/LittlelemonAPI/order/', {'action': 'mark_delivered', '_selected_action': self.ids})
+        self.assertEqual(Order.objects.filter(status=True).count(), 3)
+
+
+class DispatcherTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        crew_group = Group.objects.create(name='Delivery crew')
+        self.crew = []
+        for name in ['ann', 'bob']:
+            member = User.objects.create_user(username=name, password='testpass123')
+            member.groups.add(crew_group)
+            self.crew.append(member)
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+        self.category = Category.objects.create(slug='mains', title='Mains')
+        self.count = 0
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def add_order(self, crew=None, done=False):
+        self.count += 1
+        menuitem = MenuItem.objects.create(name=f'Dish {self.count}', price=Decimal('10.00'), category=self.category)
+        item = OrderItem.objects.create(user=self.customer, menuitem=menuitem, quantity=1,
+                                        unit_price=Decimal('10.00'), price=Decimal('10.00'))
+        return Order.objects.create(user=self.customer, total=Decimal('10.00'), orderitem=item,
+                                    delivery_crew=crew, status=done)
+
+    def test_least_loaded_balances_existing_load(self):
+        self.add_order(crew=self.crew[0])
+        self.add_order(crew=self.crew[0])
+        self.add_order(crew=self.crew[1], done=True)  # delivered orders are not load
+        waiting = [self.add_order() for _ in range(4)]
+        worker = dispatcher.Dispatcher(clock=self.clock)
+        worker.resync()
+        self.now = 1.5
+        self.assertEqual(worker.tick(), 4)
+        assigned = dict(Order.objects.filter(pk__in=[o.pk for o in waiting]).values_list('id', 'delivery_crew'))
+        self.assertEqual(sorted(assigned.values()), [self.crew[0].id, self.crew[1].id, self.crew[1].id, self.crew[1].id])
+        self.assertEqual(worker.load, {self.crew[0].id: 3, self.crew[1].id: 3})
+        status_row = DispatcherStatus.objects.get()
+        self.assertEqual((status_row.queue_depth, status_row.assigned_total, status_row.latency_p50), (0, 4, 1.5))
+
+    def test_round_robin_batches_and_new_orders(self):
+        worker = dispatcher.Dispatcher(strategy='round-robin', batch_size=3, clock=self.clock)
+        worker.tick()
+        for _ in range(4):
+            self.add_order()
+        self.assertEqual(worker.tick(), 3)
+        self.assertEqual(worker.metrics()['queue_depth'], 1)
+        self.assertEqual(worker.tick(), 1)
+        self.assertEqual(list(Order.objects.order_by('id').values_list('delivery_crew', flat=True)),
+                         [self.crew[0].id, self.crew[1].id, self.crew[0].id, self.crew[1].id])
+
+    def test_skips_orders_changed_elsewhere_and_respects_max_load(self):
+        worker = dispatcher.Dispatcher(max_load=1, clock=self.clock)
+        first, second, third = self.add_order(), self.add_order(), self.add_order()
+        worker.resync()
+        Order.objects.filter(pk=first.pk).update(status=True)
+        # the first order goes nowhere and the third waits for a crew member below max_load
+        self.assertEqual(worker.tick(), 1)
+        self.assertEqual(Order.objects.exclude(delivery_crew=None).get().pk, second.pk)
+        self.assertEqual(worker.metrics()['queue_depth'], 1)
+        self.crew[0].groups.clear()
+        self.assertEqual(worker.tick(), 0)
+        self.assertEqual(worker.metrics()['crew_count'], 1)
+        self.assertEqual(worker.metrics()['queue_depth'], 1)
+        self.assertIsNone(Order.objects.get(pk=third.pk).delivery_crew)
+
+    def test_command_and_metrics_endpoint(self):
+        self.add_order()
+        manager = User.objects.create_user(username='manager', password='testpass123')
+        manager.groups.add(Group.objects.create(name='Manager'))
+        self.client.force_authenticate(manager)
+        self.assertEqual(self.client.get('/api/dispatcher').status_code, status.HTTP_404_NOT_FOUND)
+        out = StringIO()
+        call_command('dispatch', ticks=1, tick=0, stdout=out)
+        self.assertIn('Assigned 1 orders, 0 waiting.', out.getvalue())
+        response = self.client.get('/api/dispatcher')
+        self.assertEqual((response.data['assigned_total'], response.data['crew_count']), (1, 2))
+
+
+@override_settings(ROOT_URLCONF='Littlelemon.api_urls')
+class ApiProfileTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        for guests in (2, 4):
+            Booking.objects.create(customer_name='testuser', email='test@example.com', phone='1234567890',
+                                   date=date(2025, 12, 25), time=time(19, 30), number_of_guests=guests)
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client.force_authenticate(self.user)
+
+    def test_serves_the_api_without_the_admin(self):
+        self.assertEqual(self.client.get('/admin/').status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/bookings/', {'number_of_guests': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([booking['number_of_guests'] for booking in response.data['results']], [4])
+
+
+def load_production_settings(**environ):
+    with mock.patch.dict(os.environ, environ, clear=True):
+        return importlib.reload(importlib.import_module('Littlelemon.production_settings'))
+
+
+class ProductionSettingsTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        for i in range(30):
+            MenuItem.objects.create(name=f'Dish {i}', price=Decimal('10.00'), category=category)
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        catalog.invalidate()
+        self.client.force_authenticate(self.user)
+        self.production = production = load_production_settings(
+            DJANGO_SECRET_KEY='secret', DJANGO_ALLOWED_HOSTS='testserver')
+        overrides = override_settings(
+            MIDDLEWARE=production.MIDDLEWARE, SESSIONLESS_PATH_PREFIXES=production.SESSIONLESS_PATH_PREFIXES,
+            GZIP_CONTENT_TYPES=production.GZIP_CONTENT_TYPES, GZIP_MIN_LENGTH=production.GZIP_MIN_LENGTH)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_settings_come_from_the_environment(self):
+        self.assertFalse(self.production.DEBUG)
+        self.assertEqual(self.production.ALLOWED_HOSTS, ['testserver'])
+        self.assertEqual(self.production.SECRET_KEY, 'secret')
+        self.assertEqual(self.production.CACHES['default']['BACKEND'], 'django.core.cache.backends.db.DatabaseCache')
+        redis = load_production_settings(DJANGO_SECRET_KEY='secret', DJANGO_REDIS_URL='redis://cache:6379/0')
+        self.assertEqual(redis.CACHES['default']['LOCATION'], 'redis://cache:6379/0')
+        with self.assertRaises(ImproperlyConfigured):
+            load_production_settings()
+
+    def test_api_responses_are_compressed_and_conditional(self):
+        response = self.client.get('/api/menu/', {'page_size': 30}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 30)
+        # the API runs without sessions or messages
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(hasattr(response.wsgi_request, '_messages'))
+        response = self.client.get('/api/menu/', {'page_size': 30}, HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/api/menu/', {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_admin_keeps_sessions(self):
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+
+class MemoryBoundsTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        for i in range(5):
+            Category.objects.create(slug=f'category-{i}', title=f'Category {i}')
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client.force_authenticate(self.user)
+
+    def export_peak(self, orders):
+        Order.objects.bulk_create(Order(user=self.user, total=Decimal('10.00')) for _ in range(orders))
+        tracemalloc.start()
+        try:
+            call_command('export_orders', output=os.devnull, chunk_size=500, stderr=StringIO())
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_unpaginated_lists_are_capped(self):
+        with override_settings(MAX_LIST_ROWS=3):
+            response = self.client.get('/api/category')
+            self.assertEqual(len(response.data), 3)
+            self.assertEqual(response['X-Truncated'], 'true')
+        response = self.client.get('/api/category')
+        self.assertEqual(len(response.data), 5)
+        self.assertNotIn('X-Truncated', response)
+        self.assertNotIn('X-Memory-Peak-KB', response)
+
+    def test_export_memory_stays_flat(self):
+        small = self.export_peak(1000)
+        # ten times the rows: the peak is set by the chunk size, not the table size
+        large = self.export_peak(9000)
+        self.assertLess(large, small * 1.5)
+
+    def test_crew_order_list_is_paged_with_open_orders_first(self):
+        crew = User.objects.create_user(username='crew', password='pass123')
+        crew.groups.add(Group.objects.create(name='Delivery crew'))
+        orders = [Order.objects.create(user=self.user, total=Decimal('10.00'), delivery_crew=crew, status=i % 2 == 0)
+                  for i in range(5)]
+        self.client.force_authenticate(crew)
+        response = self.client.get('/api/orders', {'perpage': 2})
+        self.assertEqual([row['id'] for row in response.data], [orders[3].id, orders[1].id])
+        response = self.client.get('/api/orders', {'perpage': 2, 'page': 2})
+        self.assertEqual([row['id'] for row in response.data], [orders[4].id, orders[2].id])
+        self.assertNotIn('X-Truncated', response)
+
+    @override_settings(REQUEST_MEMORY_METRICS=True)
+    def test_requests_report_their_memory_peak(self):
+        self.addCleanup(tracemalloc.stop)
+        response = self.client.get('/api/category')
+        self.assertGreater(int(response['X-Memory-Peak-KB']), 0)
+
+
+class GroupMembershipBulkTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='pass123')
+        cls.customer = User.objects.create_user(username='customer', password='pass123')
+        cls.users = [User.objects.create_user(username=f'user{i:02d}', password='pass123') for i in range(5)]
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        Group.objects.create(name='Delivery crew')
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        groups.clear()
+        self.client.force_authenticate(self.manager)
+
+    def crew(self, **params):
+        return [user['username'] for user in self.client.get('/api/groups/delivery-crew/users', params).data]
+
+    def test_bulk_add_and_remove_by_id_and_username(self):
+        response = self.client.post('/api/groups/delivery-crew/users/bulk', {
+            'add': [self.users[0].pk, 'user01', 'user02', 'nobody', 9999],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['added'], [user.pk for user in self.users[:3]])
+        self.assertEqual(response.data['not_found'], ['nobody', 9999])
+        self.assertEqual(self.crew(), ['user00', 'user01', 'user02'])
+
+        version = groups.members_version()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/groups/delivery-crew/users/bulk', {
+                'add': ['user03', 'user00'], 'remove': [self.users[1].pk, 'user04'],
+            }, format='json')
+            # the cached pages stay valid until the change commits
+            self.assertEqual(groups.members_version(), version)
+        self.assertNotEqual(groups.members_version(), version)
+        writes = [query['sql'].split()[0] for query in queries if query['sql'].startswith(('INSERT', 'DELETE'))]
+        self.assertEqual(writes, ['INSERT', 'DELETE'])
+        self.assertEqual(response.data['added'], [self.users[3].pk])
+        self.assertEqual(response.data['removed'], [self.users[1].pk])
+        self.assertEqual(self.crew(), ['user00', 'user02', 'user03'])
+
+    def test_listing_is_paginated_and_cached_until_membership_changes(self):
+        self.client.post('/api/groups/delivery-crew/users/bulk',
+                         {'add': [user.pk for user in self.users]}, format='json')
+        self.assertEqual(self.crew(perpage=2), ['user00', 'user01'])
+        self.assertEqual(self.crew(perpage=2, page=2), ['user02', 'user03'])
+        self.assertEqual(self.crew(ordering='-username', perpage=1), ['user04'])
+
+        # a rename through update() sends no signal, so the cached page is served
+        User.objects.filter(pk=self.users[0].pk).update(username='renamed')
+        self.assertEqual(self.crew(perpage=2), ['user00', 'user01'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.groups.add(groups.get_group(groups.DELIVERY_CREW))
+        self.assertEqual(self.crew(perpage=2), ['customer', 'renamed'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/groups/delivery-crew/users/bulk', {'remove': ['customer']}, format='json')
+        self.assertEqual(self.crew(perpage=2), ['renamed', 'user01'])
+        self.assertEqual(self.client.get('/api/groups/delivery-crew/users', {'perpage': 'x'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_only_managers_change_membership(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/groups/manager/users/bulk', {'add': ['customer']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(groups.in_group(self.customer, groups.MANAGER))
+
+    def test_payload_is_validated(self):
+        for payload in ({}, {'add': []}, {'add': [True]}, {'remove': ['']}, {'add': [{'id': 1}]}):
+            response = self.client.post('/api/groups/manager/users/bulk', payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, payload)
+
+
+class IdempotencyKeyTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.pasta = MenuItem.objects.create(name='Pasta', price=Decimal('9.50'), category=category)
+        cls.salad = MenuItem.objects.create(name='Salad', price=Decimal('7.00'), category=category)
+
+    def setUp(self):
+        cache.clear()  # reset throttle history
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, menuitem):
+        Cart.objects.create(user=self.user, menuitem=menuitem, quantity=1, unit_price=menuitem.price,
+                            price=menuitem.price)
+
+    def book(self, key, guests=2):
+        return self.client.post('/api/bookings/', {
+            'customer_name': 'testuser', 'email': 'test@example.com', 'phone': '1234567890',
+            'date': '2030-01-01', 'time': '19:00', 'number_of_guests': guests,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_order_is_created_once(self):
+        self.fill_cart(self.pasta)
+        first = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        # a retry must not check out a cart filled since
+        self.fill_cart(self.salad)
+        retry = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+        self.assertEqual(self.client.post('/api/orders').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 2)
+
+    def test_retried_booking_is_created_once(self):
+        first = self.book('booking-1')
+        retry = self.book('booking-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(self.book('booking-1', guests=3).status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.book('x' * 256).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_failed_requests_are_not_stored(self):
+        self.assertEqual(self.book('booking-1', guests=0).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.book('booking-1').status_code, status.HTTP_201_CREATED)
+
+    def test_order_commits_together_with_the_stored_response(self):
+        store = QuerySet.update
+
+        def die_before_storing(queryset, **fields):
+            if queryset.model is IdempotencyKey and fields.get('status_code'):
+                raise RuntimeError('worker died')
+            return store(queryset, **fields)
+
+        self.fill_cart(self.pasta)
+        with mock.patch.object(QuerySet, 'update', die_before_storing), self.assertRaises(RuntimeError):
+            self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        # nothing was created, so the retry may run the view again
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(Cart.objects.exists())
+        self.assertEqual(self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-1').status_code,
+                         status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_in_flight_duplicate_waits_and_stale_claims_are_taken_over(self):
+        now = timezone.now()
+        claim = IdempotencyKey.objects.create(
+            user=self.user, key='checkout-1', fingerprint='', locked_at=now, expires_at=now + timedelta(days=1))
+        self.fill_cart(self.pasta)
+        response = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Order.objects.exists())
+
+        claim.locked_at = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT + 1)
+        claim.save()
+        response = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        claim.refresh_from_db()
+        self.assertEqual(claim.status_code, status.HTTP_201_CREATED)
+
+    def test_expired_keys_are_purged(self):
+        self.book('booking-1')
+        self.book('booking-2')
+        IdempotencyKey.objects.filter(key='booking-1').update(expires_at=timezone.now())
+        out = StringIO()
+        call_command('purge_idempotency_keys', pause=0, stdout=out)
+        self.assertIn('Purged 1 expired', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['booking-2'])
@@ -25,17 +25,30 @@ urlpatterns = [
 
     # User group management endpoints
     path('groups/manager/users', views.manager_set),
-    path('groups/manager/users/<int:pk>', views.manager_delete),
+    path('groups/manager/users/bulk', views.manager_bulk),
+    path('groups/manager/users/<int:id>', views.manager_delete),
     path('groups/delivery-crew/users', views.delivery_set),
-    path('groups/delivery-crew/<int:pk>', views.delivery_delete),
+    path('groups/delivery-crew/users/bulk', views.delivery_bulk),
+    path('groups/delivery-crew/<int:id>', views.delivery_delete),
 
     # Cart management endpoints 
     path('cart/menu-items', views.cart),
+    path('cart/menu-items/batch', views.cart_batch),
 
     # Order management endpoints
     path('orders', views.order),
+    path('orders/bulk', views.order_bulk),
+    path('dispatcher', views.dispatcher_status),
     path('orders/<int:id>', views.order_single),
 
+    # Delta sync
+    path('changes', views.changes_view),
+
+    # Manager analytics endpoints (served from the rollup tables)
+    path('analytics/sales', views.analytics_sales),
+    path('analytics/best-sellers', views.analytics_best_sellers),
+    path('analytics/crew', views.analytics_crew),
+
     # test for admin access
     path('admin/users', views.manager_admin),
     # test for serialization of Group
@@ -0,0 +1,67 @@
+"""
+Row versions for conditional requests.
+
+Order and Booking carry a `version` counter that every API write bumps, and
+the detail endpoints expose it as the ETag. A GET whose If-None-Match still
+matches gets 304 without serializing the row. A write with If-Match only
+applies to the version the client saw: claim() checks and bumps the version
+in one conditional UPDATE, so a stale write fails without an extra read and
+two concurrent writers cannot both pass. Without If-Match the version read
+by the request itself is expected, which still catches a write that lands
+in between.
+"""
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has been changed since you read it. Fetch it again and retry.'
+    default_code = 'precondition_failed'
+
+
+def etag(instance):
+    return f'"{instance.pk}-{instance.version}"'
+
+
+def _tags(header):
+    return [tag.strip().removeprefix('W/') for tag in header.split(',')]
+
+
+def not_modified(request, instance):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = _tags(header)
+    return '*' in tags or etag(instance) in tags
+
+
+def not_modified_response(instance):
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag(instance)})
+
+
+def expected_version(request, instance):
+    """The version an If-Match header asks for, or the instance's own when there is none."""
+    header = request.headers.get('If-Match')
+    if not header or header.strip() == '*':
+        return instance.version
+    for tag in _tags(header):
+        pk, _, version = tag.strip('"').partition('-')
+        if pk == str(instance.pk) and version.isdigit():
+            return int(version)
+    raise PreconditionFailed()
+
+
+def claim(request, instance):
+    """
+    Bump the row's version if it is still the expected one, or raise
+    PreconditionFailed. Call inside the transaction that saves the change.
+    """
+    expected = expected_version(request, instance)
+    updated = (type(instance).objects.filter(pk=instance.pk, version=expected)
+               .update(version=F('version') + 1))
+    if not updated:
+        raise PreconditionFailed()
+    instance.version = expected + 1
@@ -1,13 +1,31 @@
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework import status, viewsets, filters
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import api_view, action
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.pagination import PageNumberPagination
-from django_filters.rest_framework import DjangoFilterBackend
+from django.db import transaction
+from django.db.models import Case, Sum, When
 from . import models
+from . import archive
+from . import assignment
+from . import capacity
+from . import catalog
+from . import changes
+from . import groups
+from . import idempotency
+from . import menu_index
+from . import rollups
+from . import search as search_module
+from . import shaping
+from . import versioning
+from .compiled import Template
 from decimal import Decimal
 import datetime
+import hashlib
 
 # Authentication
 from rest_framework.permissions import IsAuthenticated
@@ -26,12 +44,62 @@ from django.contrib.auth.models import User, Group
 # Serialization
 from . import serializers
 
-# Authentication views
+# Authentication views. Not deferred like django_filters: rest_framework.authtoken is an installed app,
+# so django.setup() has imported its models before this module loads.
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 
-# Pagination
-from django.core.paginator import Paginator, EmptyPage
+# Largest number of operations accepted by the batch endpoints
+BATCH_MAX_ITEMS = 100
+
+# Largest price a cart line can store (Cart.price has max_digits=6, decimal_places=2)
+CART_MAX_PRICE = Decimal('9999.99')
+
+# Compiled point lookups for the detail views (see compiled.py)
+ORDER_BY_PK = Template(lambda pk: models.Order.objects.filter(pk=pk), int)
+MENUITEM_BY_PK = Template(lambda pk: models.MenuItem.objects.filter(pk=pk), int)
+CATEGORY_BY_PK = Template(lambda pk: models.Category.objects.filter(pk=pk), int)
+USER_BY_PK = Template(lambda pk: User.objects.filter(pk=pk), int)
+
+# Orderings and filters accepted by the list views, limited to indexed columns
+MENU_ITEMS_SHAPE = shaping.QueryShape(
+    models.MenuItem,
+    orderings=['name', 'price', 'category', 'featured'],
+    filters={
+        'category': ('category__title', str),
+        'from_price': ('price__gte', lambda value: menu_index.parse_price(value, 'from_price')),
+        'to_price': ('price__lte', lambda value: menu_index.parse_price(value, 'to_price')),
+        'search': ('pk__in', search_module.search_ids),
+    },
+    perpage=2,
+)
+GROUP_MEMBERS_SHAPE = shaping.QueryShape(User, orderings=['username'], default_ordering=['username'], perpage=50)
+ORDERS_SHAPE = shaping.QueryShape(
+    models.Order,
+    orderings=['date', 'status', 'total', 'user', 'delivery_crew'],
+    filters={
+        'from_price': ('total__gte', lambda value: menu_index.parse_price(value, 'from_price')),
+        'to_price': ('total__lte', lambda value: menu_index.parse_price(value, 'to_price')),
+        'search': ('status__icontains', str),
+    },
+    perpage=2,
+)
+# the delivery crew's own orders: open ones first, newest first
+CREW_ORDERS_SHAPE = shaping.QueryShape(
+    models.Order,
+    orderings=ORDERS_SHAPE.orderings,
+    filters=ORDERS_SHAPE.filters,
+    default_ordering=['status', '-id'],
+    perpage=50,
+)
+
+def _filter_price_range(queryset, field, price_range):
+    low, high = price_range
+    if low is not None:
+        queryset = queryset.filter(**{field + '__gte': low})
+    if high is not None:
+        queryset = queryset.filter(**{field + '__lte': high})
+    return queryset
 
 # Create your views here.
 @api_view()
@@ -52,7 +120,7 @@ def manager_admin(request):
     message = 'User ' + username + ' '
     if username:
         user = get_object_or_404(User, username=username)
-        managers = Group.objects.get(name="Manager")
+        managers = groups.get_group(groups.MANAGER)
         if request.method == 'POST':
             managers.user_set.add(user)
             message += 'is set as manager.'
@@ -82,10 +150,9 @@ def group_view(request):
 @permission_classes([IsAuthenticated])
 def category(request):
     if request.method == 'GET':
-        items = models.Category.objects.all()
-        serialized_item = serializers.CategorySerializer(items, many=True)
-        return Response(serialized_item.data, status.HTTP_200_OK)
-    if request.method == 'POST' and request.user.groups.filter(name='Manager').exists():
+        items = serializers.shape_queryset(models.Category.objects.all(), serializers.CategorySerializer, request)
+        return _capped_list(*shaping.capped(items, settings.MAX_LIST_ROWS), serializers.CategorySerializer, request)
+    if request.method == 'POST' and groups.in_group(request.user, groups.MANAGER):
         serialized_item = serializers.CategorySerializer(data=request.data)
         serialized_item.is_valid(raise_exception=True)
         serialized_item.save()
@@ -101,13 +168,13 @@ def category(request):
 @api_view(['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def category_single(request, id):
-    item = get_object_or_404(models.Category, pk=id)
+    item = CATEGORY_BY_PK.get_or_404(id)
     if request.method == 'GET':
-        serialized_item = serializers.CategorySerializer(item)
+        serialized_item = serializers.CategorySerializer(item, context={'request': request})
         return Response(serialized_item.data, status.HTTP_200_OK)
     elif request.method == 'POST':
         return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
-    if not request.user.groups.filter(name='Manager').exists():
+    if not groups.in_group(request.user, groups.MANAGER):
         return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
     if request.method == 'PUT':
         serialized_item = serializers.CategorySerializer(item, data=request.data)
@@ -134,31 +201,15 @@ def category_single(request, id):
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
 def menuitems(request):
     if request.method == 'GET':
-        items = models.MenuItem.objects.all()
-        category_name = request.query_params.get('category')
-        to_price = request.query_params.get('to_price')
-        search = request.query_params.get('search')
-        ordering = request.query_params.get('ordering')
-        perpage = request.query_params.get('perpage', default=2)
-        page = request.query_params.get('page', default=1)
-        if category_name:
-            items = items.filter(category__title=category_name)
-        if to_price:
-            items = items.filter(price__lte=to_price)
-        if search:
-            items = items.filter(title__icontains=search)
-        if ordering:
-            ordering_fields = ordering.split(",")
-            items = items.order_by(*ordering_fields)
-        
-        paginator = Paginator(items, per_page=perpage)
         try:
-            items = paginator.page(number=page)
-        except EmptyPage:
-            items = []
-        serialized_item = serializers.MenuItemSerializer(items, many=True)
+            plan = MENU_ITEMS_SHAPE.plan(request.query_params)
+        except ValueError as e:
+            return Response({"message": str(e)}, status.HTTP_400_BAD_REQUEST)
+        items = serializers.shape_queryset(plan.queryset, serializers.MenuItemSerializer, request)
+        items = plan.page_of(items)
+        serialized_item = serializers.MenuItemSerializer(items, many=True, context={'request': request})
         return Response(serialized_item.data, status.HTTP_200_OK)
-    if request.method == 'POST' and request.user.groups.filter(name='Manager').exists():
+    if request.method == 'POST' and groups.in_group(request.user, groups.MANAGER):
         serialized_item = serializers.MenuItemSerializer(data=request.data)
         serialized_item.is_valid(raise_exception=True)
         serialized_item.save()
@@ -175,11 +226,11 @@ def menuitems(request):
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
 def menuitems_single(request, id):
-    item = get_object_or_404(models.MenuItem, pk=id)
+    item = MENUITEM_BY_PK.get_or_404(id)
     if request.method == 'GET':
-        serialized_item = serializers.MenuItemSerializer(item)
+        serialized_item = serializers.MenuItemSerializer(item, context={'request': request})
         return Response(serialized_item.data, status.HTTP_200_OK)
-    elif request.method == 'POST' or not request.user.groups.filter(name='Manager').exists():
+    elif request.method == 'POST' or not groups.in_group(request.user, groups.MANAGER):
         return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
     if request.method == 'PUT':
         serialized_item = serializers.MenuItemSerializer(item, data=request.data)
@@ -195,14 +246,49 @@ def menuitems_single(request, id):
         item.delete()
         return Response(status.HTTP_204_NO_CONTENT)
 
+# A page of the members of group `name` by username (page, perpage; default 50),
+# cached until the next membership change
+def _group_members(request, name):
+    try:
+        plan = GROUP_MEMBERS_SHAPE.plan(request.query_params)
+    except ValueError as e:
+        return Response({"message": str(e)}, status.HTTP_400_BAD_REQUEST)
+    key = repr((name, sorted(request.query_params.lists())))
+    key = 'group-members:%s:%s' % (groups.members_version(), hashlib.md5(key.encode()).hexdigest())
+    members = cache.get(key)
+    if members is None:
+        queryset = plan.queryset.filter(groups=groups.get_group(name))
+        queryset = serializers.shape_queryset(queryset, serializers.UserSerializer, request)
+        members = serializers.UserSerializer(plan.page_of(queryset), many=True, context={'request': request}).data
+        cache.set(key, members, settings.GROUP_MEMBERS_CACHE_SECONDS)
+    return Response(members, status.HTTP_200_OK)
+
+# Adds and removes the users in the payload, given by id or username, with one INSERT and one DELETE
+def _group_members_bulk(request, name):
+    if not groups.in_group(request.user, groups.MANAGER):
+        return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
+    serialized_item = serializers.GroupMembersBulkSerializer(data=request.data)
+    serialized_item.is_valid(raise_exception=True)
+    add = serialized_item.validated_data.get('add', [])
+    remove = serialized_item.validated_data.get('remove', [])
+    resolved = groups.resolve_users(add + remove)
+    try:
+        with transaction.atomic():
+            added = groups.add_members(name, [resolved[ref] for ref in add if ref in resolved])
+            removed = groups.remove_members(name, [resolved[ref] for ref in remove if ref in resolved])
+    except Group.DoesNotExist:
+        return Response({"message": "Group " + name + " does not exist."}, status.HTTP_404_NOT_FOUND)
+    return Response({"added": added, "removed": removed,
+                     "not_found": [ref for ref in add + remove if ref not in resolved]}, status.HTTP_200_OK)
+
 # endpoint: /api/groups/manager/users
 # allow GET and POST method for Manager only
-# GET: Returns all managers
+# GET: Returns a page of managers (page, perpage)
 # POST: Assigns the user in the payload to the manager group and returns 201-Created
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def manager_set(request):
-    if not request.user.groups.filter(name='Manager').exists():
+    if not groups.in_group(request.user, groups.MANAGER):
         return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
     
     if request.method == 'POST':
@@ -211,16 +297,22 @@ def manager_set(request):
             user = get_object_or_404(User, username=username)
         else:
             return Response({"message": "Username is incorrect or not existed."}, status.HTTP_400_BAD_REQUEST)
-        managers = Group.objects.get(name="Manager")
+        managers = groups.get_group(groups.MANAGER)
         managers.user_set.add(user)
         message = 'User ' + username + ' ' 'is set as manager.'
         return Response({"message": message}, status.HTTP_201_CREATED) 
     elif request.method == 'GET':
-        managers = User.objects.filter(groups = Group.objects.get(name="Manager"))
-        # managers = User.objects.all()
-        serialized_item = serializers.UserSerializer(managers, many=True)
-        return Response(serialized_item.data)
-        # return Response(managers)
+        return _group_members(request, groups.MANAGER)
+
+# endpoint: /api/groups/manager/users/bulk
+# allow POST for Manager only
+# POST: Body: {"add": [userId or username, ...], "remove": [...]}, up to 1000 users each.
+#       Returns the ids added and removed and the users that do not exist.
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle])
+def manager_bulk(request):
+    return _group_members_bulk(request, groups.MANAGER)
 
 # endpoint: /api/groups/manager/users/{userId}
 # allow DELETE for Manager only
@@ -230,14 +322,14 @@ def manager_set(request):
 @permission_classes([IsAuthenticated])
 @throttle_classes([UserRateThrottle])
 def manager_delete(request, id):
-    if request.user.groups.filter(name='Manager').exists():
+    if groups.in_group(request.user, groups.MANAGER):
         if request.method != 'DELETE':
             return Response({"message": "This endpoint only supports DELETE."}, status.HTTP_400_BAD_REQUEST) 
-        user = get_object_or_404(User, id=id)
-        if user.groups.filter(name='Manager').exists():
-            managers = Group.objects.get(name="Manager")
+        user = USER_BY_PK.get_or_404(id)
+        if groups.in_group(user, groups.MANAGER):
+            managers = groups.get_group(groups.MANAGER)
             managers.user_set.remove(user)
-            message = 'User ' + user.get_username + ' ' + 'is not manager now.'
+            message = 'User ' + user.get_username() + ' ' + 'is not manager now.'
             return Response({"message": message}, status.HTTP_200_OK)
         else:
             return Response({"message": "This user is not a manager"}, status.HTTP_400_BAD_REQUEST) 
@@ -246,13 +338,13 @@ def manager_delete(request, id):
 
 # endpoint: /api/groups/delivery-crew/users
 # allow GET and POST method for Manager only
-# GET: Returns all Returns all delivery crew
+# GET: Returns a page of the delivery crew (page, perpage)
 # POST: Assigns the user in the payload to the delivery crew group and returns 201-Created
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([UserRateThrottle])
 def delivery_set(request):
-    if not request.user.groups.filter(name='Manager').exists():
+    if not groups.in_group(request.user, groups.MANAGER):
         return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
     
     if request.method == 'POST':
@@ -261,14 +353,21 @@ def delivery_set(request):
             user = get_object_or_404(User, username=username)
         else:
             return Response({"message": "Username is incorrect or not existed."}, status.HTTP_400_BAD_REQUEST)
-        crews = Group.objects.get(name="Delivery crew")
+        crews = groups.get_group(groups.DELIVERY_CREW)
         crews.user_set.add(user)
         message = 'User ' + username + ' ' 'is set as delivery crew.'
         return Response({"message": message}, status.HTTP_201_CREATED) 
     elif request.method == 'GET':
-        crews = User.objects.filter(groups = Group.objects.get(name="Delivery crew"))
-        serialized_item = serializers.UserSerializer(crews, many=True)
-        return Response(serialized_item.data)
+        return _group_members(request, groups.DELIVERY_CREW)
+
+# endpoint: /api/groups/delivery-crew/users/bulk
+# allow POST for Manager only
+# POST: Like /api/groups/manager/users/bulk, for the delivery crew.
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle])
+def delivery_bulk(request):
+    return _group_members_bulk(request, groups.DELIVERY_CREW)
 
 # endpoint: /api/groups/delivery-crew/users/{userId}
 # allow DELETE for Manager only
@@ -278,14 +377,14 @@ def delivery_set(request):
 @permission_classes([IsAuthenticated])
 @throttle_classes([UserRateThrottle])
 def delivery_delete(request, id):
-    if request.user.groups.filter(name='Manager').exists():
+    if groups.in_group(request.user, groups.MANAGER):
         if request.method != 'DELETE':
             return Response({"message": "This endpoint only supports DELETE."}, status.HTTP_400_BAD_REQUEST) 
-        user = get_object_or_404(User, id=id)
-        if user.groups.filter(name='Delivery crew').exists():
-            crews = Group.objects.get(name="Delivery crew")
+        user = USER_BY_PK.get_or_404(id)
+        if groups.in_group(user, groups.DELIVERY_CREW):
+            crews = groups.get_group(groups.DELIVERY_CREW)
             crews.user_set.remove(user)
-            message = 'User ' + user.get_username + ' ' + 'is not delivery crew now.'
+            message = 'User ' + user.get_username() + ' ' + 'is not delivery crew now.'
             return Response({"message": message}, status.HTTP_200_OK)
         else:
             return Response({"message": "This user is not a delivery crew"}, status.HTTP_400_BAD_REQUEST) 
@@ -303,19 +402,23 @@ def delivery_delete(request, id):
 @throttle_classes([UserRateThrottle])
 def cart(request):
     if request.method == 'GET':
-        try:
-            cart = models.Cart.objects.get(user=request.user)
-        except:
+        cart = serializers.shape_queryset(models.Cart.objects.filter(user=request.user), serializers.CartSerializer, request)
+        cart, truncated = shaping.capped(cart, settings.MAX_LIST_ROWS)
+        if not cart:
             return Response({"message": "The cart is empty."}, status.HTTP_400_BAD_REQUEST)
-        # serialized_item = serializers.MenuItemSerializer(cart.menuitem_id)
-        serialized_item = serializers.CartSerializer(cart)
-        return Response(serialized_item.data, status.HTTP_200_OK)
+        return _capped_list(cart, truncated, serializers.CartSerializer, request)
     if request.method == 'POST':
-        if models.Cart.objects.filter(user=request.user).exists():
-            return Response({"message": "The user has already a cart."}, status.HTTP_400_BAD_REQUEST)
-        menuitem = request.data["menuitem"]
+        try:
+            menuitem = int(request.data["menuitem"])
+        except (TypeError, ValueError):
+            return Response({"message": "menuitem must be an integer."}, status.HTTP_400_BAD_REQUEST)
         quantity = request.data["quantity"]
-        unit_price = models.MenuItem.objects.get(pk=menuitem).price
+        # priced from the in-memory catalog, no menu item query
+        unit_price = catalog.get_catalog().price(menuitem)
+        if unit_price is None:
+            return Response({"message": "Menu item does not exist."}, status.HTTP_404_NOT_FOUND)
+        if models.Cart.objects.filter(user=request.user, menuitem_id=menuitem).exists():
+            return Response({"message": "The menu item is already in the cart."}, status.HTTP_400_BAD_REQUEST)
         price = Decimal(quantity) * unit_price
         data = {"menuitem_id": menuitem, 
                 "quantity": quantity,
@@ -329,116 +432,227 @@ def cart(request):
         message = 'Cart is created.'
         return Response({"message": message}, status.HTTP_201_CREATED)
     if request.method == 'DELETE':
-        cart = get_object_or_404(models.Cart, user=request.user)
-        cart.delete()
+        deleted, _ = models.Cart.objects.filter(user=request.user).delete()
+        if not deleted:
+            return Response({"message": "The cart is empty."}, status.HTTP_404_NOT_FOUND)
         return Response(status.HTTP_204_NO_CONTENT)
 
+# endpoint: /api/cart/menu-items/batch
+# allow POST for Customer
+# POST: Sets the quantity of many cart lines in one request. Body: {"items": [{"menuitem": id, "quantity": n}, ...]}
+#       A quantity of 0 removes the line, and a line may not cost more than 9999.99. All lines are validated together and applied in one transaction,
+#       so either every line is applied or none is. Returns the outcome of each line in request order.
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle])
+def cart_batch(request):
+    if not isinstance(request.data, dict):
+        return Response({"message": "The body must be an object with an items list."}, status.HTTP_400_BAD_REQUEST)
+    serialized_items = serializers.CartBatchItemSerializer(
+        data=request.data.get("items"), many=True, allow_empty=False, max_length=BATCH_MAX_ITEMS)
+    serialized_items.is_valid(raise_exception=True)
+    items = serialized_items.validated_data
+    menuitem_ids = [item["menuitem"] for item in items]
+    menu = catalog.get_catalog()
+    errors, seen = [], set()
+    for item in items:
+        if menu.get(item["menuitem"]) is None:
+            errors.append({"menuitem": ["Menu item does not exist."]})
+        elif item["menuitem"] in seen:
+            errors.append({"menuitem": ["Menu item appears more than once."]})
+        elif item["quantity"] * menu.price(item["menuitem"]) > CART_MAX_PRICE:
+            errors.append({"quantity": [f"The line price may not exceed {CART_MAX_PRICE}."]})
+        else:
+            errors.append({})
+        seen.add(item["menuitem"])
+    if any(errors):
+        return Response(errors, status.HTTP_400_BAD_REQUEST)
+
+    results, to_create, to_update, to_remove = [], [], [], []
+    with transaction.atomic():
+        lines = {line.menuitem_id: line for line in
+                 models.Cart.objects.select_for_update().filter(user=request.user, menuitem_id__in=menuitem_ids)}
+        for item in items:
+            menuitem, quantity = item["menuitem"], item["quantity"]
+            line = lines.get(menuitem)
+            if quantity == 0:
+                if line:
+                    to_remove.append(menuitem)
+                results.append({"menuitem": menuitem, "quantity": 0, "result": "removed"})
+                continue
+            unit_price = menu.price(menuitem)
+            if line:
+                line.quantity, line.unit_price, line.price = quantity, unit_price, quantity * unit_price
+                to_update.append(line)
+                results.append({"menuitem": menuitem, "quantity": quantity, "result": "updated"})
+            else:
+                to_create.append(models.Cart(user=request.user, menuitem_id=menuitem, quantity=quantity,
+                                             unit_price=unit_price, price=quantity * unit_price))
+                results.append({"menuitem": menuitem, "quantity": quantity, "result": "created"})
+        models.Cart.objects.bulk_create(to_create)
+        models.Cart.objects.bulk_update(to_update, ['quantity', 'unit_price', 'price'])
+        models.Cart.objects.filter(user=request.user, menuitem_id__in=to_remove).delete()
+    return Response({"results": results}, status.HTTP_200_OK)
+
+# Lists without pagination return at most settings.MAX_LIST_ROWS rows; a cut list is flagged with X-Truncated
+def _capped_list(rows, truncated, serializer_class, request):
+    response = Response(serializer_class(rows, many=True, context={'request': request}).data, status.HTTP_200_OK)
+    if truncated:
+        response['X-Truncated'] = 'true'
+    return response
+
+def _include_archived(request):
+    return menu_index.BOOLEAN_VALUES.get(request.query_params.get('include_archived'), False)
+
+# A page of live and archived orders matching `lookups`, newest first (page, perpage; default 10)
+def _archived_order_page(request, **lookups):
+    try:
+        perpage = min(max(int(request.query_params.get('perpage', 10)), 1), 100)
+        page = max(int(request.query_params.get('page', 1)), 1)
+    except ValueError:
+        return Response({"message": "page and perpage must be integers."}, status.HTTP_400_BAD_REQUEST)
+    rows = archive.order_rows(models.Order.objects.filter(**lookups), models.ArchivedOrder.objects.filter(**lookups))
+    return Response(shaping.Plan(rows.order_by('-id'), page, perpage).page_of(), status.HTTP_200_OK)
+
 # endpoint: /api/orders
 # allow GET for all users, POST for Customer
-# GET: Customer: Returns all orders with order items created by this user
+# GET: Customer: Returns the user's order summary and a page of their orders, newest first (page, perpage)
+#      Every role: with ?include_archived=true the list also covers archived orders. Rows of both tiers then have
+#                  the same flat shape: id, user and delivery_crew ids, status, total, date, the order item's
+#                  menuitem id, quantity, unit_price and price, and `archived`. fields and expand do not apply.
 #      Manager: Returns all orders with order items by all users
-#      Delivery crew: Returns all orders with order items assigned to the delivery crew
+#      Delivery crew: Returns a page of the orders assigned to the delivery crew, open ones first, then newest
+#                     first (page, perpage; default 50)
 # POST: Creates a new order item for the current user. 
-#       Gets current cart items from the cart endpoints and adds those items to the order items table. 
-#       Then deletes all items from the cart for this user.
+#       Gets current cart items from the cart endpoints and adds those items to the order items table,
+#       one order per cart line. Then deletes all items from the cart for this user.
+#       A retry sent with the same Idempotency-Key header gets the first response back (see idempotency.py).
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([UserRateThrottle])
 def order(request):
     if request.method == 'GET':
-        if request.user.groups.filter(name='Manager').exists():
-            orders = models.Order.objects.all()
-            to_price = request.query_params.get('to_price')
-            search = request.query_params.get('search')
-            ordering = request.query_params.get('ordering')
-            perpage = request.query_params.get('perpage', default=2)
-            page = request.query_params.get('page', default=1)
-            if to_price:
-                orders = orders.filter(total__lte=to_price)
-            if search:
-                orders = orders.filter(status__icontains=search)
-            if ordering:
-                ordering_fields = ordering.split(",")
-                orders = orders.order_by(*ordering_fields)
-            
-            paginator = Paginator(orders, per_page=perpage)
+        if groups.in_group(request.user, groups.MANAGER):
             try:
-                orders = paginator.page(number=page)
-            except EmptyPage:
-                orders = []
-            serialized_order = serializers.OrderSerializer(orders, many=True)
+                if _include_archived(request):
+                    ordering, lookups, page, perpage = ORDERS_SHAPE.parse(request.query_params)
+                    rows = archive.order_rows(models.Order.objects.filter(**lookups),
+                                              models.ArchivedOrder.objects.filter(**lookups))
+                    return Response(shaping.Plan(rows.order_by(*ordering), page, perpage).page_of(), status.HTTP_200_OK)
+                plan = ORDERS_SHAPE.plan(request.query_params)
+            except ValueError as e:
+                return Response({"message": str(e)}, status.HTTP_400_BAD_REQUEST)
+            orders = serializers.shape_queryset(plan.queryset, serializers.OrderSerializer, request)
+            orders = plan.page_of(orders)
+            serialized_order = serializers.OrderSerializer(orders, many=True, context={'request': request})
             return Response(serialized_order.data, status.HTTP_200_OK)
-        elif request.user.groups.filter(name='Delivery crew').exists():
-            orders = models.Order.objects.filter(delivery_crew=request.user)
-            serialized_order = serializers.OrderSerializer(orders, many=True)
+        elif groups.in_group(request.user, groups.DELIVERY_CREW):
+            if _include_archived(request):
+                return _archived_order_page(request, delivery_crew=request.user)
+            try:
+                plan = CREW_ORDERS_SHAPE.plan(request.query_params)
+            except ValueError as e:
+                return Response({"message": str(e)}, status.HTTP_400_BAD_REQUEST)
+            orders = serializers.shape_queryset(plan.queryset.filter(delivery_crew=request.user),
+                                                serializers.OrderSerializer, request)
+            serialized_order = serializers.OrderSerializer(plan.page_of(orders), many=True, context={'request': request})
             return Response(serialized_order.data, status.HTTP_200_OK)
         else: # customer view
-            if models.Order.objects.filter(user=request.user).exists():
-                order = models.Order.objects.filter(user=request.user)
-                serialized_order = serializers.OrderSerializer(order)
-                return Response(serialized_order.data, status.HTTP_200_OK)
+            # the summary row replaces a COUNT over the user's orders, and the page itself
+            # is a single range scan on the (user, -id) index
+            try:
+                perpage = min(max(int(request.query_params.get('perpage', 10)), 1), 100)
+                page = max(int(request.query_params.get('page', 1)), 1)
+            except ValueError:
+                return Response({"message": "page and perpage must be integers."}, status.HTTP_400_BAD_REQUEST)
+            summary = rollups.get_user_summary(request.user.id)
+            if _include_archived(request):
+                results = _archived_order_page(request, user=request.user).data
             else:
-                return Response(status.HTTP_404_NOT_FOUND)
+                offset = (page - 1) * perpage
+                orders = models.Order.objects.filter(user=request.user)
+                orders = serializers.shape_queryset(orders, serializers.OrderSerializer, request)
+                orders = orders.order_by('-id')[offset:offset + perpage]
+                results = serializers.OrderSerializer(orders, many=True, context={'request': request}).data
+            return Response({
+                "summary": serializers.UserOrderSummarySerializer(summary).data,
+                "results": results,
+            }, status.HTTP_200_OK)
     if request.method == 'POST':
-        cart = get_object_or_404(models.Cart, user=request.user)
-        # create order and orderitem
-        
-        orderitem_data = {
-            "user_id": cart.user_id,
-            "menuitem_id": cart.menuitem_id,
-            "quantity": cart.quantity,
-            "unit_price": cart.unit_price,
-            "price": cart.price
-        }
-        serialized_orderitem = serializers.OrderItemSerializer(data=orderitem_data)
-        serialized_orderitem.is_valid(raise_exception=True)
-        serialized_orderitem.save()
-        orderitem = models.OrderItem.objects.get(user=request.user, menuitem=cart.menuitem)
-        order_data = {
-            "user_id": cart.user_id,
-            "total": cart.price,
-            "orderitem_id": orderitem.id,
-        }
-        serialized_order = serializers.OrderSerializer(data=order_data)
-        serialized_order.is_valid(raise_exception=True)
-        serialized_order.save()
-        
-        cart.delete()
-        message = 'Order is created.'
-        return Response({"message": message}, status.HTTP_201_CREATED)
+        return idempotency.run(request, lambda: _create_orders(request))
     return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN) 
 
+def _create_orders(request):
+    cart = models.Cart.objects.filter(user=request.user)
+    if not cart:
+        return Response({"message": "The cart is empty."}, status.HTTP_404_NOT_FOUND)
+    # create an order and orderitem per cart line, and account for them in the sales rollups
+    with transaction.atomic():
+        for line in cart:
+            order = _checkout(line)
+            rollups.record_checkout(order)
+    message = 'Order is created.'
+    return Response({"message": message}, status.HTTP_201_CREATED)
+
+# Turns a cart line into an order item and an order, then removes the line.
+# Must be called inside a transaction.
+def _checkout(cart):
+    orderitem_data = {
+        "user_id": cart.user_id,
+        "menuitem_id": cart.menuitem_id,
+        "quantity": cart.quantity,
+        "unit_price": cart.unit_price,
+        "price": cart.price
+    }
+    serialized_orderitem = serializers.OrderItemSerializer(data=orderitem_data)
+    serialized_orderitem.is_valid(raise_exception=True)
+    orderitem = serialized_orderitem.save()
+    order_data = {
+        "user_id": cart.user_id,
+        "total": cart.price,
+        "orderitem_id": orderitem.id,
+    }
+    serialized_order = serializers.OrderSerializer(data=order_data)
+    serialized_order.is_valid(raise_exception=True)
+    order = serialized_order.save()
+    cart.delete()
+    return order
+
 # endpoint: /api/orders/{orderId}
 # allow GET, PUT, PATCH for Customer, DELETE for Manager, PATCH for Delivery crew
 # GET: Customer: Returns all items for this order id. 
 #                If the order ID doesn’t belong to the current user, it displays an appropriate HTTP error status code.
-# PUT, PATCH: Updates the order. 
+# GET, PUT, PATCH and DELETE use the order's row version as ETag: GET answers If-None-Match with 304,
+# writes with a stale If-Match get 412 (see versioning.py).
+# PUT, PATCH: Updates the order and returns it with 200 OK. 
 #             A manager can use this endpoint to set a delivery crew to this order, and also update the order status to 0 or 1.
 #             If a delivery crew is assigned to this order and the status = 0, it means the order is out for delivery.
 #             If a delivery crew is assigned to this order and the status = 1, it means the order has been delivered.
 # PATCH: Delivery crew: A delivery crew can use this endpoint to update the order status to 0 or 1. 
 #                       The delivery crew will not be able to update anything else in this order.
-# DELETE: Manager: Deletes this order
+# DELETE: Manager: Deletes this order (it is moved to the archive as deleted, see archive.py)
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([UserRateThrottle])
 def order_single(request, id):
-    order = get_object_or_404(models.Order, pk=id)
+    order = ORDER_BY_PK.get_or_404(id)
     if request.method == 'GET':
         if order.user != request.user:
             return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
-        serialized_order = serializers.OrderSerializer(order)
-        return Response(serialized_order.data, status.HTTP_200_OK)
+        if versioning.not_modified(request, order):
+            return versioning.not_modified_response(order)
+        serialized_order = serializers.OrderSerializer(order, context={'request': request})
+        return Response(serialized_order.data, status.HTTP_200_OK, headers={'ETag': versioning.etag(order)})
     if request.method == 'PUT':
         # only manager could perform PUT action
-        if not request.user.groups.filter(name='Manager').exists():
+        if not groups.in_group(request.user, groups.MANAGER):
             return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN) 
         serialized_item = serializers.OrderSerializer(order, data=request.data)
         serialized_item.is_valid(raise_exception=True)
-        serialized_item.save()
-        return Response(serialized_item.data, status.HTTP_205_RESET_CONTENT)
+        _save_order_update(request, serialized_item, order)
+        return Response(serialized_item.data, status.HTTP_200_OK, headers={'ETag': versioning.etag(order)})
     if request.method == 'PATCH':
-        if request.user.groups.filter(name='Delivery crew').exists(): 
+        if groups.in_group(request.user, groups.DELIVERY_CREW): 
             # delivery crew can only PATCH the order where the delivery crew is him/her.
             if order.delivery_crew != request.user:
                 return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
@@ -447,20 +661,208 @@ def order_single(request, id):
             status_data = {"status": deliverystatus}
             serialized_item = serializers.OrderSerializer(order, data=status_data, partial=True)
             serialized_item.is_valid(raise_exception=True)
-            serialized_item.save()
-            return Response(serialized_item.data, status.HTTP_205_RESET_CONTENT)
-        if request.user.groups.filter(name='Manager').exists():
+            _save_order_update(request, serialized_item, order)
+            return Response(serialized_item.data, status.HTTP_200_OK, headers={'ETag': versioning.etag(order)})
+        if groups.in_group(request.user, groups.MANAGER):
             serialized_item = serializers.OrderSerializer(order, data=request.data, partial=True)
             serialized_item.is_valid(raise_exception=True)
-            serialized_item.save()
-            return Response(serialized_item.data, status.HTTP_205_RESET_CONTENT)
+            _save_order_update(request, serialized_item, order)
+            return Response(serialized_item.data, status.HTTP_200_OK, headers={'ETag': versioning.etag(order)})
         return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN) 
     if request.method == 'DELETE':
-        if not request.user.groups.filter(name='Manager').exists():
+        if not groups.in_group(request.user, groups.MANAGER):
             return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
-        order.delete()
+        with transaction.atomic():
+            versioning.claim(request, order)
+            # the rollups read the order item, which moving the order to the archive deletes
+            order = models.Order.objects.select_related('orderitem__menuitem').get(pk=order.pk)
+            archive.delete_order(order)
+            rollups.record_order_delete(order)
         return Response(status.HTTP_204_NO_CONTENT)
 
+# endpoint: /api/orders/bulk
+# allow POST for Manager
+# POST: Assigns a delivery crew and/or sets the status of many orders at once.
+#       Body: {"orders": [id, ...], "delivery_crew": userId or null, "status": 0 or 1}
+#       Up to 1000 orders, updated in one statement. Returns how many were updated and which ids do not exist.
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle])
+def order_bulk(request):
+    if not groups.in_group(request.user, groups.MANAGER):
+        return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
+    serialized_item = serializers.OrderBulkUpdateSerializer(data=request.data)
+    serialized_item.is_valid(raise_exception=True)
+    values = dict(serialized_item.validated_data)
+    order_ids = values.pop('orders')
+    if values.get('delivery_crew') is not None:
+        crew = USER_BY_PK.first(values['delivery_crew'])
+        if crew is None:
+            return Response({"message": "Delivery crew user does not exist."}, status.HTTP_400_BAD_REQUEST)
+        values['delivery_crew'] = crew
+    try:
+        updated, missing = assignment.update_orders(order_ids, **values)
+    except assignment.InvalidCrew as e:
+        return Response({"message": str(e)}, status.HTTP_400_BAD_REQUEST)
+    return Response({"updated": len(updated), "not_found": missing}, status.HTTP_200_OK)
+
+# endpoint: /api/dispatcher
+# allow GET for Manager
+# GET: Returns the latest metrics of the dispatch worker (`manage.py dispatch`): queue depth, crew count,
+#      orders assigned, and p50/p95 assignment latency in seconds
+@api_view()
+@permission_classes([IsAuthenticated])
+@throttle_classes([UserRateThrottle])
+def dispatcher_status(request):
+    if not groups.in_group(request.user, groups.MANAGER):
+        return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
+    current = models.DispatcherStatus.objects.filter(pk=1).first()
+    if current is None:
+        return Response({"message": "The dispatcher has not run yet."}, status.HTTP_404_NOT_FOUND)
+    return Response(serializers.DispatcherStatusSerializer(current).data, status.HTTP_200_OK)
+
+# Saves an order update and applies the crew/status change to the rollups
+# in the same transaction. The row version is checked against If-Match first.
+def _save_order_update(request, serialized_item, order):
+    old = rollups.snapshot(order)
+    with transaction.atomic():
+        versioning.claim(request, order)
+        order = serialized_item.save()
+        rollups.record_order_update(order, old)
+    return order
+
+
+# Largest and default number of change log entries per /api/changes batch
+CHANGES_MAX_LIMIT = 1000
+CHANGES_DEFAULT_LIMIT = 500
+
+
+def _visible_orders(user):
+    if groups.in_group(user, groups.MANAGER):
+        return models.Order.objects.all()
+    if groups.in_group(user, groups.DELIVERY_CREW):
+        return models.Order.objects.filter(delivery_crew=user)
+    return models.Order.objects.filter(user=user)
+
+
+def _visible_bookings(user):
+    if groups.in_group(user, groups.MANAGER):
+        return models.Booking.objects.all()
+    return models.Booking.objects.filter(customer_name=user.username)
+
+# endpoint: /api/changes?since=<cursor>
+# allow GET for all authenticated users
+# GET: Returns the categories, menu items, orders and bookings created, updated or deleted after `since`
+#      (default 0: everything), in batches of at most `limit` changes (default 500, max 1000), with the
+#      cursor to pass next time and whether more changes are waiting. Customers and the delivery crew
+#      get only the changes of their own orders and bookings (see changes.py); a row taken away from
+#      them, such as an order reassigned to another crew member, is listed as deleted.
+@api_view()
+@permission_classes([IsAuthenticated])
+def changes_view(request):
+    try:
+        cursor = max(int(request.query_params.get('since', 0)), 0)
+        limit = min(max(int(request.query_params.get('limit', CHANGES_DEFAULT_LIMIT)), 1), CHANGES_MAX_LIMIT)
+    except ValueError:
+        return Response({"message": "since and limit must be integers."}, status.HTTP_400_BAD_REQUEST)
+    user = None if groups.in_group(request.user, groups.MANAGER) else request.user
+    changed, next_cursor, has_more = changes.since(cursor, limit, user)
+    sources = {
+        'category': (models.Category.objects.all(), serializers.CategorySerializer),
+        'menuitem': (models.MenuItem.objects.all(), serializers.MenuItemSerializer),
+        'order': (_visible_orders(request.user), serializers.OrderSerializer),
+        'booking': (_visible_bookings(request.user), serializers.BookingSerializer),
+    }
+    data = {}
+    for kind, (queryset, serializer_class) in sources.items():
+        ids = changed[kind]["upserted"]
+        rows = list(queryset.filter(pk__in=ids).order_by('pk')) if ids else []
+        data[kind] = {
+            "upserted": serializer_class(rows, many=True, context={'request': request}).data,
+            "deleted": changed[kind]["deleted"],
+        }
+    return Response({"cursor": next_cursor, "has_more": has_more, "changes": data}, status.HTTP_200_OK)
+
+
+# Analytics endpoints read only the rollup tables maintained by rollups.py,
+# so their cost grows with the number of days requested, not with the number of orders.
+# Query params: from, to (YYYY-MM-DD). Default range is the last 30 days.
+def _analytics_range(request):
+    if not groups.in_group(request.user, groups.MANAGER):
+        return None, Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
+    try:
+        return rollups.parse_date_range(request.query_params), None
+    except ValueError as e:
+        return None, Response({"message": str(e)}, status.HTTP_400_BAD_REQUEST)
+
+# endpoint: /api/analytics/sales
+# allow GET for Manager only
+# GET: Returns orders, items sold and revenue per day and category
+@api_view()
+@permission_classes([IsAuthenticated])
+def analytics_sales(request):
+    date_range, error = _analytics_range(request)
+    if error:
+        return error
+    rows = (models.DailySales.objects.filter(date__range=date_range)
+            .values('date', 'category_id', 'category__title', 'orders', 'items_sold', 'revenue')
+            .order_by('date', 'category_id'))
+    data = [{
+        "date": row['date'],
+        "category_id": row['category_id'],
+        "category": row['category__title'],
+        "orders": row['orders'],
+        "items_sold": row['items_sold'],
+        "revenue": row['revenue'],
+    } for row in rows]
+    return Response({"from": date_range[0], "to": date_range[1], "results": data}, status.HTTP_200_OK)
+
+# endpoint: /api/analytics/best-sellers
+# allow GET for Manager only
+# GET: Returns the menu items with the highest quantity sold in the range. Optional `limit` (default 10, max 100)
+@api_view()
+@permission_classes([IsAuthenticated])
+def analytics_best_sellers(request):
+    date_range, error = _analytics_range(request)
+    if error:
+        return error
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+    except ValueError:
+        return Response({"message": "limit must be an integer."}, status.HTTP_400_BAD_REQUEST)
+    rows = (models.MenuItemSales.objects.filter(date__range=date_range)
+            .values('menuitem_id', 'menuitem__name')
+            .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+            .order_by('-total_quantity', 'menuitem_id')[:limit])
+    data = [{
+        "menuitem_id": row['menuitem_id'],
+        "name": row['menuitem__name'],
+        "quantity": row['total_quantity'],
+        "revenue": row['total_revenue'],
+    } for row in rows]
+    return Response({"from": date_range[0], "to": date_range[1], "results": data}, status.HTTP_200_OK)
+
+# endpoint: /api/analytics/crew
+# allow GET for Manager only
+# GET: Returns the number of orders assigned to and delivered by each delivery crew member
+@api_view()
+@permission_classes([IsAuthenticated])
+def analytics_crew(request):
+    date_range, error = _analytics_range(request)
+    if error:
+        return error
+    rows = (models.CrewDeliveryStats.objects.filter(date__range=date_range)
+            .values('delivery_crew_id', 'delivery_crew__username')
+            .annotate(total_assigned=Sum('assigned'), total_delivered=Sum('delivered'))
+            .order_by('-total_delivered', 'delivery_crew_id'))
+    data = [{
+        "delivery_crew": row['delivery_crew_id'],
+        "username": row['delivery_crew__username'],
+        "assigned": row['total_assigned'],
+        "delivered": row['total_delivered'],
+    } for row in rows]
+    return Response({"from": date_range[0], "to": date_range[1], "results": data}, status.HTTP_200_OK)
+
 
 class IsManagerOrReadOnly(IsAuthenticated):
     def has_permission(self, request, view):
@@ -468,7 +870,62 @@ class IsManagerOrReadOnly(IsAuthenticated):
             return False
         if request.method in ['GET', 'HEAD', 'OPTIONS']:
             return True
-        return request.user.groups.filter(name='Manager').exists()
+        return groups.in_group(request.user, groups.MANAGER)
+
+
+# Prunes the columns and joins of read queries to the fields requested with ?fields= and ?expand=
+class SparseFieldsMixin:
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method == 'GET':
+            queryset = serializers.shape_queryset(queryset, self.get_serializer_class(), self.request)
+        return queryset
+
+
+# Filters the menu with the search index (?search=) and orders the matches by rank
+# unless the client asked for an explicit ?ordering=
+class MenuSearchFilter(filters.BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get('search', '').strip()
+        if not query:
+            return queryset
+        ids = search_module.search_ids(query)
+        queryset = queryset.filter(pk__in=ids)
+        if 'ordering' not in request.query_params and ids:
+            rank = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)])
+            queryset = queryset.order_by(rank)
+        return queryset
+
+
+# Filters the menu by ?from_price= and ?to_price= (inclusive)
+class PriceRangeFilter(filters.BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        try:
+            price_range = menu_index.parse_price_range(request.query_params)
+        except ValueError as e:
+            raise ValidationError({"message": str(e)})
+        return _filter_price_range(queryset, 'price', price_range)
+
+
+class LazyDjangoFilterBackend(filters.BaseFilterBackend):
+    """
+    django-filter's DjangoFilterBackend, imported on first use. django_filters
+    costs about a third of the import time of this module, and most menu
+    lists are answered from the menu index without it.
+    """
+
+    def _backend(self):
+        from django_filters.rest_framework import DjangoFilterBackend
+        return DjangoFilterBackend()
+
+    def filter_queryset(self, request, queryset, view):
+        return self._backend().filter_queryset(request, queryset, view)
+
+    def to_html(self, request, queryset, view):
+        return self._backend().to_html(request, queryset, view)
+
+    def get_schema_operation_parameters(self, view):
+        return self._backend().get_schema_operation_parameters(view)
 
 
 class LittleLemonPagination(PageNumberPagination):
@@ -477,16 +934,60 @@ class LittleLemonPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class MenuViewSet(viewsets.ModelViewSet):
+class MenuViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = models.MenuItem.objects.all()
     serializer_class = serializers.MenuItemSerializer
     permission_classes = [IsManagerOrReadOnly]
     pagination_class = LittleLemonPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [LazyDjangoFilterBackend, PriceRangeFilter, shaping.ShapedOrderingFilter, MenuSearchFilter]
     filterset_fields = ['category', 'featured', 'price']
-    search_fields = ['name', 'description']
-    ordering_fields = ['name', 'price', 'category']
+    query_shape = shaping.QueryShape(models.MenuItem, orderings=['name', 'price', 'category'], default_ordering=['name'])
+    ordering_fields = list(query_shape.orderings)
     ordering = ['name']
+    # query params the in-memory menu index can answer; anything else goes to SQL
+    indexed_list_params = {'category', 'featured', 'price', 'from_price', 'to_price',
+                           'ordering', 'page', 'page_size', 'fields', 'expand', 'facets'}
+    histogram_params = {'category', 'featured', 'from_price', 'to_price', 'buckets'}
+
+    def list(self, request, *args, **kwargs):
+        response = self._list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and menu_index.BOOLEAN_VALUES.get(request.query_params.get('facets')):
+            response.data['facets'] = self.get_facets(request)
+        return response
+
+    def _list(self, request, *args, **kwargs):
+        if not set(request.query_params) <= self.indexed_list_params:
+            return super().list(request, *args, **kwargs)
+        index = menu_index.get_index()
+        plan = menu_index.parse_params(request.query_params, index, default_ordering=self.ordering[0])
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        ordering, filters = plan
+        page_ids = self.paginate_queryset(index.query(ordering, **filters))
+        rows = serializers.shape_queryset(self.get_queryset().filter(pk__in=page_ids), self.get_serializer_class(), request)
+        rows = {item.pk: item for item in rows}
+        page = [rows[pk] for pk in page_ids if pk in rows]
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def get_facets(self, request):
+        """
+        Facet counts for ?facets=true, from the menu index and cached per catalog
+        version and filter set, so paging through a listing reuses them.
+        """
+        index = menu_index.get_index()
+        filters = menu_index.parse_filters(request.query_params, index)
+        if filters is None:
+            return None
+        query = request.query_params.get('search', '').strip()
+        key = repr((sorted(filters.items()), query))
+        key = 'menu-facets:%s:%s' % (index.version, hashlib.md5(key.encode()).hexdigest())
+        facets = cache.get(key)
+        if facets is None:
+            if query:
+                filters['ids'] = search_module.search_ids(query)
+            facets = index.facets(**filters)
+            cache.set(key, facets, settings.MENU_FACETS_CACHE_SECONDS)
+        return facets
 
     def get_permissions(self):
         if self.action == 'list' or self.action == 'retrieve':
@@ -496,35 +997,80 @@ class MenuViewSet(viewsets.ModelViewSet):
         return [permission() for permission in self.permission_classes]
 
     def create(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not groups.in_group(request.user, groups.MANAGER):
             return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
         return super().create(request, *args, **kwargs)
 
     def update(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not groups.in_group(request.user, groups.MANAGER):
             return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
         return super().update(request, *args, **kwargs)
 
     def partial_update(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not groups.in_group(request.user, groups.MANAGER):
             return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
         return super().partial_update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not groups.in_group(request.user, groups.MANAGER):
             return Response({"message": "You are not authorized."}, status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+    # endpoint: /api/menu/suggest/?q=<prefix>
+    # GET: Returns up to `limit` (default 10, max 20) menu items with a word starting with `q`, for autocomplete.
+    #      Served from the in-process search index, without a database query.
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 20)
+        except ValueError:
+            return Response({"message": "limit must be an integer."}, status.HTTP_400_BAD_REQUEST)
+        matches = search_module.suggest(request.query_params.get('q', ''), limit)
+        return Response([{"id": pk, "name": name} for pk, name in matches], status.HTTP_200_OK)
+
+    # endpoint: /api/menu/price-histogram/
+    # GET: Returns the number of menu items per price bucket, for a price facet. Accepts the list filters
+    #      category, featured, from_price and to_price, and `buckets` (default 5, max 20) equal-width buckets
+    #      between from_price/to_price or the lowest/highest matching price. Served from the menu index.
+    @action(detail=False, methods=['get'], url_path='price-histogram')
+    def price_histogram(self, request):
+        params = request.query_params
+        unknown = set(params) - self.histogram_params
+        if unknown:
+            return Response({"message": "Unsupported parameters: " + ", ".join(sorted(unknown))}, status.HTTP_400_BAD_REQUEST)
+        try:
+            buckets = min(max(int(params.get('buckets', 5)), 1), 20)
+        except ValueError:
+            return Response({"message": "buckets must be an integer."}, status.HTTP_400_BAD_REQUEST)
+        index = menu_index.get_index()
+        plan = menu_index.parse_params(params, index)
+        if plan is None:
+            return Response({"message": "Invalid filter value."}, status.HTTP_400_BAD_REQUEST)
+        _, filters = plan
+        bounds = index.price_bounds(**filters)
+        if bounds is None:
+            return Response({"count": 0, "buckets": []}, status.HTTP_200_OK)
+        low = bounds[0] if filters['from_price'] is None else filters['from_price']
+        high = bounds[1] if filters['to_price'] is None else filters['to_price']
+        edges = menu_index.histogram_edges(low, high, buckets)
+        counts = index.price_histogram(edges, **filters)
+        return Response({
+            "count": sum(counts),
+            "buckets": [{"from": edges[i], "to": edges[i + 1], "count": count} for i, count in enumerate(counts)],
+        }, status.HTTP_200_OK)
 
-class BookingViewSet(viewsets.ModelViewSet):
+
+class BookingViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = models.Booking.objects.all()
     serializer_class = serializers.BookingSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = LittleLemonPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [LazyDjangoFilterBackend, filters.SearchFilter, shaping.ShapedOrderingFilter]
     filterset_fields = ['date', 'number_of_guests']
     search_fields = ['customer_name', 'email', 'phone']
-    ordering_fields = ['date', 'time', 'customer_name', 'number_of_guests']
+    # ordering only on the (customer_name, date, time) and (date, time) indexes
+    query_shape = shaping.QueryShape(models.Booking, orderings=['date', 'time'], default_ordering=['date', 'time'])
+    ordering_fields = list(query_shape.orderings)
     ordering = ['date', 'time']
 
     def get_permissions(self):
@@ -535,31 +1081,153 @@ class BookingViewSet(viewsets.ModelViewSet):
         return [permission() for permission in self.permission_classes]
 
     def get_queryset(self):
-        if self.request.user.groups.filter(name='Manager').exists():
+        if groups.in_group(self.request.user, groups.MANAGER):
             return models.Booking.objects.all()
         return models.Booking.objects.filter(customer_name=self.request.user.username)
 
+    def get_archived_queryset(self):
+        if groups.in_group(self.request.user, groups.MANAGER):
+            return models.ArchivedBooking.objects.all()
+        return models.ArchivedBooking.objects.filter(customer_name=self.request.user.username)
+
+    # GET: with ?include_archived=true the list also covers archived bookings. Rows of both tiers then have the
+    #      fields of the live list plus an `archived` flag; fields does not apply.
+    #      Filters and search apply to both tiers; the union is ordered and paginated in SQL.
+    def list(self, request, *args, **kwargs):
+        if not _include_archived(request):
+            return super().list(request, *args, **kwargs)
+        live = self.filter_queryset(self.get_queryset())
+        archived = self.filter_queryset(self.get_archived_queryset())
+        ordering = shaping.ShapedOrderingFilter().get_ordering(request, live, self)
+        rows = archive.booking_rows(live, archived).order_by(*ordering)
+        return self.get_paginated_response(self.paginate_queryset(rows))
+
+    # POST: a retry sent with the same Idempotency-Key header gets the first response back (see idempotency.py)
+    def create(self, request, *args, **kwargs):
+        return idempotency.run(request, lambda: super(BookingViewSet, self).create(request, *args, **kwargs))
+
     def perform_create(self, serializer):
-        if not self.request.user.groups.filter(name='Manager').exists():
-            serializer.save(customer_name=self.request.user.username)
+        data = serializer.validated_data
+        with transaction.atomic():
+            capacity.reserve(data['date'], data['time'], data['number_of_guests'])
+            if not groups.in_group(self.request.user, groups.MANAGER):
+                serializer.save(customer_name=self.request.user.username)
+            else:
+                serializer.save()
+
+    def retrieve(self, request, *args, **kwargs):
+        booking = self.get_object()
+        if versioning.not_modified(request, booking):
+            return versioning.not_modified_response(booking)
+        return Response(self.get_serializer(booking).data, headers={'ETag': versioning.etag(booking)})
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # the version claim also locks the row, so concurrent updates of the same booking move its seats one at a time
+            versioning.claim(self.request, serializer.instance)
+            old = (models.Booking.objects.select_for_update()
+                   .values_list('date', 'time', 'number_of_guests').get(pk=serializer.instance.pk))
+            booking = serializer.save()
+            capacity.move(old, (booking.date, booking.time, booking.number_of_guests))
+        self.headers['ETag'] = versioning.etag(booking)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            versioning.claim(self.request, instance)
+            capacity.release(instance.date, instance.time, instance.number_of_guests)
+            archive.delete_booking(instance)
+
+    # endpoint: /api/bookings/batch/
+    # POST: Creates many bookings in one request. Body: {"mode": "atomic" | "partial", "bookings": [...]}
+    #       atomic (default): every booking is created or none is. Returns 201, or 400/409 with per-item errors.
+    #       partial: the valid bookings that fit are created and the rest are reported per item. Returns 207.
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        if not isinstance(request.data, dict):
+            return Response({"message": "The body must be an object with a bookings list."},
+                            status.HTTP_400_BAD_REQUEST)
+        mode = request.data.get('mode', 'atomic')
+        if mode not in ('atomic', 'partial'):
+            return Response({"message": "mode must be 'atomic' or 'partial'."}, status.HTTP_400_BAD_REQUEST)
+        items = request.data.get('bookings')
+        serializer = self.get_serializer(data=items, many=True, allow_empty=False, max_length=BATCH_MAX_ITEMS)
+        if serializer.is_valid():
+            valid = list(enumerate(serializer.validated_data))
+            results = [None] * len(valid)
+        elif mode == 'atomic' or not isinstance(items, list) or 'non_field_errors' in serializer.errors:
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
         else:
-            serializer.save()
+            # validate the items that passed once more to get their validated data
+            errors = serializer.errors
+            if isinstance(errors, dict):  # newer DRF versions key item errors by index
+                errors = [errors.get(i) for i in range(len(items))]
+            results = [{"status": status.HTTP_400_BAD_REQUEST, "errors": item_errors} if item_errors else None
+                       for item_errors in errors]
+            indexes = [i for i, result in enumerate(results) if result is None]
+            retry = self.get_serializer(data=[items[i] for i in indexes], many=True)
+            retry.is_valid(raise_exception=True)
+            valid = list(zip(indexes, retry.validated_data))
+
+        is_manager = groups.in_group(request.user, groups.MANAGER)
+        to_create = []
+        with transaction.atomic():
+            if mode == 'atomic':
+                seats = {}
+                for _, data in valid:
+                    slot = (data['date'], data['time'])
+                    seats[slot] = seats.get(slot, 0) + data['number_of_guests']
+                try:
+                    with transaction.atomic():
+                        for (slot_date, slot_time), guests in seats.items():
+                            capacity.reserve(slot_date, slot_time, guests)
+                except capacity.SlotUnavailable as e:
+                    return Response({"message": e.detail, "date": slot_date, "time": slot_time}, e.status_code)
+                to_create = valid
+            else:
+                for i, data in valid:
+                    try:
+                        capacity.reserve(data['date'], data['time'], data['number_of_guests'])
+                        to_create.append((i, data))
+                    except capacity.SlotUnavailable as e:
+                        results[i] = {"status": e.status_code, "errors": {"detail": e.detail}}
+            bookings = models.Booking.objects.bulk_create([
+                models.Booking(**data) if is_manager else models.Booking(**{**data, 'customer_name': request.user.username})
+                for _, data in to_create
+            ])
+            changes.record_many('booking', [booking.pk for booking in bookings])
+        for (i, _), booking in zip(to_create, bookings):
+            results[i] = {"status": status.HTTP_201_CREATED, "booking": self.get_serializer(booking).data}
+        response_status = status.HTTP_201_CREATED if mode == 'atomic' else status.HTTP_207_MULTI_STATUS
+        return Response({"mode": mode, "results": results}, response_status)
+
+    # endpoint: /api/bookings/availability/?date=YYYY-MM-DD&guests=N
+    # GET: Returns the configured time slots on `date` with at least `guests` free seats (default 1)
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        try:
+            date = datetime.date.fromisoformat(request.query_params.get('date', ''))
+            guests = int(request.query_params.get('guests', 1))
+        except ValueError:
+            return Response({"message": "date (YYYY-MM-DD) and guests (integer) are required."}, status.HTTP_400_BAD_REQUEST)
+        if guests < 1:
+            return Response({"message": "guests must be at least 1."}, status.HTTP_400_BAD_REQUEST)
+        return Response({"date": date, "guests": guests, "slots": capacity.availability(date, guests)}, status.HTTP_200_OK)
 
     def update(self, request, *args, **kwargs):
         booking = self.get_object()
-        if not request.user.groups.filter(name='Manager').exists() and booking.customer_name != request.user.username:
+        if not groups.in_group(request.user, groups.MANAGER) and booking.customer_name != request.user.username:
             return Response({"message": "You can only update your own bookings."}, status.HTTP_403_FORBIDDEN)
         return super().update(request, *args, **kwargs)
 
     def partial_update(self, request, *args, **kwargs):
         booking = self.get_object()
-        if not request.user.groups.filter(name='Manager').exists() and booking.customer_name != request.user.username:
+        if not groups.in_group(request.user, groups.MANAGER) and booking.customer_name != request.user.username:
             return Response({"message": "You can only update your own bookings."}, status.HTTP_403_FORBIDDEN)
         return super().partial_update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
         booking = self.get_object()
-        if not request.user.groups.filter(name='Manager').exists() and booking.customer_name != request.user.username:
+        if not groups.in_group(request.user, groups.MANAGER) and booking.customer_name != request.user.username:
             return Response({"message": "You can only delete your own bookings."}, status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark the peak memory of walking the order table in chunks against loading it.
+
+Grows a synthetic order table in a throwaway test database step by step up
+to --orders rows. At each size it measures the peak traced memory of
+`manage.py export_orders`, which streams the rows through batches.iterate(),
+and of the same rows loaded into a list. The streamed peak stays flat while
+the loaded one grows with the table.
+
+Usage:
+    python benchmarks/memory.py [--orders 1000000] [--steps 10000,100000,1000000] [--chunk-size 2000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Littlelemon.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test.runner import DiscoverRunner  # noqa: E402
+
+from LittlelemonAPI.models import Order  # noqa: E402
+from LittlelemonAPI.management.commands.export_orders import FIELDS  # noqa: E402
+
+
+def peak(fn):
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        fn()
+        return tracemalloc.get_traced_memory()[1], time.perf_counter() - started
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--steps', help='comma-separated table sizes to measure at (default: powers of ten up to --orders)')
+    parser.add_argument('--chunk-size', type=int, default=settings.BATCH_CHUNK_SIZE)
+    parser.add_argument('--skip-load', action='store_true', help='do not measure loading the table into a list')
+    args = parser.parse_args()
+    steps = sorted(int(step) for step in args.steps.split(',')) if args.steps else \
+        [10 ** n for n in range(4, 7) if 10 ** n < args.orders] + [args.orders]
+
+    # DEBUG would keep a log of the queries; the export itself does not need it
+    settings.DEBUG = False
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        user = User.objects.create_user(username='bench', password='bench')
+        print(f'{"orders":>9} {"streamed peak":>14} {"time":>8} {"loaded peak":>12} {"time":>8}')
+        rows = 0
+        for step in steps:
+            while rows < step:
+                batch = min(50000, step - rows)
+                Order.objects.bulk_create((Order(user=user, total=Decimal('10.00')) for _ in range(batch)),
+                                          batch_size=5000)
+                rows += batch
+            streamed, streamed_time = peak(lambda: call_command(
+                'export_orders', output=os.devnull, chunk_size=args.chunk_size, stderr=StringIO()))
+            line = f'{rows:9d} {streamed / 2 ** 20:11.1f} MB {streamed_time:7.2f}s'
+            if not args.skip_load:
+                loaded, loaded_time = peak(lambda: list(Order.objects.order_by('id').values_list(*FIELDS)))
+                line += f' {loaded / 2 ** 20:9.1f} MB {loaded_time:7.2f}s'
+            print(line, flush=True)
+    finally:
+        runner.teardown_databases(old_config)
+
+
+if __name__ == '__main__':
+    main()
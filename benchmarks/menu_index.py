@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark the in-memory menu index against SQL for MenuViewSet list queries.
+
+Builds a synthetic menu in a throwaway test database and times one page
+(count + 10 rows) of each filter/ordering combination both ways.
+
+Usage:
+    python benchmarks/menu_index.py [--items 50000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Littlelemon.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test.runner import DiscoverRunner  # noqa: E402
+
+from LittlelemonAPI import catalog, menu_index  # noqa: E402
+from LittlelemonAPI.models import Category, MenuItem  # noqa: E402
+
+PAGE_SIZE = 10
+
+
+def populate(items):
+    rng = random.Random(42)
+    categories = Category.objects.bulk_create(
+        Category(slug=f'category-{i}', title=f'Category {i}') for i in range(20)
+    )
+    MenuItem.objects.bulk_create(
+        (MenuItem(name=f'Dish {rng.randrange(10 ** 6):06d}', price=Decimal(rng.randrange(100, 5000)) / 100,
+                  category=rng.choice(categories), featured=rng.random() < 0.1)
+         for _ in range(items)),
+        batch_size=5000,
+    )
+    catalog.invalidate()
+    return categories
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        categories = populate(args.items)
+        start = time.perf_counter()
+        index = menu_index.get_index()
+        print(f'{args.items} items: snapshot + index built in {(time.perf_counter() - start) * 1000:.0f} ms\n')
+
+        cases = [
+            ('ordering=name', 'name', {}),
+            ('ordering=-price', '-price', {}),
+            ('category=X&ordering=price', 'price', {'category': categories[3].id}),
+            ('featured=true&ordering=-name', '-name', {'featured': True}),
+            ('category=X&featured=false&ordering=category', 'category', {'category': categories[7].id, 'featured': False}),
+        ]
+        print(f'{"query":<48}{"SQL ms":>10}{"index ms":>10}')
+        for label, ordering, filters in cases:
+            def sql():
+                queryset = MenuItem.objects.filter(**filters).order_by(ordering)
+                queryset.count()
+                list(queryset[:PAGE_SIZE])
+
+            def indexed():
+                ids = index.query(ordering, **filters)
+                len(ids)
+                list(MenuItem.objects.filter(pk__in=ids[:PAGE_SIZE]))
+
+            print(f'{label:<48}{timed(sql, args.repeat):>10.2f}{timed(indexed, args.repeat):>10.2f}')
+    finally:
+        runner.teardown_databases(old_config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark the ORM overhead of the hot point lookups against compiled templates.
+
+Times, per call, the lookups a detail request makes: fetching an order by
+primary key and checking the user's group, once through the ORM as the
+views used to and once through compiled.Template and groups.in_group.
+
+Usage:
+    python benchmarks/orm_overhead.py [--calls 5000]
+"""
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Littlelemon.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import Group, User  # noqa: E402
+from django.shortcuts import get_object_or_404  # noqa: E402
+from django.test.runner import DiscoverRunner  # noqa: E402
+
+from LittlelemonAPI import groups, views  # noqa: E402
+from LittlelemonAPI.models import Order  # noqa: E402
+
+
+def per_call(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 10 ** 6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=5000)
+    args = parser.parse_args()
+
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        user = User.objects.create_user(username='bench', password='bench')
+        user.groups.add(Group.objects.create(name=groups.MANAGER))
+        order = Order.objects.create(user=user, total=Decimal('10.00'))
+
+        cases = [
+            ('order by pk',
+             lambda: get_object_or_404(Order, pk=order.pk),
+             lambda: views.ORDER_BY_PK.get_or_404(order.pk)),
+            ('manager check',
+             lambda: user.groups.filter(name=groups.MANAGER).exists(),
+             lambda: groups.in_group(user, groups.MANAGER)),
+            ('group by name',
+             lambda: Group.objects.get(name=groups.MANAGER),
+             lambda: groups.get_group(groups.MANAGER)),
+        ]
+        print(f'{"lookup":<20}{"ORM us":>10}{"compiled us":>14}')
+        for label, orm, compiled in cases:
+            orm_time, compiled_time = per_call(orm, args.calls), per_call(compiled, args.calls)
+            print(f'{label:<20}{orm_time:>10.1f}{compiled_time:>14.1f}')
+    finally:
+        runner.teardown_databases(old_config)
+
+
+if __name__ == '__main__':
+    main()
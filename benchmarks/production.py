@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark the production settings against the default settings.
+
+Runs each settings profile in its own process on a throwaway test database
+with a synthetic menu and bookings, and sends authenticated menu and booking
+list requests through the full middleware stack. Reports per profile and list:
+
+    req/s       requests per second
+    bytes       response body size (gzipped where the profile compresses)
+    304 req/s   requests per second when the client revalidates with If-None-Match
+    retained    memory still allocated after another round of the same
+                requests
+    queries     queries held in the connection's query log
+
+The worker row runs --worker-queries queries outside a request, as a
+management command does. Nothing resets the query log there, so with DEBUG
+on it keeps up to 9000 queries.
+
+Usage:
+    python benchmarks/production.py [--requests 2000] [--items 200] [--page-size 50]
+        [--worker-queries 5000]
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import django  # noqa: E402
+from django.db import connection  # noqa: E402
+
+PROFILES = ('Littlelemon.settings', 'Littlelemon.production_settings')
+# the menu list is answered from the in-memory index, the booking list from SQL
+PATHS = ('/api/menu/', '/api/bookings/')
+
+
+def measure(client, path, requests):
+    response = client.get(path)
+    assert response.status_code == 200, (path, response.status_code)
+    for _ in range(20):
+        client.get(path)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(path)
+    elapsed = time.perf_counter() - started
+
+    connection.queries_log.clear()
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for _ in range(requests):
+        client.get(path)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    revalidated = None
+    if response.has_header('ETag'):
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        revalidated = requests / (time.perf_counter() - started)
+    return {
+        'rps': requests / elapsed,
+        'bytes': len(response.content),
+        'encoding': response.get('Content-Encoding', 'identity'),
+        'revalidated_rps': revalidated,
+        'retained_kb': retained / 1024,
+        'queries': len(connection.queries_log),
+    }
+
+
+def measure_worker(queries):
+    """Queries outside a request, as in a management command: nothing resets the query log."""
+    from LittlelemonAPI.models import MenuItem
+
+    connection.queries_log.clear()
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for pk in range(queries):
+        MenuItem.objects.filter(pk=pk).exists()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {'retained_kb': retained / 1024, 'queries': len(connection.queries_log)}
+
+
+def child(args):
+    """Runs in the spawned interpreter under one settings profile and prints its numbers."""
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.test.runner import DiscoverRunner
+    from rest_framework.authtoken.models import Token
+
+    from LittlelemonAPI import catalog
+    from LittlelemonAPI.models import Booking, Category, MenuItem
+
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.bulk_create(
+            MenuItem(name=f'Dish {i:05d}', price=Decimal(100 + i % 4000) / 100, category=category)
+            for i in range(args.items))
+        Booking.objects.bulk_create(
+            Booking(customer_name='bench', email='bench@example.com', phone='1234567890',
+                    date=datetime.date(2030, 1, 1) + datetime.timedelta(days=i), time=datetime.time(19),
+                    number_of_guests=2)
+            for i in range(args.items))
+        catalog.invalidate()
+        token = Token.objects.create(user=User.objects.create_user(username='bench', password='bench'))
+        client = Client(SERVER_NAME='localhost', HTTP_AUTHORIZATION=f'Token {token.key}', HTTP_ACCEPT_ENCODING='gzip')
+        results = {path: measure(client, f'{path}?page_size={args.page_size}', args.requests) for path in PATHS}
+        results['worker'] = measure_worker(args.worker_queries)
+    finally:
+        runner.teardown_databases(old_config)
+    print(json.dumps(results), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--worker-queries', type=int, default=5000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    print(f'{args.requests} requests per row, page_size={args.page_size}')
+    print(f'{"settings":34} {"path":15} {"req/s":>6} {"bytes":>14} {"304 req/s":>10} {"retained":>11} {"queries":>8}')
+    for settings in PROFILES:
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings,
+               'DJANGO_SECRET_KEY': 'benchmark', 'DJANGO_ALLOWED_HOSTS': 'localhost'}
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', '--requests', str(args.requests), '--items', str(args.items),
+             '--page-size', str(args.page_size), '--worker-queries', str(args.worker_queries)],
+            env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        results = json.loads(output.strip().splitlines()[-1])
+        worker = results.pop('worker')
+        for path, result in results.items():
+            revalidated = f'{result["revalidated_rps"]:10.0f}' if result['revalidated_rps'] else f'{"-":>10}'
+            print(f'{settings:34} {path:15} {result["rps"]:6.0f} {result["bytes"]:6d} {result["encoding"]:>7} '
+                  f'{revalidated} {result["retained_kb"]:8.0f} KB {result["queries"]:8d}')
+        print(f'{settings:34} {"worker":15} {"":>6} {"":>14} {"":>10} '
+              f'{worker["retained_kb"]:8.0f} KB {worker["queries"]:8d}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cold start of the WSGI and ASGI applications.
+
+Starts a fresh interpreter per run that imports Littlelemon.wsgi or
+Littlelemon.asgi, like a server worker does, and answers one GET. Reports
+the median over the runs of the time from spawning the process to the first
+response, split into interpreter start, loading the application and the
+first request. A discarded first run writes the bytecode cache, as a
+deployment that ships compiled files does. One more run with
+`python -X importtime` lists the packages that take the most import time.
+Exits with status 1 when a median is over
+the budget, so a CI job can catch startup regressions.
+
+Usage:
+    python benchmarks/startup.py [--runs 7] [--budget-ms 1500] [--path /api/menu-items]
+        [--settings Littlelemon.settings --settings Littlelemon.api_settings]
+        [--top 10] [--json results.json]
+"""
+import argparse
+import asyncio
+import collections
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVERS = ('wsgi', 'asgi')
+PROFILES = ('Littlelemon.settings', 'Littlelemon.api_settings')
+
+
+def _wsgi_get(application, path):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost', 'wsgi.input': __import__('io').BytesIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': False, 'wsgi.multiprocess': True,
+    }
+    statuses = []
+    b''.join(application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+    return int(statuses[0].split()[0])
+
+
+async def _asgi_get(application, path):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost')], 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+    }
+    received = []
+    messages = []
+
+    async def receive():
+        if received:
+            # nothing more to read: the client stays connected until cancelled
+            await asyncio.Future()
+        received.append(True)
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+def child(server, path):
+    """Runs in the spawned interpreter: load the application, answer one request, print the timings."""
+    sys.path.insert(0, str(ROOT))
+    started = time.perf_counter()
+    application = importlib.import_module(f'Littlelemon.{server}').application
+    loaded = time.perf_counter()
+    if server == 'wsgi':
+        status = _wsgi_get(application, path)
+    else:
+        status = asyncio.run(_asgi_get(application, path))
+    done = time.perf_counter()
+    print(json.dumps({'status': status, 'load_ms': (loaded - started) * 1000,
+                      'request_ms': (done - loaded) * 1000}), flush=True)
+
+
+def spawn(settings, server, path, importtime=False):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings}
+    # a deployed worker loads cached bytecode rather than compiling the sources
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []),
+               __file__, '--child', server, '--path', path]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, cwd=ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    total_ms = (time.perf_counter() - started) * 1000
+    _, stderr = process.communicate()
+    if process.returncode or not line:
+        raise SystemExit(f'{settings} {server} failed:\n{stderr}')
+    result = json.loads(line)
+    result['total_ms'] = total_ms
+    result['interpreter_ms'] = total_ms - result['load_ms'] - result['request_ms']
+    return result, stderr
+
+
+def import_times(stderr):
+    """Self import time per top-level package, in ms, from `python -X importtime` output."""
+    packages = collections.Counter()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us) / 1000
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget-ms', type=float, default=1500,
+                        help='fail when the median time to first response of any profile is over this')
+    parser.add_argument('--path', default='/api/menu-items')
+    parser.add_argument('--settings', action='append', help=f'settings module to measure (default: {", ".join(PROFILES)})')
+    parser.add_argument('--top', type=int, default=10, help='packages to list by import time')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--child', choices=SERVERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child, args.path)
+
+    results = {}
+    over_budget = []
+    for settings in args.settings or PROFILES:
+        for server in SERVERS:
+            spawn(settings, server, args.path)  # warm the bytecode cache
+            runs = [spawn(settings, server, args.path)[0] for _ in range(args.runs)]
+            median = {key: statistics.median(run[key] for run in runs)
+                      for key in ('total_ms', 'interpreter_ms', 'load_ms', 'request_ms')}
+            median['status'] = runs[0]['status']
+            results[f'{settings} {server}'] = median
+            print(f'{settings:28} {server}  first response {median["total_ms"]:7.1f} ms  '
+                  f'(interpreter {median["interpreter_ms"]:.1f}, load {median["load_ms"]:.1f}, '
+                  f'request {median["request_ms"]:.1f}; HTTP {median["status"]})')
+            if median['total_ms'] > args.budget_ms:
+                over_budget.append(f'{settings} {server}')
+        _, stderr = spawn(settings, 'wsgi', args.path, importtime=True)
+        packages = import_times(stderr)
+        print(f'  import time {sum(packages.values()):.1f} ms, top packages:')
+        for name, ms in packages.most_common(args.top):
+            print(f'    {ms:7.1f} ms  {name}')
+        results[f'{settings} imports'] = dict(packages.most_common(args.top))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if over_budget:
+        print(f'Over the budget of {args.budget_ms:.0f} ms: {", ".join(over_budget)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,6 +16,11 @@ Options:
     --serializers  Run serializer tests only
     --verbose      Run tests with verbose output
     --coverage     Run tests with coverage reporting (requires coverage package)
+    --parallel [N] Run tests in N processes (default: one per CPU core)
+    --bench        Report the time of each test and test class (runs in one process)
+
+Tests run with the fast profile in Littlelemon/test_settings.py (in-memory
+database, MD5 password hashing).
 """
 
 import sys
@@ -44,9 +49,10 @@ def main():
     args = sys.argv[1:]
     verbose = "--verbose" in args or "-v" in args
     coverage = "--coverage" in args
+    bench = "--bench" in args
     
     # Base command
-    base_cmd = ["python3", str(manage_py), "test"]
+    base_cmd = ["python3", str(manage_py), "test", "--settings=Littlelemon.test_settings"]
     
     # Determine which tests to run
     if "--models" in args:
@@ -81,6 +87,15 @@ def main():
     # Add verbosity
     if verbose:
         base_cmd.extend(["--verbosity", "2"])
+
+    # Per-test timings, or parallel processes
+    if bench:
+        base_cmd.append("--testrunner=Littlelemon.test_runner.BenchTestRunner")
+        description += " with timings"
+    elif "--parallel" in args:
+        position = args.index("--parallel")
+        workers = args[position + 1] if position + 1 < len(args) and args[position + 1].isdigit() else "auto"
+        base_cmd.extend(["--parallel", workers])
     
     # Run with coverage if requested
     if coverage: